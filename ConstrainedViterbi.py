@@ -0,0 +1,152 @@
+# Import standard modules
+import sys
+
+# Import custom modules
+from PennTreebankPOSTags import OPEN_CLASS_TAGS
+from HMMModel import UNK_ID
+
+# Define constants
+UNK_TAGS_ALL = 'all' # unseen words may take any POS tag
+UNK_TAGS_OPEN_CLASS = 'open' # unseen words may only take an open-class POS tag
+UNK_TAGS_MODES = [UNK_TAGS_OPEN_CLASS, UNK_TAGS_ALL]
+
+#===========================================================================#
+# ConstrainedViterbi
+# Tag-dictionary constrained Viterbi engine for POSTagger.
+#
+# Only expands the POS tags a word was seen with in training, so a time step
+# costs |tags(w_i-1)| x |tags(w_i)| instead of (tags x tags). Words outside
+# the vocabulary (<UNK>, and <NUM> if no number was seen) may take every POS
+# tag or only the open-class ones. A word seen in training is never given a
+# POS tag it was not seen with, whose P(w_i | t_i) is log(sys.float_info.min)
+# anyway, so apart from <UNK> the tags only differ from the unconstrained
+# engines where every path through the seen tags has a 0 probability bigram.
+# With a suffix trie in the model, unseen words take the same POS tags as
+# <UNK>, with the emissions of their suffix trie node. Sentences are token id
+# sequences, as taken by NumpyViterbi.
+#===========================================================================#
+class ConstrainedViterbi():
+  def __init__(self, model, UNK_TAGS=UNK_TAGS_OPEN_CLASS):
+    if UNK_TAGS not in UNK_TAGS_MODES:
+      raise ValueError('Unknown <UNK> tag set: ' + str(UNK_TAGS) + ', expected one of ' + str(UNK_TAGS_MODES))
+
+    # HMMModel holding the integer-indexed probabilities
+    self.MODEL = model
+
+    # Matrix representing P(t_i | t_i-1) as lists, where rows: t_i-1, cols: t_i
+    self.TRANSITIONS = model.TRANSITIONS.tolist()
+
+    # Ids of every POS tag, the states of the '<S>' node as in the other engines
+    self.ALL_TAG_IDS = list(range(len(model.TAGS)))
+
+    # Ids of the POS tags an unseen word may take
+    if UNK_TAGS == UNK_TAGS_ALL:
+      self.UNK_TAG_IDS = self.ALL_TAG_IDS
+    else:
+      self.UNK_TAG_IDS = [model.TAG_TO_ID[tag] for tag in OPEN_CLASS_TAGS]
+
+    self.TAG_DICTIONARY = self.build_tag_dictionary()
+
+    # Allowed tag ids & emissions of the token ids of unseen words looked up so
+    # far, in the format of the TAG_DICTIONARY entries: { 7412: ([...], [...]), ... }
+    self.UNSEEN_TOKEN_TAGS = {}
+
+  """
+  Builds the tag dictionary from the model's stored emissions, which hold
+  exactly the (word, tag) pairs counted in training.
+
+  return    List indexed by word id, in this format:
+            [([<tag ids>], [<P(w_i | t_i) of each tag id>]), ...], where
+            <UNK> takes the UNK_TAG_IDS
+  """
+  def build_tag_dictionary(self):
+    emission_ptr = self.MODEL.EMISSION_PTR.tolist()
+    emission_tag_ids = self.MODEL.EMISSION_TAG_IDS.tolist()
+    emission_logprobs = self.MODEL.dequantize_logprobs(self.MODEL.EMISSION_LOGPROBS).tolist()
+
+    tag_dictionary = []
+    for word_id in range(len(self.MODEL.WORDS)):
+      start = emission_ptr[word_id]
+      end = emission_ptr[word_id + 1]
+      tag_dictionary.append((emission_tag_ids[start:end], emission_logprobs[start:end]))
+
+    unk_emissions = self.MODEL.UNK_EMISSIONS.tolist()
+    tag_dictionary[UNK_ID] = (self.UNK_TAG_IDS, [unk_emissions[tag_id] for tag_id in self.UNK_TAG_IDS])
+    return tag_dictionary
+
+  """
+  Looks up the allowed tag ids & emissions of a token id: the tag dictionary
+  entry of a seen word, else, for the suffix trie nodes & reserved ids of
+  unseen words, the UNK_TAG_IDS with the emissions of the token id.
+
+  token_id    Token id, as in HMMModel.TOKEN_EMISSION_COLUMNS
+
+  return      2-tuple in the format of the TAG_DICTIONARY entries
+  """
+  def get_token_tags(self, token_id):
+    if token_id < len(self.TAG_DICTIONARY):
+      return self.TAG_DICTIONARY[token_id]
+
+    token_tags = self.UNSEEN_TOKEN_TAGS.get(token_id)
+    if token_tags is None:
+      emissions = self.MODEL.get_token_emission_column(token_id).tolist()
+      token_tags = (self.UNK_TAG_IDS, [emissions[tag_id] for tag_id in self.UNK_TAG_IDS])
+      self.UNSEEN_TOKEN_TAGS[token_id] = token_tags
+    return token_tags
+
+  """
+  Computes the best POS tag path of a sentence, only expanding the allowed
+  POS tags of each token. Ties are broken towards the lowest tag index, like
+  the strict '>' comparison in POSTagger.tag.
+
+  token_ids    Token ids of the sentence, e.g. an array('i'), starting with '<S>'
+
+  return    Best POS tag index path. As in POSTagger.get_best_viterbi_path, it
+            covers every token but the last one, which is always tagged
+            END_MARKER.
+  """
+  def get_best_path(self, token_ids):
+    LEN_TOKENS = len(token_ids)
+
+    # Probability at '<S>' is 1 for every tag (log scale equivalent is 0)
+    prev_tag_ids = self.ALL_TAG_IDS
+    memo = [0] * len(prev_tag_ids)
+
+    # Allowed tag ids of each token, and back pointers into the previous token's tag ids
+    tag_ids_per_token = [prev_tag_ids]
+    back_ptrs = [None]
+
+    for i in range(1, LEN_TOKENS):
+      tag_ids, emissions = self.get_token_tags(token_ids[i])
+      next_memo = []
+      next_back_ptrs = []
+
+      for j in range(len(tag_ids)):
+        tag_id = tag_ids[j]
+        emission = emissions[j]
+        curr_max = -sys.float_info.max
+        back_ptr = -1
+
+        for k in range(len(prev_tag_ids)):
+          transition_prob = memo[k] + self.TRANSITIONS[prev_tag_ids[k]][tag_id] + emission
+          if transition_prob > curr_max:
+            curr_max = transition_prob
+            back_ptr = k
+
+        next_memo.append(curr_max)
+        # 1st back pointer always points to the '<S>' node
+        next_back_ptrs.append(back_ptr if i > 1 else 0)
+
+      memo = next_memo
+      prev_tag_ids = tag_ids
+      tag_ids_per_token.append(tag_ids)
+      back_ptrs.append(next_back_ptrs)
+
+    # Traverse the sentence backwards from the best tag of its last token
+    best_k = max(range(len(memo)), key=memo.__getitem__)
+    path = []
+    for i in range(LEN_TOKENS - 1, 0, -1):
+      best_k = back_ptrs[i][best_k]
+      path.append(tag_ids_per_token[i - 1][best_k])
+
+    return list(reversed(path))
@@ -0,0 +1,176 @@
+# Import standard modules
+import os
+import random
+import sqlite3
+
+# Import third-party modules
+import numpy as np
+
+# Import custom modules
+from PennTreebankPOSTags import POS_TAGS
+
+# Define constants
+DEFAULT_PATH_TO_ERROR_INDEX = 'cross-validation-errors' # sqlite file written by cross_validator.py
+DEFAULT_MAX_CONTEXTS = 20 # number of error contexts sampled per (gold, predicted) tag pair
+CONTEXT_WIDTH = 4 # number of words kept on each side of a mistagged word
+MAX_PENDING_CELLS = 1 << 16 # number of tag pairs buffered before they are counted in the confusion matrices
+
+#===========================================================================#
+# ErrorIndex
+# CONFUSION MATRICES & SAMPLED ERROR CONTEXTS OF A CROSS VALIDATION.
+#
+# Counts every (gold, predicted) POS tag pair of each fold in a
+# (folds x tags x tags) integer array, as the folds are tagged, so accuracies
+# are read off its diagonal. Tag pairs are buffered as flat cell indexes and
+# counted by a single np.bincount every MAX_PENDING_CELLS pairs.
+#
+# Each mistagged word is offered to a reservoir sample of at most
+# MAX_CONTEXTS contexts of its (gold, predicted) pair, so any number of
+# errors takes bounded memory. Indexes of single folds, e.g.
+# built in worker processes, merge into the index of the whole validation
+# with the same samples as if it had seen their errors itself.
+#
+# Written to an sqlite file indexed by tag, which
+# cross_valid_investigate_errors.py queries.
+#===========================================================================#
+class ErrorIndex():
+  def __init__(self, FOLDS, MAX_CONTEXTS=DEFAULT_MAX_CONTEXTS, SEED=0):
+    if MAX_CONTEXTS < 0:
+      raise ValueError('MAX_CONTEXTS must be at least 0')
+
+    # CONFUSIONS[fold][gold][predicted] = number of words of gold tag tagged as
+    # predicted, with tags indexed as in POS_TAGS
+    self.FOLDS = FOLDS
+    self.TAG_TO_ID = { POS_TAGS[i]: i for i in range(len(POS_TAGS)) }
+    self.CONFUSIONS = np.zeros((FOLDS, len(POS_TAGS), len(POS_TAGS)), dtype=np.int64)
+
+    # Cells of CONFUSIONS, flattened, of the tag pairs not counted yet
+    self.PENDING_CELLS = []
+
+    # Sampled contexts of each tag pair, with the number of errors they were
+    # sampled from: { (gold, predicted): [errors, [(fold, word, context), ...]], ... }
+    self.MAX_CONTEXTS = MAX_CONTEXTS
+    self.CONTEXTS = {}
+    self.random = random.Random(SEED)
+
+  #=====================================================#
+  # RECORDING
+  #=====================================================#
+  """
+  Counts the tags of a tagged sentence, and samples the context of each of
+  its mistagged words.
+
+  fold                 Index of the fold of the sentence
+  words                List of the words of the sentence, ['<S>', 'The', ..., '<E>']
+  gold_postags         List of the true POS tags of the words
+  predicted_postags    List of the predicted POS tags of the words
+  """
+  def add_sentence(self, fold, words, gold_postags, predicted_postags):
+    NUM_TAGS = len(POS_TAGS)
+    fold_cell = fold * NUM_TAGS * NUM_TAGS
+    self.PENDING_CELLS += [fold_cell + self.TAG_TO_ID[gold] * NUM_TAGS + self.TAG_TO_ID[predicted]
+                           for gold, predicted in zip(gold_postags, predicted_postags)]
+    if len(self.PENDING_CELLS) >= MAX_PENDING_CELLS:
+      self.flush()
+
+    if gold_postags == predicted_postags:
+      return
+    for i in range(len(gold_postags)):
+      if gold_postags[i] == predicted_postags[i]:
+        continue
+      entry = self.CONTEXTS.setdefault((gold_postags[i], predicted_postags[i]), [0, []])
+      entry[0] += 1
+
+      # Reservoir sampling: the n-th error replaces a sampled one with probability MAX_CONTEXTS / n
+      if len(entry[1]) < self.MAX_CONTEXTS:
+        entry[1].append(self.get_context(fold, words, i))
+      else:
+        slot = self.random.randrange(entry[0])
+        if slot < self.MAX_CONTEXTS:
+          entry[1][slot] = self.get_context(fold, words, i)
+
+  # Counts the buffered tag pairs in the confusion matrices
+  def flush(self):
+    if len(self.PENDING_CELLS) > 0:
+      self.CONFUSIONS += np.bincount(self.PENDING_CELLS, minlength=self.CONFUSIONS.size).reshape(self.CONFUSIONS.shape)
+      self.PENDING_CELLS = []
+
+  # (fold, word, context) of the i-th word of a sentence, with the word in brackets
+  def get_context(self, fold, words, i):
+    context = words[max(i - CONTEXT_WIDTH, 0):i] + ['[' + words[i] + ']'] + words[i + 1:i + 1 + CONTEXT_WIDTH]
+    return (fold, words[i], ' '.join(context))
+
+  """
+  Adds the counts & samples of another index of the same folds, e.g. one fold
+  validated in a worker process. The merged sample of a tag pair holds each of
+  the errors of both indexes with the same probability.
+
+  other     ErrorIndex
+
+  return    This ErrorIndex
+  """
+  def merge(self, other):
+    self.flush()
+    other.flush()
+    self.CONFUSIONS += other.CONFUSIONS
+    for pair, (other_errors, other_contexts) in other.CONTEXTS.items():
+      entry = self.CONTEXTS.setdefault(pair, [0, []])
+      errors, contexts = entry
+
+      # Number of the MAX_CONTEXTS merged samples drawn from this index, as
+      # drawn without replacement from the errors of both
+      from_self = 0
+      left_self, left_other = errors, other_errors
+      for _ in range(min(self.MAX_CONTEXTS, errors + other_errors)):
+        if self.random.randrange(left_self + left_other) < left_self:
+          from_self += 1
+          left_self -= 1
+        else:
+          left_other -= 1
+
+      NUM_FROM_OTHER = min(self.MAX_CONTEXTS, errors + other_errors) - from_self
+      entry[0] = errors + other_errors
+      entry[1] = self.random.sample(contexts, from_self) + self.random.sample(other_contexts, NUM_FROM_OTHER)
+    return self
+
+  #=====================================================#
+  # REPORT
+  #=====================================================#
+  # Fraction of the words of a fold tagged with their true POS tag
+  def get_accuracy(self, fold):
+    self.flush()
+    return float(np.trace(self.CONFUSIONS[fold])) / float(self.CONFUSIONS[fold].sum())
+
+  """
+  Writes the confusion matrices & contexts to an sqlite file, replacing it.
+  Only the non-zero cells of the confusion matrices are stored, and both
+  tables are indexed by gold & by predicted tag.
+
+  PATH_TO_ERROR_INDEX    Path of the written file
+  """
+  def save(self, PATH_TO_ERROR_INDEX):
+    self.flush()
+    if os.path.exists(PATH_TO_ERROR_INDEX):
+      os.remove(PATH_TO_ERROR_INDEX)
+
+    connection = sqlite3.connect(PATH_TO_ERROR_INDEX)
+    with connection:
+      connection.execute('CREATE TABLE meta (name TEXT PRIMARY KEY, value INTEGER)')
+      connection.execute('CREATE TABLE confusions (fold INTEGER, gold TEXT, predicted TEXT, count INTEGER)')
+      connection.execute('CREATE TABLE contexts (gold TEXT, predicted TEXT, fold INTEGER, word TEXT, context TEXT)')
+      connection.executemany('INSERT INTO meta VALUES (?, ?)',
+                             [('folds', self.FOLDS), ('max_contexts', self.MAX_CONTEXTS)])
+
+      folds, gold_ids, predicted_ids = np.nonzero(self.CONFUSIONS)
+      connection.executemany('INSERT INTO confusions VALUES (?, ?, ?, ?)',
+                             [(fold, POS_TAGS[gold], POS_TAGS[predicted], int(self.CONFUSIONS[fold, gold, predicted]))
+                              for fold, gold, predicted in zip(folds.tolist(), gold_ids.tolist(), predicted_ids.tolist())])
+      connection.executemany('INSERT INTO contexts VALUES (?, ?, ?, ?, ?)',
+                             [pair + context for pair, (_, contexts) in sorted(self.CONTEXTS.items())
+                              for context in sorted(contexts)])
+
+      connection.execute('CREATE INDEX confusions_gold ON confusions (gold)')
+      connection.execute('CREATE INDEX confusions_predicted ON confusions (predicted)')
+      connection.execute('CREATE INDEX contexts_pair ON contexts (gold, predicted)')
+      connection.execute('CREATE INDEX contexts_predicted ON contexts (predicted)')
+    connection.close()
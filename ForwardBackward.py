@@ -0,0 +1,158 @@
+# Import third-party modules
+import numpy as np
+
+# Define constants
+MIN_LOG_FACTOR = -300.0 # smallest log of a factor of the factored log-sum-exp
+MAX_POSTERIOR_SUM_ERROR = 1e-9 # largest error of a sum of posteriors accepted from the factored log-sum-exp
+
+#===========================================================================#
+# ForwardBackward
+# Posterior probabilities P(t_i | w_1 ... w_n) of every tag of every token,
+# over the same log probabilities as the Viterbi engines of POSTagger.
+#
+# The forward & backward recurrences run on a (batch x tags) array per time
+# step. Each log-sum-exp over the previous tags is factored into exp() of the
+# scores shifted by their maximum, one matrix product with the precomputed
+# exp() of the transitions shifted by their maximum per tag, and log(), so a
+# time step costs a fraction of a Viterbi step. Factors are raised to at least
+# exp(MIN_LOG_FACTOR), so that products of LOG_PROB_FLOOR probabilities never
+# fall into slow subnormal floats and no sum underflows to 0.
+#
+# That is exact unless every path of a sentence goes through LOG_PROB_FLOOR
+# probabilities, where the raised factors weigh in and the forward & backward
+# recurrences stop agreeing: the posteriors of some token then no longer sum
+# to 1. Those sentences are computed again with an exact log-sum-exp over a
+# (batch x tags x tags) array per time step.
+#===========================================================================#
+class ForwardBackward():
+  def __init__(self, model):
+    # HMMModel holding the integer-indexed probabilities
+    self.MODEL = model
+
+    # Matrix representing P(t_i | t_i-1), where rows: t_i-1, cols: t_i, and
+    # the same matrix with rows: t_i, cols: t_i-1
+    self.TRANSITIONS = model.TRANSITIONS
+    self.TRANSITIONS_T = np.ascontiguousarray(model.TRANSITIONS.T)
+
+    # exp() of P(t_i | t_i-1), where rows: t_i-1, cols: t_i, shifted so that
+    # the largest entry of each column is 1, for the forward recurrence
+    self.MAX_TRANSITIONS_TO = model.TRANSITIONS.max(axis=0)
+    self.EXP_TRANSITIONS_TO = np.exp(np.maximum(model.TRANSITIONS - self.MAX_TRANSITIONS_TO[None, :], MIN_LOG_FACTOR))
+
+    # Same with the largest entry of each row shifted to 1, for the backward
+    # recurrence, and stored with rows: t_i, cols: t_i-1
+    self.MAX_TRANSITIONS_FROM = model.TRANSITIONS.max(axis=1)
+    exp_transitions_from = np.exp(np.maximum(model.TRANSITIONS - self.MAX_TRANSITIONS_FROM[:, None], MIN_LOG_FACTOR))
+    self.EXP_TRANSITIONS_FROM_T = np.ascontiguousarray(exp_transitions_from.T)
+
+    # log P(t_1) summed over every tag of '<S>', where the Viterbi engines take the best one
+    self.LOG_SUM_TRANSITIONS_TO = self.get_log_sum_exp(self.TRANSITIONS_T)
+
+  """
+  Computes the posterior probabilities of the tags of a batch of sentences.
+  As in the Viterbi engines, '<S>' may take any tag with probability 1.
+
+  list_of_token_ids    List of token id sequences, as produced by
+                       Tokenizer.tokenize_test_document_to_ids, each starting
+                       with '<S>'. Sentences of similar lengths waste the
+                       least work on padding.
+
+  return               2-tuple of (list of (tokens x tags) arrays of posterior
+                       probabilities, each row summing to 1, list of the log
+                       probabilities of the sentences), one of each per sentence
+  """
+  def get_posteriors_batch(self, list_of_token_ids):
+    lengths = np.array([len(token_ids) for token_ids in list_of_token_ids])
+    emission_columns = self.MODEL.get_padded_emission_columns(list_of_token_ids)
+    posteriors, log_totals = self.get_padded_posteriors(emission_columns, lengths, False)
+
+    # Sentences with a sum of posteriors off 1 are computed again exactly
+    inexact = np.nonzero(np.abs(posteriors.sum(axis=2) - 1.0).max(axis=0) > MAX_POSTERIOR_SUM_ERROR)[0]
+    if len(inexact) > 0:
+      posteriors[:, inexact], log_totals[inexact] = self.get_padded_posteriors(emission_columns[inexact], lengths[inexact], True)
+
+    return ([posteriors[:lengths[b], b, :] for b in range(len(list_of_token_ids))], log_totals.tolist())
+
+  # Posterior probabilities of the tags of a single sentence, with its log probability
+  def get_posteriors(self, token_ids):
+    posteriors_list, log_totals = self.get_posteriors_batch([token_ids])
+    return (posteriors_list[0], log_totals[0])
+
+  """
+  Runs the forward & backward recurrences over a batch of padded sentences.
+  Sentences shorter than the longest one in the batch keep their last forward
+  scores once they have ended, so their padding tokens get the posteriors of
+  their last token.
+
+  emission_columns    (sentences x tokens x tags) array of the emissions of
+                      the tokens, as returned by HMMModel.get_padded_emission_columns
+  lengths             Array of the numbers of tokens of the sentences
+  EXACT               Whether every log-sum-exp is computed term by term
+                      instead of factored
+
+  return              2-tuple of ((tokens x sentences x tags) array of posterior
+                      probabilities, array of the log probabilities of the sentences)
+  """
+  def get_padded_posteriors(self, emission_columns, lengths, EXACT):
+    LEN_BATCH, MAX_LEN_TOKENS, LEN_POSTAG = emission_columns.shape
+
+    # alphas[i][b][j] = log P(w_1 ... w_i, t_i = j) for sentence b
+    alphas = np.zeros((MAX_LEN_TOKENS, LEN_BATCH, LEN_POSTAG), dtype=np.float64)
+    for i in range(1, MAX_LEN_TOKENS):
+      if EXACT:
+        alpha = self.get_log_sum_exp(alphas[i - 1][:, None, :] + self.TRANSITIONS_T[None, :, :])
+      else:
+        alpha = self.get_log_sum_exp_forward(alphas[i - 1])
+
+      # Sentences which already ended keep their scores
+      alphas[i] = np.where((i < lengths)[:, None], alpha + emission_columns[:, i, :], alphas[i - 1])
+
+    # betas[i][b][k] = log P(w_i+1 ... w_n | t_i = k), 0 from the last token
+    # of each sentence onwards
+    betas = np.zeros((MAX_LEN_TOKENS, LEN_BATCH, LEN_POSTAG), dtype=np.float64)
+    for i in range(MAX_LEN_TOKENS - 2, -1, -1):
+      scores = betas[i + 1] + emission_columns[:, i + 1, :]
+      if EXACT:
+        beta = self.get_log_sum_exp(scores[:, None, :] + self.TRANSITIONS[None, :, :])
+      else:
+        beta = self.get_log_sum_exp_backward(scores)
+      betas[i] = np.where((i < lengths - 1)[:, None], beta, 0.0)
+
+    # The last forward scores of every sentence sum to its total probability
+    log_totals = self.get_log_sum_exp(alphas[-1])
+    return (np.exp(alphas + betas - log_totals[None, :, None]), log_totals)
+
+  """
+  Converts the scores of paths of a sentence, as returned by
+  NumpyViterbi.get_k_best_paths, into log probabilities of the paths given
+  the sentence, summing over the tags of '<S>' instead of taking the best one.
+
+  paths_with_scores    List of 2-tuples of (POS tag index path, log score)
+  log_total            Log probability of the sentence, as returned by get_posteriors
+
+  return               List of log probabilities, one per path
+  """
+  def get_path_log_probs(self, paths_with_scores, log_total):
+    log_probs = []
+    for path, score in paths_with_scores:
+      if len(path) > 1:
+        score += self.LOG_SUM_TRANSITIONS_TO[path[1]] - self.MAX_TRANSITIONS_TO[path[1]]
+      log_probs.append(score - log_total)
+    return log_probs
+
+  # log(sum(exp(alpha[b][k] + P(t_j | t_k)))) over k, for every b & j
+  def get_log_sum_exp_forward(self, alpha):
+    max_alpha = alpha.max(axis=1)
+    sums = np.exp(np.maximum(alpha - max_alpha[:, None], MIN_LOG_FACTOR)) @ self.EXP_TRANSITIONS_TO
+    return np.log(sums) + max_alpha[:, None] + self.MAX_TRANSITIONS_TO[None, :]
+
+  # log(sum(exp(P(t_j | t_k) + scores[b][j]))) over j, for every b & k
+  def get_log_sum_exp_backward(self, scores):
+    max_scores = scores.max(axis=1)
+    sums = np.exp(np.maximum(scores - max_scores[:, None], MIN_LOG_FACTOR)) @ self.EXP_TRANSITIONS_FROM_T
+    return np.log(sums) + max_scores[:, None] + self.MAX_TRANSITIONS_FROM[None, :]
+
+  # log(sum(exp(scores[..., j]))) over the last axis
+  def get_log_sum_exp(self, scores):
+    max_scores = scores.max(axis=-1)
+    return np.log(np.exp(scores - max_scores[..., None]).sum(axis=-1)) + max_scores
@@ -0,0 +1,259 @@
+# Import standard modules
+import pickle
+
+# Import custom modules
+from PennTreebankPOSTags import POS_TAGS, START_MARKER, END_MARKER
+
+# Define constants
+COUNTS_FILE_VERSION = 2 # version of the count files written by HMMCounts.save
+
+#===========================================================================#
+# HMMCounts
+# RAW COUNTS OF A LABELLED CORPUS.
+#
+# Holds the word/tag, tag, tag bigram and tag trigram counts HMMProbGenerator
+# turns into probabilities. Counts support addition & subtraction, so the counts of a
+# corpus split can be derived from the counts of its parts without counting
+# the corpus again, and can be saved to count files (shards) to be merged
+# into a model later.
+#===========================================================================#
+class HMMCounts():
+  def __init__(self):
+    # Word & POS tag co-occurrence counts, in this format: { 'NN': { 'dog': 12, ... }, ... }
+    self.WORD_POSTAG_COUNTS = {}
+
+    # POS tag counts, in this format: { 'NN': 1123, 'VBN': 2323, ... }
+    self.POSTAG_COUNTS = { postag: 0 for postag in POS_TAGS }
+
+    # Counts of tags at position (i) following a tag at position (i - 1), in
+    # this format: { 'DT': { 'NN': 1542, ... }, ... }
+    self.POSTAG_BIGRAM_COUNTS = {}
+
+    # Counts of tags at position (i) following the tags at positions (i - 2) &
+    # (i - 1), in this format: { ('DT', 'JJ'): { 'NN': 412, ... }, ... }
+    self.POSTAG_TRIGRAM_COUNTS = {}
+
+    # 1st & last 2 tags of the counted sequence, which form trigrams with the
+    # tags of a sequence appended to it, e.g. ['<S>', 'DT'] & ['.', '<E>']
+    self.FIRST_POSTAGS = []
+    self.LAST_POSTAGS = []
+
+  #=====================================================#
+  # COUNTING
+  #=====================================================#
+  """
+  Counts a sequence of (word, tag) pairs, including the bigrams & trigrams of
+  tags following each other within the sequence.
+
+  word_postag_pairs    [['its', 'PRP$'], ['to', 'TO'] ...]
+
+  return               self, for chaining
+  """
+  def add_word_postag_pairs(self, word_postag_pairs):
+    # Same updates as add_word_postag_pair, add_postag_bigram & add_postag_trigram,
+    # inlined since this loop runs once per token of the training data
+    word_postag_counts = self.WORD_POSTAG_COUNTS
+    postag_counts = self.POSTAG_COUNTS
+    postag_bigram_counts = self.POSTAG_BIGRAM_COUNTS
+    postag_trigram_counts = self.POSTAG_TRIGRAM_COUNTS
+
+    postag_i_minus_2 = None
+    postag_i_minus_1 = None
+    first_postags = []
+    for word_postag_pair in word_postag_pairs:
+      word = word_postag_pair[0]
+      postag = word_postag_pair[1]
+      word_counts = word_postag_counts.get(postag)
+      if word_counts is None:
+        word_counts = word_postag_counts[postag] = {}
+      word_counts[word] = word_counts.get(word, 0) + 1
+      postag_counts[postag] = postag_counts.get(postag, 0) + 1
+
+      if postag_i_minus_1 is not None:
+        following_counts = postag_bigram_counts.get(postag_i_minus_1)
+        if following_counts is None:
+          following_counts = postag_bigram_counts[postag_i_minus_1] = {}
+        following_counts[postag] = following_counts.get(postag, 0) + 1
+
+        if postag_i_minus_2 is not None:
+          following_counts = postag_trigram_counts.get((postag_i_minus_2, postag_i_minus_1))
+          if following_counts is None:
+            following_counts = postag_trigram_counts[(postag_i_minus_2, postag_i_minus_1)] = {}
+          following_counts[postag] = following_counts.get(postag, 0) + 1
+
+      if postag_i_minus_2 is None:
+        first_postags.append(postag)
+      postag_i_minus_2 = postag_i_minus_1
+      postag_i_minus_1 = postag
+
+    if len(self.FIRST_POSTAGS) == 0:
+      self.FIRST_POSTAGS = first_postags
+    if postag_i_minus_1 is not None:
+      self.LAST_POSTAGS = [postag_i_minus_1] if postag_i_minus_2 is None else [postag_i_minus_2, postag_i_minus_1]
+    return self
+
+  # Counts n occurrences of a word tagged with postag
+  def add_word_postag_pair(self, word, postag, n=1):
+    word_counts = self.WORD_POSTAG_COUNTS.setdefault(postag, {})
+    word_counts[word] = word_counts.get(word, 0) + n
+    self.POSTAG_COUNTS[postag] = self.POSTAG_COUNTS.get(postag, 0) + n
+
+  # Counts n occurrences of postag following postag_i_minus_1
+  def add_postag_bigram(self, postag_i_minus_1, postag, n=1):
+    postag_counts = self.POSTAG_BIGRAM_COUNTS.setdefault(postag_i_minus_1, {})
+    postag_counts[postag] = postag_counts.get(postag, 0) + n
+
+  # Counts n occurrences of postag following postag_i_minus_2 & postag_i_minus_1
+  def add_postag_trigram(self, postag_i_minus_2, postag_i_minus_1, postag, n=1):
+    postag_counts = self.POSTAG_TRIGRAM_COUNTS.setdefault((postag_i_minus_2, postag_i_minus_1), {})
+    postag_counts[postag] = postag_counts.get(postag, 0) + n
+
+  #=====================================================#
+  # COUNT ALGEBRA
+  #=====================================================#
+  # Returns the sum of two count objects
+  def __add__(self, other):
+    return self.copy().merge(other, 1)
+
+  # Returns the counts of self without the counts of other, where other must
+  # have been counted on a part of the corpus self was counted on
+  def __sub__(self, other):
+    return self.copy().merge(other, -1)
+
+  """
+  Adds sign * the counts of other to these counts in place. Word/tag pairs,
+  tag bigrams and tag trigrams whose count drops to 0 are removed, so a
+  subtracted word leaves the vocabulary. The 1st & last tags of these counts
+  are kept.
+
+  other     HMMCounts to add
+  sign      1 to add, -1 to subtract
+
+  return    self, for chaining
+  """
+  def merge(self, other, sign=1):
+    for postag, other_word_counts in other.WORD_POSTAG_COUNTS.items():
+      word_counts = self.WORD_POSTAG_COUNTS.setdefault(postag, {})
+      self.merge_counts(word_counts, other_word_counts, sign)
+      if len(word_counts) == 0:
+        del self.WORD_POSTAG_COUNTS[postag]
+
+    for postag, count in other.POSTAG_COUNTS.items():
+      self.POSTAG_COUNTS[postag] = self.POSTAG_COUNTS.get(postag, 0) + sign * count
+
+    for postag_i_minus_1, other_postag_counts in other.POSTAG_BIGRAM_COUNTS.items():
+      postag_counts = self.POSTAG_BIGRAM_COUNTS.setdefault(postag_i_minus_1, {})
+      self.merge_counts(postag_counts, other_postag_counts, sign)
+      if len(postag_counts) == 0:
+        del self.POSTAG_BIGRAM_COUNTS[postag_i_minus_1]
+
+    for postag_context, other_postag_counts in other.POSTAG_TRIGRAM_COUNTS.items():
+      postag_counts = self.POSTAG_TRIGRAM_COUNTS.setdefault(postag_context, {})
+      self.merge_counts(postag_counts, other_postag_counts, sign)
+      if len(postag_counts) == 0:
+        del self.POSTAG_TRIGRAM_COUNTS[postag_context]
+    return self
+
+  # Adds sign * other_counts to counts in place, removing keys whose count drops to 0
+  def merge_counts(self, counts, other_counts, sign):
+    for key, count in other_counts.items():
+      new_count = counts.get(key, 0) + sign * count
+      if new_count != 0:
+        counts[key] = new_count
+      elif key in counts:
+        del counts[key]
+
+  """
+  Adds the counts of a corpus which follows this one in the training data,
+  e.g. a count shard of the next training file. The last <E> of this corpus
+  and the 1st <S> of the next one form a bigram, and the tags around them
+  form trigrams, just as when training on the concatenated files.
+
+  other     HMMCounts of the following corpus, counted from <S> to <E>
+
+  return    self, for chaining
+  """
+  def append(self, other):
+    is_linked = self.POSTAG_COUNTS.get(END_MARKER, 0) > 0 and other.POSTAG_COUNTS.get(START_MARKER, 0) > 0
+    last_postags = self.LAST_POSTAGS
+    self.merge(other, 1)
+    if is_linked:
+      self.add_postag_bigram(END_MARKER, START_MARKER)
+      # Trigrams across the link, e.g. ('.', '<E>', '<S>') & ('<E>', '<S>', 'DT')
+      linked_postags = last_postags + other.FIRST_POSTAGS
+      for i in range(2, len(linked_postags)):
+        self.add_postag_trigram(linked_postags[i - 2], linked_postags[i - 1], linked_postags[i])
+
+    self.FIRST_POSTAGS = (self.FIRST_POSTAGS + other.FIRST_POSTAGS)[:2]
+    self.LAST_POSTAGS = (last_postags + other.LAST_POSTAGS)[-2:]
+    return self
+
+  # Returns a copy of these counts which can be modified independently
+  def copy(self):
+    counts = HMMCounts()
+    counts.WORD_POSTAG_COUNTS = { postag: dict(word_counts) for postag, word_counts in self.WORD_POSTAG_COUNTS.items() }
+    counts.POSTAG_COUNTS = dict(self.POSTAG_COUNTS)
+    counts.POSTAG_BIGRAM_COUNTS = { postag: dict(postag_counts) for postag, postag_counts in self.POSTAG_BIGRAM_COUNTS.items() }
+    counts.POSTAG_TRIGRAM_COUNTS = { postag_context: dict(postag_counts)
+                                     for postag_context, postag_counts in self.POSTAG_TRIGRAM_COUNTS.items() }
+    counts.FIRST_POSTAGS = list(self.FIRST_POSTAGS)
+    counts.LAST_POSTAGS = list(self.LAST_POSTAGS)
+    return counts
+
+  # Two count objects are equal if they hold the same counts
+  def __eq__(self, other):
+    return isinstance(other, HMMCounts) and \
+           self.WORD_POSTAG_COUNTS == other.WORD_POSTAG_COUNTS and \
+           self.POSTAG_COUNTS == other.POSTAG_COUNTS and \
+           self.POSTAG_BIGRAM_COUNTS == other.POSTAG_BIGRAM_COUNTS and \
+           self.POSTAG_TRIGRAM_COUNTS == other.POSTAG_TRIGRAM_COUNTS and \
+           self.FIRST_POSTAGS == other.FIRST_POSTAGS and \
+           self.LAST_POSTAGS == other.LAST_POSTAGS
+
+  #=====================================================#
+  # VOCABULARIES
+  #=====================================================#
+  """
+  Returns the counted words vocabulary
+
+  return    Vocabulary in this Dictionary format: { 'the': 41107, 'gracious': 1, ... }
+  """
+  def get_word_vocabulary_with_counts(self):
+    result = {}
+    for word_counts in self.WORD_POSTAG_COUNTS.values():
+      for word, count in word_counts.items():
+        result[word] = result.get(word, 0) + count
+    return result
+
+  #=====================================================#
+  # COUNT FILES
+  #=====================================================#
+  # Writes these counts to a count file
+  def save(self, PATH_TO_COUNTS):
+    with open(PATH_TO_COUNTS, 'wb') as counts_file:
+      pickle.dump({
+        'VERSION': COUNTS_FILE_VERSION,
+        'WORD_POSTAG_COUNTS': self.WORD_POSTAG_COUNTS,
+        'POSTAG_COUNTS': self.POSTAG_COUNTS,
+        'POSTAG_BIGRAM_COUNTS': self.POSTAG_BIGRAM_COUNTS,
+        'POSTAG_TRIGRAM_COUNTS': self.POSTAG_TRIGRAM_COUNTS,
+        'FIRST_POSTAGS': self.FIRST_POSTAGS,
+        'LAST_POSTAGS': self.LAST_POSTAGS,
+      }, counts_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+  # Reads counts from a count file written by save
+  @classmethod
+  def load(cls, PATH_TO_COUNTS):
+    with open(PATH_TO_COUNTS, 'rb') as counts_file:
+      saved_counts = pickle.load(counts_file)
+    if saved_counts.get('VERSION') != COUNTS_FILE_VERSION:
+      raise ValueError('Unsupported count file version ' + str(saved_counts.get('VERSION')) + ': ' + PATH_TO_COUNTS)
+
+    counts = cls()
+    counts.WORD_POSTAG_COUNTS = saved_counts['WORD_POSTAG_COUNTS']
+    counts.POSTAG_COUNTS = saved_counts['POSTAG_COUNTS']
+    counts.POSTAG_BIGRAM_COUNTS = saved_counts['POSTAG_BIGRAM_COUNTS']
+    counts.POSTAG_TRIGRAM_COUNTS = saved_counts['POSTAG_TRIGRAM_COUNTS']
+    counts.FIRST_POSTAGS = saved_counts['FIRST_POSTAGS']
+    counts.LAST_POSTAGS = saved_counts['LAST_POSTAGS']
+    return counts
@@ -0,0 +1,523 @@
+# Import standard modules
+import re
+import sys
+import hashlib
+import bisect
+from math import log
+from array import array
+
+# Import third-party modules
+import numpy as np
+
+# Import custom modules
+from PennTreebankPOSTags import POS_TAGS, START_MARKER, END_MARKER
+from Tokenizer import NUM_SYMBOL, NUM_SYMBOL_MATCHER
+
+# Define constants
+UNK = '<UNK>' # symbol representing out-of-vocabulary words
+UNK_ID = 0 # <UNK> is always the 1st word of the vocabulary
+LOG_PROB_FLOOR = log(sys.float_info.min) # log probability of every unseen (word, tag) pair
+
+# Precisions of the stored log probabilities, with the dtype of each
+PRECISION_FLOAT64 = 'float64'
+PRECISION_FLOAT32 = 'float32'
+PRECISION_INT16 = 'int16' # scaled by LOGPROB_SCALE
+PRECISIONS = [PRECISION_FLOAT64, PRECISION_FLOAT32, PRECISION_INT16]
+LOGPROB_DTYPES = { PRECISION_FLOAT64: np.float64, PRECISION_FLOAT32: np.float32, PRECISION_INT16: np.int16 }
+INT16_FLOOR = -32768 # int16 log probability standing for LOG_PROB_FLOOR
+INT16_MAX_MAGNITUDE = 32767 # magnitude of the int16 of the lowest log probability above LOG_PROB_FLOOR
+
+# Word shapes, each with its own suffix trie root: a word's shape is the sum
+# of the flags of its features
+WORD_SHAPE_CAPITALIZED = 1 # 1st character is uppercase
+WORD_SHAPE_HYPHENATED = 2 # contains a '-'
+WORD_SHAPE_HAS_DIGIT = 4 # contains a digit
+NUM_WORD_SHAPES = 8
+DIGIT_SEARCHER = re.compile(r'\d').search
+
+# Computes the word shape of a word, the suffix trie root its suffixes are walked from
+def get_word_shape(word):
+  shape = 0
+  if word[:1].isupper():
+    shape += WORD_SHAPE_CAPITALIZED
+  if '-' in word:
+    shape += WORD_SHAPE_HYPHENATED
+  if DIGIT_SEARCHER(word):
+    shape += WORD_SHAPE_HAS_DIGIT
+  return shape
+
+#===========================================================================#
+# HMMModel
+# Compact, integer-indexed representation of the model.
+#
+# Tags and words are mapped to integer ids and P(t_i | t_i-1) is a dense
+# (tags x tags) float array. P(w_i | t_i) is sparse: only the (word, tag)
+# pairs seen in training are stored, in word-major order, together with one
+# <UNK> value per tag. Every other pair has the implicit LOG_PROB_FLOOR.
+# The Viterbi engines expand it at load time into a dense word-major array,
+# where the emission column of a token is a single row lookup. Models of the
+# second-order HMM also hold P(t_i | t_i-2, t_i-1) as a dense
+# (tags x tags x tags) array.
+#
+# Words outside the vocabulary either all share the <UNK> emissions, or, if
+# the model holds a suffix trie, take the emissions of their longest suffix
+# seen among the rare words of training. The trie has 1 root per word shape
+# (capitalization, hyphens & digits) and is stored as arrays in
+# breadth-first order: the children of node n are the entries
+# SUFFIX_CHILD_PTR[n]:SUFFIX_CHILD_PTR[n + 1] of SUFFIX_CHILD_CHARS, sorted by
+# character, and the child at entry k is node NUM_WORD_SHAPES + k. Each node
+# holds a precomputed, smoothed emission row, so an unseen word costs a single
+# walk down the trie from the last character of the word.
+#
+# The tagging pipeline carries sentences as token ids, which index the rows
+# of TOKEN_EMISSION_COLUMNS: ids below len(WORDS) are words of the vocabulary,
+# and the following ids are the suffix trie nodes of unseen words, then, if
+# <NUM> is unseen in a model with a suffix trie, a reserved id for <NUM>.
+# Without a suffix trie every unseen word is UNK_ID. Only the Tokenizer ever
+# looks a token string up.
+#
+# Log probabilities are stored as float64, or quantized to float32 or to int16
+# steps of LOGPROB_SCALE with INT16_FLOOR for LOG_PROB_FLOOR. The tag-sized
+# arrays are dequantized to float64 when the model is built, while
+# EMISSION_LOGPROBS & SUFFIX_EMISSIONS stay quantized, e.g. in the mapped
+# pages of a model file, and are dequantized into the dense emission array,
+# which quantized models hold as float32.
+#
+# The dense emission array costs (token ids x tags) floats in every process
+# that builds it, e.g. each server or tagger process, unless the model file
+# stores it, in which case its pages are mapped & shared like the others.
+#===========================================================================#
+class HMMModel():
+  """
+  tags                List of POS tags, in POS_TAGS order
+  words               List of words, with <UNK> at UNK_ID
+  transitions         (tags x tags) log probabilities P(t_i | t_i-1), where
+                      rows: t_i-1, cols: t_i
+  emission_ptr        (words + 1) offsets, where the seen tags of word id w
+                      are stored at emission_ptr[w]:emission_ptr[w + 1]
+  emission_tag_ids    Tag id of every stored (word, tag) pair
+  emission_logprobs   Log probability P(w_i | t_i) of every stored pair
+  unk_emissions       (tags) log probabilities P(<UNK> | t_i)
+  trigram_transitions (tags x tags x tags) log probabilities P(t_i | t_i-2, t_i-1),
+                      where axes: t_i-2, t_i-1, t_i, or None for a bigram model
+  suffix_child_ptr    (nodes + 1) offsets of the children of each suffix trie node
+                      into suffix_child_chars, or None without a suffix trie
+  suffix_child_chars  Unicode code point of every child node, sorted per node
+  suffix_emissions    (nodes x tags) log probabilities P(w_i | t_i) of the
+                      unseen words ending with the suffix of each node
+  precision           One of PRECISIONS, the precision log probabilities are
+                      stored in. Float arrays are quantized to it, and
+                      integer arrays are taken as already quantized int16.
+  logprob_scale       Log probability of 1 int16 step, with PRECISION_INT16
+  token_emission_columns (token ids x tags) dense emission array in EMISSION_DTYPE,
+                      e.g. mapped from a model file, or None to build it on 1st use
+  """
+  def __init__(self, tags, words, transitions, emission_ptr, emission_tag_ids, emission_logprobs, unk_emissions,
+               trigram_transitions=None, suffix_child_ptr=None, suffix_child_chars=None, suffix_emissions=None,
+               precision=PRECISION_FLOAT64, logprob_scale=1.0, token_emission_columns=None):
+    if precision not in PRECISIONS:
+      raise ValueError('Unknown log probability precision: ' + str(precision))
+
+    # Precision of the stored log probabilities, and dtype of the dense emission arrays
+    self.PRECISION = precision
+    self.LOGPROB_SCALE = float(logprob_scale)
+    self.EMISSION_DTYPE = np.float64 if precision == PRECISION_FLOAT64 else np.float32
+
+    # Tag table, in POS_TAGS order: ['<S>', '<E>', 'CC', ...] and { '<S>': 0, ... }
+    self.TAGS = list(tags)
+    self.TAG_TO_ID = { tag: i for i, tag in enumerate(self.TAGS) }
+
+    # Word table, with <UNK> at UNK_ID: ['<UNK>', 'the', ...] and { '<UNK>': 0, ... }
+    self.WORDS = list(words)
+    self.WORD_TO_ID = { word: i for i, word in enumerate(self.WORDS) }
+
+    # Matrix representing P(t_i | t_i-1), where rows: t_i-1, cols: t_i
+    self.TRANSITIONS = self.dequantize_logprobs(self.quantize_logprobs(transitions))
+
+    # Sparse P(w_i | t_i), stored per word id
+    self.EMISSION_PTR = np.asarray(emission_ptr, dtype=np.int64)
+    self.EMISSION_TAG_IDS = np.asarray(emission_tag_ids, dtype=np.int32)
+    self.EMISSION_LOGPROBS = self.quantize_logprobs(emission_logprobs)
+
+    # Vector representing P(<UNK> | t_i)
+    self.UNK_EMISSIONS = self.dequantize_logprobs(self.quantize_logprobs(unk_emissions))
+
+    # Matrix representing P(t_i | t_i-2, t_i-1), where axes: t_i-2, t_i-1, t_i
+    self.TRIGRAM_TRANSITIONS = None
+    if trigram_transitions is not None:
+      self.TRIGRAM_TRANSITIONS = self.dequantize_logprobs(self.quantize_logprobs(trigram_transitions))
+
+    # Suffix trie of the unseen words' emissions, where rows of SUFFIX_EMISSIONS: trie nodes, cols: t_i
+    self.SUFFIX_CHILD_PTR = None
+    self.SUFFIX_CHILD_CHARS = None
+    self.SUFFIX_EMISSIONS = None
+    if suffix_emissions is not None:
+      self.SUFFIX_CHILD_PTR = np.asarray(suffix_child_ptr, dtype=np.int64)
+      self.SUFFIX_CHILD_CHARS = np.asarray(suffix_child_chars, dtype=np.int32)
+      self.SUFFIX_EMISSIONS = self.quantize_logprobs(suffix_emissions)
+
+    # Suffix trie arrays as lists, walked by get_suffix_node, built on 1st use
+    self.SUFFIX_TRIE_LISTS = None
+
+    # Matrix representing P(w_i | t_i) word-major, where rows: w_i, cols: t_i,
+    # built on 1st use by build_emission_columns, as the 1st rows of the
+    # emissions of every token id
+    self.EMISSION_COLUMNS = None
+    self.TOKEN_EMISSION_COLUMNS = None
+
+    self.set_reserved_token_ids()
+
+    if token_emission_columns is not None:
+      if token_emission_columns.shape != (self.NUM_TOKEN_IDS, len(self.TAGS)) or token_emission_columns.dtype.type is not self.EMISSION_DTYPE:
+        raise ValueError('Dense emission array does not match the model: ' + str(token_emission_columns.shape))
+      self.TOKEN_EMISSION_COLUMNS = token_emission_columns
+      self.EMISSION_COLUMNS = token_emission_columns[:self.NUM_WORDS]
+
+  # Attaches a suffix trie to a model built without one, which gives the unseen
+  # words their own token ids
+  def set_suffix_trie(self, suffix_child_ptr, suffix_child_chars, suffix_emissions):
+    self.SUFFIX_CHILD_PTR = np.asarray(suffix_child_ptr, dtype=np.int64)
+    self.SUFFIX_CHILD_CHARS = np.asarray(suffix_child_chars, dtype=np.int32)
+    self.SUFFIX_EMISSIONS = self.quantize_logprobs(suffix_emissions)
+    self.SUFFIX_TRIE_LISTS = None
+    self.EMISSION_COLUMNS = None
+    self.TOKEN_EMISSION_COLUMNS = None
+    self.set_reserved_token_ids()
+
+  #=====================================================#
+  # QUANTIZATION
+  #=====================================================#
+  # Log probabilities in the stored precision of this model, where integer
+  # arrays of an int16 model are taken as already quantized
+  def quantize_logprobs(self, logprobs):
+    DTYPE = LOGPROB_DTYPES[self.PRECISION]
+    if self.PRECISION != PRECISION_INT16 or np.issubdtype(np.asarray(logprobs).dtype, np.integer):
+      return np.asarray(logprobs, dtype=DTYPE)
+    logprobs = np.asarray(logprobs, dtype=np.float64)
+    steps = np.clip(np.rint(logprobs / self.LOGPROB_SCALE), -INT16_MAX_MAGNITUDE, INT16_MAX_MAGNITUDE)
+    return np.where(logprobs <= LOG_PROB_FLOOR, INT16_FLOOR, steps).astype(DTYPE)
+
+  # Stored log probabilities of this model as float64, or as dtype
+  def dequantize_logprobs(self, logprobs, dtype=np.float64):
+    if self.PRECISION != PRECISION_INT16:
+      return np.asarray(logprobs, dtype=dtype)
+    return np.where(logprobs == INT16_FLOOR, LOG_PROB_FLOOR, logprobs * self.LOGPROB_SCALE).astype(dtype)
+
+  """
+  Copies this model with its log probabilities stored in another precision.
+  The int16 scale maps the lowest log probability above LOG_PROB_FLOOR to
+  -INT16_MAX_MAGNITUDE, so every other one is within LOGPROB_SCALE / 2 of its
+  float64 value.
+
+  PRECISION    One of PRECISIONS
+
+  return       HMMModel
+  """
+  def quantize(self, PRECISION):
+    if PRECISION not in PRECISIONS:
+      raise ValueError('Unknown log probability precision: ' + str(PRECISION))
+    emission_logprobs = self.dequantize_logprobs(self.EMISSION_LOGPROBS)
+    suffix_emissions = None if self.SUFFIX_EMISSIONS is None else self.dequantize_logprobs(self.SUFFIX_EMISSIONS)
+
+    logprob_scale = 1.0
+    if PRECISION == PRECISION_INT16:
+      logprobs = [self.TRANSITIONS, emission_logprobs, self.UNK_EMISSIONS, self.TRIGRAM_TRANSITIONS, suffix_emissions]
+      lowest = min([float(array[array > LOG_PROB_FLOOR].min(initial=0.0)) for array in logprobs if array is not None])
+      if lowest < 0.0:
+        logprob_scale = -lowest / INT16_MAX_MAGNITUDE
+
+    return HMMModel(self.TAGS, self.WORDS, self.TRANSITIONS, self.EMISSION_PTR, self.EMISSION_TAG_IDS, emission_logprobs,
+                    self.UNK_EMISSIONS, self.TRIGRAM_TRANSITIONS, self.SUFFIX_CHILD_PTR, self.SUFFIX_CHILD_CHARS,
+                    suffix_emissions, PRECISION, logprob_scale)
+
+  # Token ids of the <S>, <E> & <NUM> tokens, looked up once per model
+  def set_reserved_token_ids(self):
+    self.NUM_WORDS = len(self.WORDS)
+    self.NUM_SUFFIX_NODES = 0 if self.SUFFIX_EMISSIONS is None else len(self.SUFFIX_EMISSIONS)
+
+    # <NUM> takes the emissions of its suffix trie node if unseen, under its own id
+    self.NUM_ID = self.WORD_TO_ID.get(NUM_SYMBOL)
+    if self.NUM_ID is None:
+      self.NUM_ID = UNK_ID if self.SUFFIX_EMISSIONS is None else self.NUM_WORDS + self.NUM_SUFFIX_NODES
+    self.NUM_TOKEN_IDS = max(self.NUM_WORDS + self.NUM_SUFFIX_NODES, self.NUM_ID + 1)
+    self.START_ID = self.get_token_id(START_MARKER)
+    self.END_ID = self.get_token_id(END_MARKER)
+
+    # Token ids of the seen words, as looked up by the tokenizer, where seen
+    # numerics take the <NUM> id like every other numeric: { 'the': 1, ... }
+    self.TOKEN_TO_ID = { word: (self.NUM_ID if word[:1].isdecimal() and NUM_SYMBOL_MATCHER(word) else i)
+                         for word, i in self.WORD_TO_ID.items() }
+
+  """
+  Builds the dense word-major emission array from the sparse storage, once.
+  Engines call it when they are set up, so the array is built at load time
+  and shared by forked worker processes.
+
+  return    (words x tags) array, where row w is the emission column of word id w
+  """
+  def build_emission_columns(self):
+    self.build_token_emission_columns()
+    return self.EMISSION_COLUMNS
+
+  """
+  Builds the dense emission array of every token id, once: the word-major
+  emission array, followed by the emissions of the suffix trie nodes & of the
+  reserved <NUM> id, if any. The array is private to each process that builds
+  it, unless it was mapped from a model file saved with EMISSION_COLUMNS.
+
+  return    (token ids x tags) array, where row t is the emission column of token id t
+  """
+  def build_token_emission_columns(self):
+    if self.TOKEN_EMISSION_COLUMNS is None:
+      token_emission_columns = np.empty((self.NUM_TOKEN_IDS, len(self.TAGS)), dtype=self.EMISSION_DTYPE)
+      token_emission_columns[:self.NUM_WORDS] = self.scatter_emission_columns(np.arange(self.NUM_WORDS))
+      if self.SUFFIX_EMISSIONS is not None:
+        suffix_emissions = self.dequantize_logprobs(self.SUFFIX_EMISSIONS, self.EMISSION_DTYPE)
+        token_emission_columns[self.NUM_WORDS:self.NUM_WORDS + self.NUM_SUFFIX_NODES] = suffix_emissions
+        if self.NUM_ID >= self.NUM_WORDS:
+          token_emission_columns[self.NUM_ID] = suffix_emissions[self.get_suffix_node(NUM_SYMBOL)]
+      self.TOKEN_EMISSION_COLUMNS = token_emission_columns
+      self.EMISSION_COLUMNS = token_emission_columns[:self.NUM_WORDS]
+    return self.TOKEN_EMISSION_COLUMNS
+
+  # The dense emission arrays, the suffix trie lists & the token ids of the seen
+  # words are left out of pickled models & rebuilt on use, and the dequantized
+  # log probabilities are pickled in the stored precision
+  def __getstate__(self):
+    state = dict(self.__dict__)
+    for name in ['TRANSITIONS', 'UNK_EMISSIONS', 'TRIGRAM_TRANSITIONS']:
+      if state[name] is not None:
+        state[name] = self.quantize_logprobs(state[name])
+    state['TOKEN_TO_ID'] = None
+    state['EMISSION_COLUMNS'] = None
+    state['TOKEN_EMISSION_COLUMNS'] = None
+    state['SUFFIX_TRIE_LISTS'] = None
+    return state
+
+  # Models pickled before an attribute existed load with its default
+  def __setstate__(self, state):
+    self.PRECISION = PRECISION_FLOAT64
+    self.LOGPROB_SCALE = 1.0
+    self.EMISSION_DTYPE = np.float64
+    self.EMISSION_COLUMNS = None
+    self.TRIGRAM_TRANSITIONS = None
+    self.SUFFIX_CHILD_PTR = None
+    self.SUFFIX_CHILD_CHARS = None
+    self.SUFFIX_EMISSIONS = None
+    self.SUFFIX_TRIE_LISTS = None
+    self.__dict__.update(state)
+    self.TRANSITIONS = self.dequantize_logprobs(self.TRANSITIONS)
+    self.UNK_EMISSIONS = self.dequantize_logprobs(self.UNK_EMISSIONS)
+    if self.TRIGRAM_TRANSITIONS is not None:
+      self.TRIGRAM_TRANSITIONS = self.dequantize_logprobs(self.TRIGRAM_TRANSITIONS)
+    self.TOKEN_EMISSION_COLUMNS = None
+    self.set_reserved_token_ids()
+
+  # Emission probabilities of a single word id for every POS tag, as a vector
+  def get_emission_column(self, word_id):
+    return self.build_emission_columns()[word_id]
+
+  """
+  Emission probabilities of many word ids at once, as rows of the word-major
+  emission array.
+
+  word_ids    Array of word ids of any shape
+
+  return      Array of shape word_ids.shape + (tags,)
+  """
+  def get_emission_columns(self, word_ids):
+    return self.build_emission_columns()[np.asarray(word_ids, dtype=np.int64)]
+
+  """
+  Scatters the emission columns of many word ids from the sparse storage,
+  without a Python loop over the words.
+
+  word_ids    Array of word ids of any shape
+
+  return      Array of shape word_ids.shape + (tags,)
+  """
+  def scatter_emission_columns(self, word_ids):
+    word_ids = np.asarray(word_ids, dtype=np.int64)
+    flat_word_ids = word_ids.ravel()
+    emission_columns = np.full((len(flat_word_ids), len(self.TAGS)), LOG_PROB_FLOOR, dtype=self.EMISSION_DTYPE)
+
+    # Positions of the stored (word, tag) pairs of every requested word
+    starts = self.EMISSION_PTR[flat_word_ids]
+    counts = self.EMISSION_PTR[flat_word_ids + 1] - starts
+    rows = np.repeat(np.arange(len(flat_word_ids)), counts)
+    entries = np.arange(counts.sum()) + np.repeat(starts - (np.cumsum(counts) - counts), counts)
+
+    emission_columns[rows, self.EMISSION_TAG_IDS[entries]] = self.dequantize_logprobs(self.EMISSION_LOGPROBS[entries])
+    emission_columns[flat_word_ids == UNK_ID] = self.UNK_EMISSIONS
+    return emission_columns.reshape(word_ids.shape + (len(self.TAGS),))
+
+  # Maps a word to its id, where words outside the vocabulary map to <UNK>
+  def get_word_id(self, word):
+    return self.WORD_TO_ID.get(word, UNK_ID)
+
+  """
+  Maps a token to its token id: the id of a seen word, else, with a suffix
+  trie, the id of the unseen word's suffix trie node, else UNK_ID.
+
+  token     Token, already NUM-substituted
+
+  return    Token id, a row of TOKEN_EMISSION_COLUMNS
+  """
+  def get_token_id(self, token):
+    word_id = self.WORD_TO_ID.get(token)
+    if word_id is not None:
+      return word_id
+    if self.SUFFIX_EMISSIONS is None:
+      return UNK_ID
+    if token == NUM_SYMBOL:
+      return self.NUM_ID
+    return self.NUM_WORDS + self.get_suffix_node(token)
+
+  # Maps a list of tokens to their token ids, as an array('i')
+  def get_token_ids(self, tokens):
+    return array('i', [self.get_token_id(token) for token in tokens])
+
+  # Whether a token id stands for a word outside the vocabulary, <UNK> included
+  def is_unseen_token_id(self, token_id):
+    return token_id == UNK_ID or token_id >= self.NUM_WORDS
+
+  # Maps token ids back to tokens for reports, with every unseen word as <UNK>
+  # & unseen <NUM> words as <NUM>
+  def get_token_strings(self, token_ids):
+    return [NUM_SYMBOL if token_id == self.NUM_ID and token_id != UNK_ID
+            else UNK if self.is_unseen_token_id(token_id) else self.WORDS[token_id]
+            for token_id in token_ids]
+
+  # Emission probabilities of a token id for every POS tag, as a vector
+  def get_token_emission_column(self, token_id):
+    return self.build_token_emission_columns()[token_id]
+
+  """
+  Emission columns of every token of a batch of sentences, padded with <UNK>
+  after the end of the shorter sentences, as a single lookup of
+  TOKEN_EMISSION_COLUMNS.
+
+  list_of_token_ids    List of token id sequences, e.g. array('i')
+
+  return               Array of shape (sentences, longest sentence's tokens, tags)
+  """
+  def get_padded_emission_columns(self, list_of_token_ids):
+    MAX_LEN_TOKENS = max([len(token_ids) for token_ids in list_of_token_ids])
+    token_id_matrix = np.full((len(list_of_token_ids), MAX_LEN_TOKENS), UNK_ID, dtype=np.int64)
+    for b in range(len(list_of_token_ids)):
+      token_id_matrix[b, :len(list_of_token_ids[b])] = list_of_token_ids[b]
+    return self.build_token_emission_columns()[token_id_matrix]
+
+  """
+  Walks the suffix trie from the root of a word's shape along the word's
+  characters, last one 1st, down to the node of its longest suffix in the trie.
+
+  word      Word outside the vocabulary
+
+  return    Node id, a row of SUFFIX_EMISSIONS
+  """
+  def get_suffix_node(self, word):
+    if self.SUFFIX_TRIE_LISTS is None:
+      self.SUFFIX_TRIE_LISTS = (self.SUFFIX_CHILD_PTR.tolist(), self.SUFFIX_CHILD_CHARS.tolist())
+    child_ptr, child_chars = self.SUFFIX_TRIE_LISTS
+
+    node = get_word_shape(word)
+    for char in reversed(word):
+      start = child_ptr[node]
+      end = child_ptr[node + 1]
+      code_point = ord(char)
+      k = bisect.bisect_left(child_chars, code_point, start, end)
+      if k == end or child_chars[k] != code_point:
+        break
+      node = NUM_WORD_SHAPES + k
+    return node
+
+  # SHA-256 hex digest of the tag & word tables and of every probability array,
+  # identifying the model whatever file format it was loaded from
+  def get_fingerprint(self):
+    digest = hashlib.sha256()
+    if self.PRECISION != PRECISION_FLOAT64:
+      digest.update((self.PRECISION + ':' + repr(self.LOGPROB_SCALE)).encode('utf-8'))
+    for table in [self.TAGS, self.WORDS]:
+      digest.update('\n'.join(table).encode('utf-8'))
+      digest.update(b'\0')
+    for array in [self.TRANSITIONS, self.EMISSION_PTR, self.EMISSION_TAG_IDS, self.EMISSION_LOGPROBS, self.UNK_EMISSIONS]:
+      digest.update(np.ascontiguousarray(array).tobytes())
+    if self.TRIGRAM_TRANSITIONS is not None:
+      digest.update(np.ascontiguousarray(self.TRIGRAM_TRANSITIONS).tobytes())
+    if self.SUFFIX_EMISSIONS is not None:
+      for array in [self.SUFFIX_CHILD_PTR, self.SUFFIX_CHILD_CHARS, self.SUFFIX_EMISSIONS]:
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+  #=====================================================#
+  # CONVERSION FROM & TO THE DICTIONARY MODEL
+  #=====================================================#
+  """
+  Converts a model in the dictionary format produced by
+  HMMProbGenerator.generate_probs into an HMMModel. Dense dictionary models
+  written by older versions load too: entries equal to LOG_PROB_FLOOR are
+  left implicit.
+
+  dict_model    List of 2 elements [P(t_i | t_i-1), P(w_i | t_i)], each a
+                nested Dictionary keyed by POS tag (and word) strings
+
+  return        HMMModel holding the same log probabilities
+  """
+  @classmethod
+  def from_dict_model(cls, dict_model):
+    prob_tag_given_tag = dict_model[0]
+    prob_word_given_tag = dict_model[1]
+
+    transitions = [[prob_tag_given_tag[tag_i_minus_1][tag_i] for tag_i in POS_TAGS] for tag_i_minus_1 in POS_TAGS]
+
+    # Regroup the tag-major entries per word, with <UNK> kept apart
+    words = [UNK]
+    word_to_entries = { UNK: [] }
+    unk_emissions = [LOG_PROB_FLOOR] * len(POS_TAGS)
+    for tag_id in range(len(POS_TAGS)):
+      for word, value in prob_word_given_tag[POS_TAGS[tag_id]].items():
+        if word == UNK:
+          unk_emissions[tag_id] = value
+          continue
+        if word not in word_to_entries:
+          words.append(word)
+          word_to_entries[word] = []
+        if value != LOG_PROB_FLOOR:
+          word_to_entries[word].append((tag_id, value))
+
+    emission_ptr = [0]
+    emission_tag_ids = []
+    emission_logprobs = []
+    for word in words:
+      for entry in word_to_entries[word]:
+        emission_tag_ids.append(entry[0])
+        emission_logprobs.append(entry[1])
+      emission_ptr.append(len(emission_tag_ids))
+
+    return cls(POS_TAGS, words, transitions, emission_ptr, emission_tag_ids, emission_logprobs, unk_emissions)
+
+  """
+  Converts this model back into the dense dictionary format, with an entry
+  for every (tag, word) pair, e.g. for the pure-Python Viterbi engine.
+
+  return    List of 2 elements [P(t_i | t_i-1), P(w_i | t_i)]
+  """
+  def to_dict_model(self):
+    transitions = self.TRANSITIONS.tolist()
+    unk_emissions = self.UNK_EMISSIONS.tolist()
+
+    prob_tag_given_tag = {}
+    prob_word_given_tag = {}
+    for i in range(len(self.TAGS)):
+      prob_tag_given_tag[self.TAGS[i]] = dict(zip(self.TAGS, transitions[i]))
+      prob_word_given_tag[self.TAGS[i]] = dict.fromkeys(self.WORDS, LOG_PROB_FLOOR)
+      prob_word_given_tag[self.TAGS[i]][UNK] = unk_emissions[i]
+
+    emission_ptr = self.EMISSION_PTR.tolist()
+    emission_tag_ids = self.EMISSION_TAG_IDS.tolist()
+    emission_logprobs = self.dequantize_logprobs(self.EMISSION_LOGPROBS).tolist()
+    for word_id in range(len(self.WORDS)):
+      for k in range(emission_ptr[word_id], emission_ptr[word_id + 1]):
+        prob_word_given_tag[self.TAGS[emission_tag_ids[k]]][self.WORDS[word_id]] = emission_logprobs[k]
+    return [prob_tag_given_tag, prob_word_given_tag]
@@ -0,0 +1,237 @@
+# Import standard modules
+import mmap
+import pickle
+import struct
+
+# Import third-party modules
+import numpy as np
+
+# Import custom modules
+from HMMModel import HMMModel, PRECISION_FLOAT64, LOGPROB_DTYPES
+
+# Define constants
+MODEL_FORMAT_AUTO = 'auto' # sniff the format from the file's magic bytes
+MODEL_FORMAT_BINARY = 'binary' # memory-mappable binary model file
+MODEL_FORMAT_PICKLE = 'pickle' # legacy Python pickle
+MODEL_FORMATS = [MODEL_FORMAT_AUTO, MODEL_FORMAT_BINARY, MODEL_FORMAT_PICKLE]
+
+MAGIC = b'HMMPOSTG' # 1st 8 bytes of every binary model file
+VERSION = 1 # version of model files without trigram transitions
+TRIGRAM_VERSION = 2 # version of model files with trigram transitions
+SUFFIX_TRIE_VERSION = 3 # version of model files with a suffix trie
+QUANTIZED_VERSION = 4 # version of model files with log probabilities quantized below float64
+EMISSION_COLUMNS_VERSION = 5 # version of model files storing the dense emission array
+ALIGNMENT = 8 # every section starts at a multiple of 8 bytes
+TABLE_SEPARATOR = '\n' # tags and words never contain '\n', since it separates sentences
+
+# Header: magic, version, number of tags, number of words, number of stored
+# emissions, then (offset, length in bytes) of each section, all little-endian.
+# Version 2 adds the TRIGRAM_TRANSITIONS section, so bigram models are still
+# written as version 1 files. Version 3 adds the suffix trie sections, where
+# an empty TRIGRAM_TRANSITIONS section stands for a bigram model. Version 4
+# adds the precision & int16 scale of the log probability sections, and an
+# empty SUFFIX_EMISSIONS section stands for a model without a suffix trie.
+# float64 models are still written as version 1 to 3 files. Version 5 adds
+# the dense emission array of every token id, in the model's EMISSION_DTYPE,
+# and is only written when it is asked for.
+SECTIONS = {
+  VERSION: ['TAGS', 'WORDS', 'TRANSITIONS', 'EMISSION_PTR', 'EMISSION_TAG_IDS', 'EMISSION_LOGPROBS', 'UNK_EMISSIONS'],
+}
+SECTIONS[TRIGRAM_VERSION] = SECTIONS[VERSION] + ['TRIGRAM_TRANSITIONS']
+SECTIONS[SUFFIX_TRIE_VERSION] = SECTIONS[TRIGRAM_VERSION] + ['SUFFIX_CHILD_PTR', 'SUFFIX_CHILD_CHARS', 'SUFFIX_EMISSIONS']
+SECTIONS[QUANTIZED_VERSION] = SECTIONS[SUFFIX_TRIE_VERSION] + ['LOGPROB_PRECISION', 'LOGPROB_SCALE']
+SECTIONS[EMISSION_COLUMNS_VERSION] = SECTIONS[QUANTIZED_VERSION] + ['TOKEN_EMISSION_COLUMNS']
+HEADERS = { version: struct.Struct('<8sIIQQ' + 'QQ' * len(SECTIONS[version])) for version in SECTIONS }
+MAGIC_AND_VERSION = struct.Struct('<8sI')
+
+# Array sections and their on-disk dtypes
+DTYPES = {
+  'TRANSITIONS': np.dtype('<f8'),
+  'EMISSION_PTR': np.dtype('<i8'),
+  'EMISSION_TAG_IDS': np.dtype('<i4'),
+  'EMISSION_LOGPROBS': np.dtype('<f8'),
+  'UNK_EMISSIONS': np.dtype('<f8'),
+  'TRIGRAM_TRANSITIONS': np.dtype('<f8'),
+  'SUFFIX_CHILD_PTR': np.dtype('<i8'),
+  'SUFFIX_CHILD_CHARS': np.dtype('<i4'),
+  'SUFFIX_EMISSIONS': np.dtype('<f8'),
+  'LOGPROB_SCALE': np.dtype('<f8'),
+}
+
+# Log probability sections, stored in the dtype of the model's precision
+LOGPROB_SECTIONS = ['TRANSITIONS', 'EMISSION_LOGPROBS', 'UNK_EMISSIONS', 'TRIGRAM_TRANSITIONS', 'SUFFIX_EMISSIONS']
+
+#===========================================================================#
+# HMMModelFile
+# READS AND WRITES THE MODEL FILE.
+#
+# The binary format is a fixed header, the tag and word tables and the
+# contiguous arrays of an HMMModel. It is opened with mmap, so loading costs
+# the same whatever the model size apart from building the word dictionary,
+# and processes tagging with the same model file share its pages. Files
+# saved with EMISSION_COLUMNS also hold the dense emission array, which is
+# otherwise built in the private memory of every process loading the model.
+# The legacy pickle format is still read and written.
+#===========================================================================#
+class HMMModelFile():
+  def __init__(self, PATH_TO_DATA_MODEL):
+    self.PATH_TO_DATA_MODEL = PATH_TO_DATA_MODEL
+
+  """
+  Writes a model to the model file.
+
+  model             HMMModel, or the dictionary model of HMMProbGenerator.generate_probs
+  model_format      MODEL_FORMAT_BINARY or MODEL_FORMAT_PICKLE
+  EMISSION_COLUMNS  Also store the dense emission array in a binary file, so
+                    processes loading it map it instead of building it
+  """
+  def save(self, model, model_format=MODEL_FORMAT_BINARY, EMISSION_COLUMNS=False):
+    if EMISSION_COLUMNS and model_format != MODEL_FORMAT_BINARY:
+      raise ValueError('Only binary model files store the dense emission array')
+    if model_format == MODEL_FORMAT_PICKLE:
+      with open(self.PATH_TO_DATA_MODEL, 'wb') as model_file:
+        pickle.dump(model, model_file)
+    elif model_format == MODEL_FORMAT_BINARY:
+      self.save_binary(model if isinstance(model, HMMModel) else HMMModel.from_dict_model(model), EMISSION_COLUMNS)
+    else:
+      raise ValueError('Cannot save model in format: ' + str(model_format))
+
+  """
+  Reads the model file.
+
+  model_format    One of MODEL_FORMATS, where MODEL_FORMAT_AUTO sniffs the
+                  file's magic bytes
+
+  return          HMMModel for binary files, whatever was pickled otherwise
+  """
+  def load(self, model_format=MODEL_FORMAT_AUTO):
+    if model_format == MODEL_FORMAT_AUTO:
+      model_format = MODEL_FORMAT_BINARY if self.is_binary() else MODEL_FORMAT_PICKLE
+
+    if model_format == MODEL_FORMAT_PICKLE:
+      with open(self.PATH_TO_DATA_MODEL, 'rb') as model_file:
+        return pickle.load(model_file)
+    elif model_format == MODEL_FORMAT_BINARY:
+      return self.load_binary()
+    raise ValueError('Cannot load model in format: ' + str(model_format))
+
+  # Checks whether the model file starts with the binary format's magic bytes
+  def is_binary(self):
+    with open(self.PATH_TO_DATA_MODEL, 'rb') as model_file:
+      return model_file.read(len(MAGIC)) == MAGIC
+
+  #=====================================================#
+  # BINARY FORMAT
+  #=====================================================#
+  def save_binary(self, model, EMISSION_COLUMNS=False):
+    version = VERSION if model.TRIGRAM_TRANSITIONS is None else TRIGRAM_VERSION
+    if model.SUFFIX_EMISSIONS is not None:
+      version = SUFFIX_TRIE_VERSION
+    if model.PRECISION != PRECISION_FLOAT64:
+      version = QUANTIZED_VERSION
+    if EMISSION_COLUMNS:
+      version = EMISSION_COLUMNS_VERSION
+    sections = {
+      'TAGS': TABLE_SEPARATOR.join(model.TAGS).encode('utf-8'),
+      'WORDS': TABLE_SEPARATOR.join(model.WORDS).encode('utf-8'),
+      'LOGPROB_PRECISION': model.PRECISION.encode('utf-8'),
+    }
+    dtypes = self.get_section_dtypes(model.PRECISION)
+    for name in SECTIONS[version]:
+      if name == 'LOGPROB_SCALE':
+        sections[name] = np.array([model.LOGPROB_SCALE], dtype=dtypes[name]).tobytes()
+      elif name == 'TOKEN_EMISSION_COLUMNS':
+        sections[name] = np.ascontiguousarray(model.build_token_emission_columns(), dtype=dtypes[name]).tobytes()
+      elif name in LOGPROB_SECTIONS:
+        array = getattr(model, name)
+        sections[name] = b'' if array is None else np.ascontiguousarray(model.quantize_logprobs(array), dtype=dtypes[name]).tobytes()
+      elif name in dtypes:
+        array = getattr(model, name)
+        sections[name] = b'' if array is None else np.ascontiguousarray(array, dtype=dtypes[name]).tobytes()
+
+    # Lay out the sections one after another, each aligned after the header
+    offsets_and_lengths = []
+    offset = self.align(HEADERS[version].size)
+    for name in SECTIONS[version]:
+      offsets_and_lengths += [offset, len(sections[name])]
+      offset = self.align(offset + len(sections[name]))
+
+    with open(self.PATH_TO_DATA_MODEL, 'wb') as model_file:
+      model_file.write(HEADERS[version].pack(MAGIC, version, len(model.TAGS), len(model.WORDS),
+                                             len(model.EMISSION_LOGPROBS), *offsets_and_lengths))
+      for i in range(len(SECTIONS[version])):
+        model_file.write(b'\0' * (offsets_and_lengths[2 * i] - model_file.tell()))
+        model_file.write(sections[SECTIONS[version][i]])
+
+  def load_binary(self):
+    with open(self.PATH_TO_DATA_MODEL, 'rb') as model_file:
+      buffer = mmap.mmap(model_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(buffer) < MAGIC_AND_VERSION.size:
+      raise ValueError('Truncated binary model file: ' + self.PATH_TO_DATA_MODEL)
+
+    magic, version = MAGIC_AND_VERSION.unpack_from(buffer, 0)
+    if magic != MAGIC:
+      raise ValueError('Not a binary model file: ' + self.PATH_TO_DATA_MODEL)
+    if version not in SECTIONS:
+      raise ValueError('Unsupported binary model file version ' + str(version) + ': ' + self.PATH_TO_DATA_MODEL)
+    if len(buffer) < HEADERS[version].size:
+      raise ValueError('Truncated binary model file: ' + self.PATH_TO_DATA_MODEL)
+
+    header = HEADERS[version].unpack_from(buffer, 0)
+    precision = PRECISION_FLOAT64
+    if 'LOGPROB_PRECISION' in SECTIONS[version]:
+      i = SECTIONS[version].index('LOGPROB_PRECISION')
+      precision = buffer[header[5 + 2 * i] : header[5 + 2 * i] + header[6 + 2 * i]].decode('utf-8')
+      if precision not in LOGPROB_DTYPES:
+        raise ValueError('Unsupported log probability precision ' + precision + ': ' + self.PATH_TO_DATA_MODEL)
+
+    dtypes = self.get_section_dtypes(precision)
+    sections = {}
+    for i in range(len(SECTIONS[version])):
+      offset = header[5 + 2 * i]
+      length = header[6 + 2 * i]
+      name = SECTIONS[version][i]
+      if name in dtypes:
+        # Views straight into the mapped pages, nothing is copied
+        sections[name] = np.frombuffer(buffer, dtype=dtypes[name], count=length // dtypes[name].itemsize, offset=offset)
+      else:
+        sections[name] = buffer[offset : offset + length].decode('utf-8').split(TABLE_SEPARATOR)
+
+    # P(t_i | t_i-1) is stored row by row, where rows: t_i-1, cols: t_i
+    NUM_TAGS = header[2]
+    transitions = sections['TRANSITIONS'].reshape(NUM_TAGS, NUM_TAGS)
+
+    # P(t_i | t_i-2, t_i-1) is stored t_i-2 major, then t_i-1
+    trigram_transitions = None
+    if 'TRIGRAM_TRANSITIONS' in sections and len(sections['TRIGRAM_TRANSITIONS']) > 0:
+      trigram_transitions = sections['TRIGRAM_TRANSITIONS'].reshape(NUM_TAGS, NUM_TAGS, NUM_TAGS)
+
+    # The suffix trie's emissions are stored node by node
+    suffix_emissions = None
+    if 'SUFFIX_EMISSIONS' in sections and len(sections['SUFFIX_EMISSIONS']) > 0:
+      suffix_emissions = sections['SUFFIX_EMISSIONS'].reshape(-1, NUM_TAGS)
+
+    # The dense emission array is stored token id by token id
+    token_emission_columns = None
+    if 'TOKEN_EMISSION_COLUMNS' in sections:
+      token_emission_columns = sections['TOKEN_EMISSION_COLUMNS'].reshape(-1, NUM_TAGS)
+
+    logprob_scale = float(sections['LOGPROB_SCALE'][0]) if 'LOGPROB_SCALE' in sections else 1.0
+    return HMMModel(sections['TAGS'], sections['WORDS'], transitions, sections['EMISSION_PTR'],
+                    sections['EMISSION_TAG_IDS'], sections['EMISSION_LOGPROBS'], sections['UNK_EMISSIONS'],
+                    trigram_transitions, sections.get('SUFFIX_CHILD_PTR'), sections.get('SUFFIX_CHILD_CHARS'),
+                    suffix_emissions, precision, logprob_scale, token_emission_columns)
+
+  # On-disk dtypes of the array sections, with the log probability sections in the dtype of the precision
+  # and the dense emission array in float32 below float64
+  def get_section_dtypes(self, precision):
+    dtypes = dict(DTYPES)
+    for name in LOGPROB_SECTIONS:
+      dtypes[name] = np.dtype(LOGPROB_DTYPES[precision]).newbyteorder('<')
+    dtypes['TOKEN_EMISSION_COLUMNS'] = np.dtype('<f8' if precision == PRECISION_FLOAT64 else '<f4')
+    return dtypes
+
+  # Rounds an offset up to the next multiple of ALIGNMENT
+  def align(self, offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
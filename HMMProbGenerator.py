@@ -2,31 +2,57 @@
 import sys
 from math import log
 
+# Import third-party modules
+import numpy as np
+
 # Import custom modules
 from PennTreebankPOSTags import POS_TAGS, START_MARKER, END_MARKER
+from HMMModel import HMMModel, LOG_PROB_FLOOR, NUM_WORD_SHAPES, get_word_shape
+from HMMCounts import HMMCounts
+from Tokenizer import NUM_SYMBOL
 
 # Define constants
 UNK = '<UNK>' # symbol representing out-of-vocabulary words
+OOV_MODEL_FLAT = 'flat' # every unseen word takes the <UNK> emissions
+OOV_MODEL_SUFFIX = 'suffix' # unseen words take the emissions of their longest suffix in a suffix trie
+OOV_MODELS = [OOV_MODEL_SUFFIX, OOV_MODEL_FLAT]
+RARE_WORD_MAX_COUNT = 10 # words seen at most this often estimate the unseen words' emissions
+MAX_SUFFIX_LENGTH = 10 # number of last characters of a word stored in the suffix trie
+MIN_SUFFIX_COUNT = 20 # suffixes of fewer rare word tokens are left out of the suffix trie
 
 #===========================================================================#
 # HMMProbGenerator
 # GENERATES THE MODEL.
 #
-# Computes the resulting P(w_i | t_i) and P(t_i | t_i-1) probabilities.
+# Computes the resulting P(w_i | t_i) and P(t_i | t_i-1) probabilities, from
+# a list of (word, tag) pairs or from already counted HMMCounts. With
+# TRIGRAMS, it also computes P(t_i | t_i-2, t_i-1) for the second-order HMM,
+# interpolating the trigram, bigram & unigram estimates with weights set by
+# deleted interpolation (Brants, TnT, 2000). With OOV_MODEL_SUFFIX, it also
+# estimates P(w_i | t_i) of unseen words from the suffixes of rare words,
+# also following TnT, in the suffix trie of HMMModel.
 #===========================================================================#
 class HMMProbGenerator():
-  def __init__(self, word_postag_pairs):
+  def __init__(self, word_postag_pairs=None, counts=None, TRIGRAMS=False, OOV_MODEL=OOV_MODEL_SUFFIX):
+    if OOV_MODEL not in OOV_MODELS:
+      raise ValueError('Unknown OOV model: ' + str(OOV_MODEL) + ', expected one of ' + str(OOV_MODELS))
+
     print("== [HMMProbGenerator instantiated] ==")
     self.WORD_POSTAG_PAIRS = word_postag_pairs
+    self.TRIGRAMS = TRIGRAMS
+    self.OOV_MODEL = OOV_MODEL
+
+    # Raw counts of the corpus, kept apart from the probabilities computed from them
+    self.COUNTS = counts if counts is not None else HMMCounts().add_word_postag_pairs(word_postag_pairs)
 
     #==================================================#
     # Constructing the Vocabulary for words & tags
     #==================================================#
     # Vocabulary in this Dictionary format: { 'the': 41107, 'gracious': 1, ... }
-    self.WORD_VOCAB = self.get_word_vocabulary_with_counts(word_postag_pairs)
+    self.WORD_VOCAB = self.COUNTS.get_word_vocabulary_with_counts()
 
     # Vocabulary in this Dictionary format: { 'NN': 1123, 'VBN': 2323, ... }
-    self.POSTAG_VOCAB = self.get_tag_vocabulary_with_counts(word_postag_pairs)
+    self.POSTAG_VOCAB = dict(self.COUNTS.POSTAG_COUNTS)
 
     #==================================================#
     # Initialize probabilities required for the model
@@ -34,9 +60,13 @@ class HMMProbGenerator():
     # Matrix representing P(t_i | t_i-1), where rows: t_i-1, cols: t_i
     self.PROB_TAG_GIVEN_TAG = self.initialize_prob_tag_given_tag()
 
-    # Matrix representing P(w_i | t_i),  where rows: t_i, cols: w_i
+    # Sparse matrix representing P(w_i | t_i),  where rows: t_i, cols: w_i
     self.PROB_WORD_GIVEN_TAG = self.initialize_word_given_tag()
 
+    # Interpolation weights of the unigram, bigram & trigram estimates of
+    # P(t_i | t_i-2, t_i-1), set by generate_trigram_transitions
+    self.TRIGRAM_LAMBDAS = None
+
   #=======================================================#
   # GENERATE P(t_i | t_i-1) AND P(w_i | t_i) PROBABILITIES
   #=======================================================#
@@ -44,13 +74,29 @@ class HMMProbGenerator():
   Generate emission & transition probabilities from a labelled corpus
   Modifies self.PROB_TAG_GIVEN_TAG and self.PROB_WORD_GIVEN_TAG
 
-  return    Model as a list of 2 elements [P(t_i | t_i-1), P(w_i | t_i)]
+  return    Model as a list of 2 elements [P(t_i | t_i-1), P(w_i | t_i)], where
+            P(w_i | t_i) only holds the seen (word, tag) pairs and <UNK>
   """
   def generate_probs(self):
     self.generate_prob_word_given_tag()
     self.generate_prob_tag_given_tag()
     return [self.PROB_TAG_GIVEN_TAG, self.PROB_WORD_GIVEN_TAG]
 
+  """
+  Generate emission & transition probabilities from a labelled corpus as an
+  integer-indexed HMMModel, with trigram transitions if TRIGRAMS and with the
+  suffix trie of the unseen words' emissions if OOV_MODEL is OOV_MODEL_SUFFIX.
+
+  return    Model as an HMMModel
+  """
+  def generate_model(self):
+    model = HMMModel.from_dict_model(self.generate_probs())
+    if self.TRIGRAMS:
+      model.TRIGRAM_TRANSITIONS = self.generate_trigram_transitions()
+    if self.OOV_MODEL == OOV_MODEL_SUFFIX:
+      model.set_suffix_trie(*self.generate_suffix_trie())
+    return model
+
   """
   Generates P(t_i | t_i-1) bigram tags' occurrence probability matrix.
   Ensures that probabilities stored are the log probabilities as the magnitude
@@ -59,13 +105,10 @@ class HMMProbGenerator():
   Modifies self.PROB_TAG_GIVEN_TAG, a matrix representing P(t_i | t_i-1), where rows: t_i-1, cols: t_i
   """
   def generate_prob_tag_given_tag(self):
-    # Count number of tags at position (i) following another tag at position (i + 1)
-    WORD_POSTAG_PAIRS_LENGTH = len(self.WORD_POSTAG_PAIRS)
-    for i in range(WORD_POSTAG_PAIRS_LENGTH):
-      if i + 1 < WORD_POSTAG_PAIRS_LENGTH: # prevents index out of bounds
-        bi_tag_i_minus_1 = self.WORD_POSTAG_PAIRS[i][1]
-        bi_tag_i = self.WORD_POSTAG_PAIRS[i + 1][1]
-        self.PROB_TAG_GIVEN_TAG[bi_tag_i_minus_1][bi_tag_i] += 1
+    # Number of tags at position (i) following another tag at position (i - 1)
+    for tag_i_minus_1, tag_i_counts in self.COUNTS.POSTAG_BIGRAM_COUNTS.items():
+      for tag_i, count in tag_i_counts.items():
+        self.PROB_TAG_GIVEN_TAG[tag_i_minus_1][tag_i] += count
 
     # Convert to probability from raw counts
     for tag_i_minus_1 in self.PROB_TAG_GIVEN_TAG:
@@ -83,6 +126,7 @@ class HMMProbGenerator():
 
   """
   Generates P(w_i | t_i) word and POS tag occurrence probability matrix.
+  Only (word, tag) pairs seen in training and <UNK> get an entry.
   Handles out-of-vocabulary words by using add-1 smoothing.
   Ensures that probabilities stored are the log probabilities as the magnitude
   of the raw probabilities can cause underflow.
@@ -90,12 +134,11 @@ class HMMProbGenerator():
   Modifies self.PROB_WORD_GIVEN_TAG, a matrix representing P(w_i | t_i),  where rows: t_i, cols: w_i
   """
   def generate_prob_word_given_tag(self):
-    # Count number of words co-occurring with a given tag & mutate PROB_WORD_GIVEN_TAG matrix
-    for word_postag_pair in self.WORD_POSTAG_PAIRS:
-      word = word_postag_pair[0]
-      postag = word_postag_pair[1]
-
-      self.PROB_WORD_GIVEN_TAG[postag][word] += 1
+    # Number of words co-occurring with a given tag & mutate PROB_WORD_GIVEN_TAG matrix
+    for postag, word_counts in self.COUNTS.WORD_POSTAG_COUNTS.items():
+      prob_word_given_postag = self.PROB_WORD_GIVEN_TAG[postag]
+      for word, count in word_counts.items():
+        prob_word_given_postag[word] = prob_word_given_postag.get(word, 0) + count
 
     # Set count of out-of-vocabulary words to 1, normalized probability
     for postag in self.PROB_WORD_GIVEN_TAG:
@@ -117,6 +160,161 @@ class HMMProbGenerator():
 
     return None
 
+  """
+  Generates P(t_i | t_i-2, t_i-1) as the interpolation
+    l1 * P(t_i) + l2 * P(t_i | t_i-1) + l3 * P(t_i | t_i-2, t_i-1)
+  of maximum likelihood estimates, so that tag trigrams never seen in training
+  back off to their bigram & unigram probabilities. Stored as log
+  probabilities, where 0 probabilities are log(sys.float_info.min).
+
+  return    (tags x tags x tags) array, where axes: t_i-2, t_i-1, t_i
+  """
+  def generate_trigram_transitions(self):
+    TAG_TO_ID = { POS_TAGS[i]: i for i in range(len(POS_TAGS)) }
+    NUM_TAGS = len(POS_TAGS)
+
+    trigram_counts = np.zeros((NUM_TAGS, NUM_TAGS, NUM_TAGS))
+    for postag_context, tag_i_counts in self.COUNTS.POSTAG_TRIGRAM_COUNTS.items():
+      for tag_i, count in tag_i_counts.items():
+        trigram_counts[TAG_TO_ID[postag_context[0]], TAG_TO_ID[postag_context[1]], TAG_TO_ID[tag_i]] = count
+    bigram_counts = np.zeros((NUM_TAGS, NUM_TAGS))
+    for tag_i_minus_1, tag_i_counts in self.COUNTS.POSTAG_BIGRAM_COUNTS.items():
+      for tag_i, count in tag_i_counts.items():
+        bigram_counts[TAG_TO_ID[tag_i_minus_1], TAG_TO_ID[tag_i]] = count
+    unigram_counts = np.array([self.POSTAG_VOCAB.get(postag, 0) for postag in POS_TAGS], dtype=np.float64)
+    # Number of times each (t_i-2, t_i-1) pair is followed by a tag
+    context_counts = trigram_counts.sum(axis=2)
+
+    self.TRIGRAM_LAMBDAS = self.get_trigram_lambdas(trigram_counts, context_counts, bigram_counts, unigram_counts)
+    print("== TRIGRAM INTERPOLATION WEIGHTS (unigram, bigram, trigram):", [round(l, 4) for l in self.TRIGRAM_LAMBDAS], "==")
+
+    # Maximum likelihood estimates, 0 where their context was never seen
+    with np.errstate(divide='ignore', invalid='ignore'):
+      prob_trigram = np.where(context_counts[:, :, None] > 0, trigram_counts / context_counts[:, :, None], 0.0)
+      prob_bigram = np.where(unigram_counts[:, None] > 0, bigram_counts / unigram_counts[:, None], 0.0)
+      prob_unigram = unigram_counts / unigram_counts.sum() if unigram_counts.sum() > 0 else unigram_counts
+
+      probs = self.TRIGRAM_LAMBDAS[0] * prob_unigram[None, None, :] + \
+              self.TRIGRAM_LAMBDAS[1] * prob_bigram[None, :, :] + \
+              self.TRIGRAM_LAMBDAS[2] * prob_trigram
+      return np.where(probs > 0, np.log(probs), LOG_PROB_FLOOR)
+
+  """
+  Sets the interpolation weights by deleted interpolation: each tag trigram
+  seen in training votes, with its count, for the estimate that best predicts
+  it once that very trigram is left out of the counts.
+
+  trigram_counts    (tags x tags x tags) counts of t_i-2, t_i-1, t_i
+  context_counts    (tags x tags) counts of t_i-2, t_i-1 followed by a tag
+  bigram_counts     (tags x tags) counts of t_i-1, t_i
+  unigram_counts    (tags) counts of t_i
+
+  return            List of the weights [l1, l2, l3] of the unigram, bigram &
+                    trigram estimates, summing to 1
+  """
+  def get_trigram_lambdas(self, trigram_counts, context_counts, bigram_counts, unigram_counts):
+    t1, t2, t3 = np.nonzero(trigram_counts)
+    counts = trigram_counts[t1, t2, t3]
+    if counts.sum() == 0:
+      # No trigram to estimate the weights from, fall back to the bigram model
+      return [0.0, 1.0, 0.0]
+
+    TOTAL = unigram_counts.sum()
+    with np.errstate(divide='ignore', invalid='ignore'):
+      left_out_trigram = np.where(context_counts[t1, t2] > 1, (counts - 1) / (context_counts[t1, t2] - 1), 0.0)
+      left_out_bigram = np.where(unigram_counts[t2] > 1, (bigram_counts[t2, t3] - 1) / (unigram_counts[t2] - 1), 0.0)
+      left_out_unigram = (unigram_counts[t3] - 1) / (TOTAL - 1) if TOTAL > 1 else np.zeros(len(counts))
+
+    # Ties go to the higher order estimate
+    best_estimates = np.argmax(np.stack([left_out_trigram, left_out_bigram, left_out_unigram]), axis=0)
+    votes = np.bincount(best_estimates, weights=counts, minlength=3)
+    return (votes[::-1] / votes.sum()).tolist()
+
+  """
+  Generates the suffix trie of P(w_i | t_i) for unseen words. Unseen words
+  behave like rare words, so the tags of the words seen at most
+  RARE_WORD_MAX_COUNT times are counted at every suffix of up to
+  MAX_SUFFIX_LENGTH characters, under the root of the word's shape. Each node
+  smooths P(t_i | suffix) with the estimate of its parent's shorter suffix as
+    P(t | l_n-i+1 ... l_n) = (P^(t | l_n-i+1 ... l_n) + theta * P(t | l_n-i+2 ... l_n)) / (1 + theta)
+  where theta is the standard deviation of the rare words' tag probabilities,
+  down from the shape roots, which are smoothed with the tag distribution of
+  every rare word. By Bayes' rule, taking the unseen word to have the
+  probability 1 / N of a word seen once among the N training tokens,
+  P(w_i | t_i) = P(t_i | suffix) / count(t_i). Suffixes of fewer than
+  MIN_SUFFIX_COUNT rare word tokens are left out, which keeps the trie small.
+
+  return    List of 3 arrays [child offsets, child code points, emissions], as
+            taken by HMMModel as suffix_child_ptr, suffix_child_chars &
+            suffix_emissions
+  """
+  def generate_suffix_trie(self):
+    TAG_TO_ID = { POS_TAGS[i]: i for i in range(len(POS_TAGS)) }
+    NUM_TAGS = len(POS_TAGS)
+
+    # Trie of nested dictionaries, where nodes 0 to NUM_WORD_SHAPES - 1 are the
+    # roots: children in the format { 's': 9, ... } and tag counts { 13: 2, ... }
+    node_children = [{} for shape in range(NUM_WORD_SHAPES)]
+    node_counts = [{} for shape in range(NUM_WORD_SHAPES)]
+    rare_counts = np.zeros(NUM_TAGS)
+    for postag, word_counts in self.COUNTS.WORD_POSTAG_COUNTS.items():
+      tag_id = TAG_TO_ID[postag]
+      for word, count in word_counts.items():
+        if self.WORD_VOCAB[word] > RARE_WORD_MAX_COUNT or word in (START_MARKER, END_MARKER, NUM_SYMBOL):
+          continue
+        rare_counts[tag_id] += count
+
+        node = get_word_shape(word)
+        node_counts[node][tag_id] = node_counts[node].get(tag_id, 0) + count
+        for char in reversed(word[-MAX_SUFFIX_LENGTH:]):
+          child = node_children[node].get(char)
+          if child is None:
+            child = len(node_children)
+            node_children[node][char] = child
+            node_children.append({})
+            node_counts.append({})
+          node = child
+          node_counts[node][tag_id] = node_counts[node].get(tag_id, 0) + count
+
+    # Lay the nodes out breadth-first, the children of a node sorted by character
+    nodes = list(range(NUM_WORD_SHAPES))
+    parents = [-1] * NUM_WORD_SHAPES
+    child_ptr = [0]
+    child_chars = []
+    i = 0
+    while i < len(nodes):
+      children = node_children[nodes[i]]
+      for char in sorted(children):
+        if sum(node_counts[children[char]].values()) >= MIN_SUFFIX_COUNT:
+          child_chars.append(ord(char))
+          nodes.append(children[char])
+          parents.append(i)
+      child_ptr.append(len(child_chars))
+      i += 1
+
+    counts = np.zeros((len(nodes), NUM_TAGS))
+    for i in range(len(nodes)):
+      for tag_id, count in node_counts[nodes[i]].items():
+        counts[i, tag_id] = count
+
+    # Smooth every node with its parent, parents 1st since they come 1st breadth-first
+    rare_probs = rare_counts / rare_counts.sum() if rare_counts.sum() > 0 else rare_counts
+    theta = rare_probs.std(ddof=1)
+    totals = counts.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+      mles = np.where(totals[:, None] > 0, counts / totals[:, None], 0.0)
+    probs = np.zeros((len(nodes), NUM_TAGS))
+    for i in range(len(nodes)):
+      parent_probs = rare_probs if parents[i] < 0 else probs[parents[i]]
+      probs[i] = (mles[i] + theta * parent_probs) / (1 + theta) if totals[i] > 0 else parent_probs
+
+    postag_counts = np.array([self.POSTAG_VOCAB.get(postag, 0) for postag in POS_TAGS], dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+      emissions = np.where((probs > 0) & (postag_counts[None, :] > 0), np.log(probs / postag_counts[None, :]), LOG_PROB_FLOOR)
+
+    print("== SUFFIX TRIE:", len(nodes), "nodes from", int(rare_counts.sum()), "rare word tokens ==")
+    return [np.array(child_ptr, dtype=np.int64), np.array(child_chars, dtype=np.int32), emissions]
+
   #=====================================================#
   # INITIALIZE ALL PROBABILITY MATRICES NEEDED FOR VITERBI
   #=====================================================#
@@ -138,8 +336,10 @@ class HMMProbGenerator():
     return prob_tag_given_tag
 
   """
-  Initializes matrix representing word and POS tag occurrence probabilities, i.e.
-  P(w_i | t_i)
+  Initializes the sparse matrix representing word and POS tag occurrence
+  probabilities, i.e. P(w_i | t_i). Only <UNK> is created up front, the
+  (word, tag) pairs seen in training are added while counting and every other
+  pair is implicitly log(sys.float_info.min).
   Rows: t_i
   Cols: w_i
 
@@ -151,45 +351,4 @@ class HMMProbGenerator():
     for postag in POS_TAGS:
       prob_word_given_tag[postag] = {}
       prob_word_given_tag[postag][UNK] = 0
-      for word in self.WORD_VOCAB:
-        prob_word_given_tag[postag][word] = 0
     return prob_word_given_tag
-
-  #=====================================================#
-  # INITIALIZE ALL WORD & POS TAG VOCABULARIES NEEDED FOR VITERBI
-  #=====================================================#
-  """
-  Returns the corpus' seen words vocabulary
-
-  return    Vocabulary in this Dictionary format: { 'the': 41107, 'gracious': 1, ... }
-  """
-  def get_word_vocabulary_with_counts(self, word_postag_pairs):
-    result = {}
-
-    # Count seen words & add to our Words vocab
-    for word_postag in word_postag_pairs:
-      word = word_postag[0]
-      if word in result:
-        result[word] = result[word] + 1
-      else:
-        result[word] = 1
-    return result
-
-  """
-  Returns the corpus' seen tags vocabulary
-
-  return    Vocabulary in this Dictionary format: { 'NN': 1123, 'VBN': 2323, ... }
-  """
-  def get_tag_vocabulary_with_counts(self, word_postag_pairs):
-    result = {}
-
-    # Initialize Tags vocab with all possible POS tag types
-    for POS_TAG in POS_TAGS:
-      result[POS_TAG] = 0
-
-    # Count Tags & add to our Tags vocab
-    for word_postag in word_postag_pairs:
-      postag = word_postag[1]
-      if postag in result: # check if key exists, just in case, although unneeded
-        result[postag] = result[postag] + 1
-    return result
@@ -0,0 +1,211 @@
+# Import third-party modules
+import numpy as np
+
+#===========================================================================#
+# NumpyViterbi
+# Vectorized Viterbi engine for POSTagger.
+#
+# Reads P(t_i | t_i-1) as a dense (tags x tags) float array from an HMMModel
+# and computes each time step of the recurrence as one broadcast add followed
+# by max/argmax, instead of the (tags x tags) Python loop in POSTagger.tag.
+# Sentences are token id sequences, as produced by
+# Tokenizer.tokenize_test_document_to_ids, whose emissions are rows of the
+# model's TOKEN_EMISSION_COLUMNS, so unseen words take the emissions of their
+# suffix trie node without any lookup.
+#===========================================================================#
+class NumpyViterbi():
+  def __init__(self, model):
+    # HMMModel holding the integer-indexed probabilities
+    self.MODEL = model
+
+    # Matrix representing P(t_i | t_i-1), where rows: t_i-1, cols: t_i
+    self.TRANSITIONS = model.TRANSITIONS
+
+    # Same matrix with rows: t_i, cols: t_i-1, so that batched max/argmax over
+    # t_i-1 run along contiguous memory
+    self.TRANSITIONS_T = np.ascontiguousarray(model.TRANSITIONS.T)
+
+    # Matrix representing P(w_i | t_i) per token id, where rows: token ids, cols: t_i
+    self.TOKEN_EMISSION_COLUMNS = model.build_token_emission_columns()
+
+  """
+  Computes the back pointers of the Viterbi network for a sentence.
+  Ties are broken towards the lowest tag index, exactly like the strict '>'
+  comparison in POSTagger.tag, so both engines return the same paths.
+
+  token_ids    Token ids of the sentence, e.g. an array('i'), starting with '<S>'
+
+  return    2-tuple of (back pointers as a list of lists, index of the best
+            POS tag at the end of the sentence)
+  """
+  def get_back_ptrs(self, token_ids):
+    LEN_TOKENS = len(token_ids)
+    LEN_POSTAG = len(self.MODEL.TAGS)
+    emission_columns = self.TOKEN_EMISSION_COLUMNS[np.asarray(token_ids, dtype=np.int64)]
+
+    # Probability at '<S>' is 1 for every tag (log scale equivalent is 0)
+    memo = np.zeros(LEN_POSTAG, dtype=np.float64)
+    back_ptrs = [[-1] * LEN_POSTAG]
+
+    for i in range(1, LEN_TOKENS):
+      # scores[k][j] = memo[k] + P(t_j | t_k) + P(w_i | t_j)
+      scores = (memo[:, None] + self.TRANSITIONS) + emission_columns[i][None, :]
+      memo = scores.max(axis=0)
+
+      if i > 1:
+        back_ptrs.append(scores.argmax(axis=0).tolist())
+      else:
+        # 1st back pointer always points to the '<S>' node
+        back_ptrs.append([0] * LEN_POSTAG)
+
+    return (back_ptrs, int(memo.argmax()))
+
+
+  """
+  Computes the best POS tag paths of a batch of sentences at once, running
+  the Viterbi recurrence as a (batch x tags) array per time step and
+  following the back pointers of the whole batch together. Sentences shorter
+  than the longest one in the batch keep their last scores once they have
+  ended, so each sentence gets exactly the path of get_back_ptrs.
+
+  list_of_token_ids    List of token id sequences, as taken by get_back_ptrs.
+                       Sentences of similar lengths waste the least work on padding.
+
+  return               List of best POS tag index paths, one per sentence. As in
+                       POSTagger.get_best_viterbi_path, a path covers every token
+                       but the last one, which is always tagged END_MARKER.
+  """
+  def get_best_paths_batch(self, list_of_token_ids):
+    LEN_POSTAG = len(self.MODEL.TAGS)
+    LEN_BATCH = len(list_of_token_ids)
+    lengths = np.array([len(token_ids) for token_ids in list_of_token_ids])
+    MAX_LEN_TOKENS = int(lengths.max())
+    batch_indexes = np.arange(LEN_BATCH)
+
+    # Probability at '<S>' is 1 for every tag (log scale equivalent is 0)
+    memo = np.zeros((LEN_BATCH, LEN_POSTAG), dtype=np.float64)
+    back_ptrs = np.zeros((MAX_LEN_TOKENS, LEN_BATCH, LEN_POSTAG), dtype=np.int64)
+
+    # Emission columns of every token of the batch, padded with <UNK>
+    emission_columns = self.MODEL.get_padded_emission_columns(list_of_token_ids)
+
+    for i in range(1, MAX_LEN_TOKENS):
+      # scores[b][j][k] = memo[b][k] + P(t_j | t_k) + P(w_i | t_j) for sentence b
+      scores = (memo[:, None, :] + self.TRANSITIONS_T[None, :, :]) + emission_columns[:, i, :, None]
+
+      # Sentences which already ended keep their scores
+      memo = np.where((i < lengths)[:, None], scores.max(axis=2), memo)
+
+      # 1st back pointer always points to the '<S>' node
+      if i > 1:
+        back_ptrs[i] = scores.argmax(axis=2)
+
+    # Traverse the sentences backwards, each one starting from its last token
+    best_postag_indexes = memo.argmax(axis=1)
+    paths = np.zeros((LEN_BATCH, MAX_LEN_TOKENS), dtype=np.int64)
+    for i in range(MAX_LEN_TOKENS - 1, 0, -1):
+      back_ptr = back_ptrs[i, batch_indexes, best_postag_indexes]
+      paths[:, i - 1] = back_ptr
+      best_postag_indexes = np.where(i < lengths, back_ptr, best_postag_indexes)
+
+    return [paths[b, :lengths[b] - 1].tolist() for b in range(LEN_BATCH)]
+
+  """
+  Computes the k best POS tag paths of a batch of sentences at once, keeping
+  the k best partial paths into each tag per time step as a (batch x tags x k)
+  array instead of a single score. The k best paths into a tag only extend the
+  k previous tags with the best paths into it, so only the k best partial
+  paths of those k tags are candidates. Candidates are picked by rounds of
+  argmax, each masking the candidates already picked, so ties are broken
+  towards the lowest tag index like get_back_ptrs, and the 1st path of each
+  sentence is always the path of get_back_ptrs.
+
+  list_of_token_ids    List of token id sequences, as taken by get_best_paths_batch
+  K                    Number of paths per sentence
+
+  return               List of lists of up to K 2-tuples of (POS tag index path,
+                       log probability score of the path), best first, one list
+                       per sentence. Paths are as returned by get_best_paths_batch,
+                       and the paths of a sentence differ in at least 1 tag.
+  """
+  def get_k_best_paths_batch(self, list_of_token_ids, K):
+    if K < 1:
+      raise ValueError('K must be at least 1: ' + str(K))
+    LEN_POSTAG = len(self.MODEL.TAGS)
+    LEN_BATCH = len(list_of_token_ids)
+    lengths = np.array([len(token_ids) for token_ids in list_of_token_ids])
+    MAX_LEN_TOKENS = int(lengths.max())
+    K_PREVIOUS = min(K, LEN_POSTAG)
+    batch_indexes = np.arange(LEN_BATCH)[:, None, None]
+    postag_indexes = np.arange(LEN_POSTAG)[None, :, None]
+    emission_columns = self.MODEL.get_padded_emission_columns(list_of_token_ids)
+
+    # memo[b][j][r] = score of the r-th best partial path into tag j of sentence
+    # b. As in get_back_ptrs, '<S>' may take any tag, so only the best one is kept.
+    memo = np.full((LEN_BATCH, LEN_POSTAG, K), -np.inf)
+    memo[:, :, 0] = self.TRANSITIONS.max(axis=0)[None, :] + emission_columns[:, 1, :]
+    back_ptrs = np.zeros((MAX_LEN_TOKENS, LEN_BATCH, LEN_POSTAG, K), dtype=np.int64)
+
+    for i in range(2, MAX_LEN_TOKENS):
+      # Previous tags k with the best scores[b][j][k] = memo[b][k][0] + P(t_j | t_k),
+      # in increasing order
+      scores = memo[:, None, :, 0] + self.TRANSITIONS_T[None, :, :]
+      previous_postags = np.empty((LEN_BATCH, LEN_POSTAG, K_PREVIOUS), dtype=np.int64)
+      for s in range(K_PREVIOUS):
+        previous_postags[:, :, s] = scores.argmax(axis=2)
+        scores[batch_indexes[:, :, 0], postag_indexes[:, :, 0], previous_postags[:, :, s]] = -np.inf
+      previous_postags.sort(axis=2)
+
+      # scores[b][j][s * K + r] = memo[b][k][r] + P(t_j | t_k), where k = previous_postags[b][j][s]
+      scores = (memo[batch_indexes, previous_postags] +
+                self.TRANSITIONS_T[postag_indexes, previous_postags][:, :, :, None]).reshape(LEN_BATCH, LEN_POSTAG, K_PREVIOUS * K)
+      best_scores = np.empty((LEN_BATCH, LEN_POSTAG, K), dtype=np.float64)
+      for r in range(K):
+        best = scores.argmax(axis=2)[:, :, None]
+        best_scores[:, :, r] = np.take_along_axis(scores, best, axis=2)[:, :, 0]
+        np.put_along_axis(scores, best, -np.inf, axis=2)
+        back_ptrs[i, :, :, r] = (np.take_along_axis(previous_postags, best // K, axis=2) * K + best % K)[:, :, 0]
+
+      # Sentences which already ended keep their scores
+      memo = np.where((i < lengths)[:, None, None], best_scores + emission_columns[:, i, :, None], memo)
+
+    return [self.get_k_best_paths_from_back_ptrs(back_ptrs[:lengths[b], b], memo[b], K)
+            for b in range(LEN_BATCH)]
+
+  # K best paths of a single sentence, as in get_k_best_paths_batch
+  def get_k_best_paths(self, token_ids, K):
+    return self.get_k_best_paths_batch([token_ids], K)[0]
+
+  """
+  Follows the back pointers of the k best paths into each tag at the end of a
+  sentence. Different ends of a path only differ in the tag of the last token,
+  which is always tagged END_MARKER, so paths already followed from a better
+  end are skipped.
+
+  back_ptrs    (tokens x tags x K) array of back pointers k * K + r to the
+               r-th best partial path into tag k at the previous token
+  memo         (tags x K) array of the scores of the paths at the last token
+  K            Number of paths
+
+  return       List of up to K 2-tuples of (POS tag index path, log probability
+               score of the path), best first
+  """
+  def get_k_best_paths_from_back_ptrs(self, back_ptrs, memo, K):
+    paths = []
+    seen_paths = set()
+    scores = memo.ravel().tolist()
+    for end in np.argsort(-memo.ravel(), kind='stable').tolist():
+      if len(paths) == K or scores[end] == -np.inf:
+        break
+      j, r = divmod(end, K)
+      path = []
+      for i in range(len(back_ptrs) - 1, 1, -1):
+        j, r = divmod(int(back_ptrs[i, j, r]), K)
+        path.append(j)
+      path.append(0)
+      path.reverse()
+
+      if tuple(path) not in seen_paths:
+        seen_paths.add(tuple(path))
+        paths.append((path, scores[end]))
+    return paths
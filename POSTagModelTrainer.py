@@ -1,10 +1,62 @@
 # Import standard modules
+import io
+import os
 import sys
+import time
 import pickle
+import locale
+import multiprocessing
 
 # Import custom modules
 from Tokenizer import Tokenizer
-from HMMProbGenerator import HMMProbGenerator
+from HMMProbGenerator import HMMProbGenerator, OOV_MODEL_SUFFIX
+from HMMCounts import HMMCounts
+from PennTreebankPOSTags import START_MARKER
+
+# Define constants
+DEFAULT_TRAINING_WORKERS = 1 # number of processes counting the training file, 1 counts it in this process
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024 # largest number of bytes of the training file counted as 1 chunk
+
+# Tokenizer of the worker processes counting chunks of the training file
+WORKER_TOKENIZER = None
+
+# Sets up a worker process of the counting pool
+def init_counting_worker():
+  global WORKER_TOKENIZER
+  WORKER_TOKENIZER = Tokenizer()
+
+"""
+Counts the lines of a byte range of the training file, in a worker process
+of the counting pool.
+
+byte_range    3-tuple of (path of the training file, offset of the 1st byte
+              of the range, offset of the byte after it), both offsets at the
+              start of a line
+
+return        HMMCounts of the range
+"""
+def count_byte_range(byte_range):
+  PATH_TO_DATA_TRAIN, start, end = byte_range
+  with open(PATH_TO_DATA_TRAIN, 'rb') as train_file:
+    lines = iter_lines_in_byte_range(train_file, start, end)
+    return HMMCounts().add_word_postag_pairs(WORKER_TOKENIZER.iter_word_postag_pairs_from_training_file(lines))
+
+# Lazily reads & decodes the lines of a binary file from byte start to byte
+# end, as the lines of the file opened in text mode, with universal newlines
+def iter_lines_in_byte_range(binary_file, start, end):
+  ENCODING = locale.getpreferredencoding(False)
+  binary_file.seek(start)
+  position = start
+  while position < end:
+    line = binary_file.readline()
+    if len(line) == 0:
+      return
+    position += len(line)
+    line = line.decode(ENCODING)
+    if '\r' in line:
+      yield from io.StringIO(line, newline=None)
+    else:
+      yield line
 
 #===========================================================================#
 # POSTagModelTrainer
@@ -12,7 +64,27 @@ from HMMProbGenerator import HMMProbGenerator
 # TRAIN THE POS TAGGER
 #===========================================================================#
 class POSTagModelTrainer():
-  def __init__(self, PATH_TO_DATA_TRAIN, VALIDATE_MODE=False):
+  def __init__(self, PATH_TO_DATA_TRAIN, VALIDATE_MODE=False, STATS=None, TRIGRAMS=False,
+               OOV_MODEL=OOV_MODEL_SUFFIX, WORKERS=DEFAULT_TRAINING_WORKERS, CHUNK_SIZE=DEFAULT_CHUNK_SIZE):
+    if WORKERS < 1:
+      raise ValueError('WORKERS must be at least 1')
+    if CHUNK_SIZE < 1:
+      raise ValueError('CHUNK_SIZE must be at least 1')
+
+    # Instrumentation recording stage timers & counters, None disables it
+    self.STATS = STATS
+
+    # Number of processes counting chunks of the training file, and the
+    # largest number of bytes of a chunk
+    self.WORKERS = WORKERS
+    self.CHUNK_SIZE = CHUNK_SIZE
+
+    # Whether trained models hold the trigram transitions of the second-order HMM
+    self.TRIGRAMS = TRIGRAMS
+
+    # Emission model of the unseen words of trained models, see HMMProbGenerator
+    self.OOV_MODEL = OOV_MODEL
+
     if VALIDATE_MODE:
       print("== [POSTagModelTrainer instantiated] CROSS VALIDATION MODE ==")
     else:
@@ -20,28 +92,109 @@ class POSTagModelTrainer():
       # Set up tokenizer before everything else
       self.tokenizer = Tokenizer()
 
-      # Initialized constants
-      self.DATA_TRAIN = open(PATH_TO_DATA_TRAIN).read()
-      self.LIST_OF_WORD_POSTAG_PAIRS = self.load_training_data()
+      # Initialized constants. The training file is streamed into the counts
+      # when training, so memory use depends on the model, not on the corpus.
+      self.PATH_TO_DATA_TRAIN = PATH_TO_DATA_TRAIN
 
   """
   Trains the model against our specified training set using the HMMProbGenerator
   which helps us generate our model's probabilities.
 
-  return    The trained model, as a list of 2 elements [P(t_i | t_i-1), P(w_i | t_i)].
+  return    The trained model, as an HMMModel
   """
   def train(self):
-    list_of_labelled_words = self.LIST_OF_WORD_POSTAG_PAIRS # [['its', 'PRP$'], ['to', 'TO'] ...]
-    model = HMMProbGenerator(list_of_labelled_words).generate_probs()
+    if self.STATS is None:
+      model = HMMProbGenerator(counts=self.count(), TRIGRAMS=self.TRIGRAMS, OOV_MODEL=self.OOV_MODEL).generate_model()
+      return model
+
+    start = time.perf_counter()
+    counts = self.count()
+    self.STATS.add_stage_time('read_and_count', time.perf_counter() - start)
+
+    start = time.perf_counter()
+    model = HMMProbGenerator(counts=counts, TRIGRAMS=self.TRIGRAMS, OOV_MODEL=self.OOV_MODEL).generate_model()
+    self.STATS.add_stage_time('generate_model', time.perf_counter() - start)
+
+    # Every sentence has 1 <S> & 1 <E> token
+    NUM_SENTENCES = counts.POSTAG_COUNTS.get(START_MARKER, 0)
+    self.STATS.count('sentences', NUM_SENTENCES)
+    self.STATS.count('tokens', sum(counts.POSTAG_COUNTS.values()) - 2 * NUM_SENTENCES)
+    self.STATS.count('words', len(model.WORDS) - 1)
     return model
 
+  """
+  Counts the training data without computing any probabilities, e.g. to be
+  saved as a count shard and merged with the counts of other training files.
+  With several WORKERS, the training file is counted by count_in_parallel.
+
+  return    HMMCounts of the training data
+  """
+  def count(self):
+    if self.WORKERS > 1:
+      return self.count_in_parallel()
+
+    with open(self.PATH_TO_DATA_TRAIN) as train_file:
+      return HMMCounts().add_word_postag_pairs(self.iter_training_data(train_file))
+
+  """
+  Counts the training file as a map-reduce over chunks of it: a pool of
+  WORKERS processes counts its byte ranges, each read line by line, and the
+  partial counts are appended in file order as they come, giving the same
+  counts as counting the file in 1 pass. Memory use depends on the
+  vocabulary, since no process holds more than a line of the file, the
+  counts of its range & those of the ranges waiting to be appended.
+
+  return    HMMCounts of the training data
+  """
+  def count_in_parallel(self):
+    byte_ranges = self.get_byte_ranges()
+    counts = HMMCounts()
+    with multiprocessing.Pool(self.WORKERS, initializer=init_counting_worker) as pool:
+      for range_counts in pool.imap(count_byte_range, byte_ranges, chunksize=1):
+        counts.append(range_counts)
+
+    if self.STATS is not None:
+      self.STATS.count('training_chunks', len(byte_ranges))
+    return counts
+
+  """
+  Splits the training file into byte ranges of at most CHUNK_SIZE bytes, and
+  at least 1 per worker, each moved forward to start at the start of a line.
+
+  return    List of 3-tuples of (path of the training file, offset of the
+            1st byte of the range, offset of the byte after it), in file order
+  """
+  def get_byte_ranges(self):
+    FILE_SIZE = os.path.getsize(self.PATH_TO_DATA_TRAIN)
+    NUM_RANGES = max(-(-FILE_SIZE // self.CHUNK_SIZE), self.WORKERS)
+
+    # A line starts at each boundary, or after the 1st newline from the byte before it
+    boundaries = [0]
+    with open(self.PATH_TO_DATA_TRAIN, 'rb') as train_file:
+      for i in range(1, NUM_RANGES):
+        train_file.seek(max(FILE_SIZE * i // NUM_RANGES - 1, boundaries[-1]))
+        train_file.readline()
+        boundaries.append(max(train_file.tell(), boundaries[-1]))
+    boundaries.append(FILE_SIZE)
+
+    return [(self.PATH_TO_DATA_TRAIN, boundaries[i], boundaries[i + 1])
+            for i in range(NUM_RANGES) if boundaries[i] < boundaries[i + 1]]
+
+  """
+  Streams the training data line by line and tokenizes it.
+
+  train_file    Text file object of the training data
+
+  return        Generator of pairs in the format ['its', 'PRP$'], ['to', 'TO'] ...
+  """
+  def iter_training_data(self, train_file):
+    return self.tokenizer.iter_word_postag_pairs_from_training_file(train_file)
+
   """
   Loads the training data in-memory and tokenizes it.
 
-  return        List of strings in the format
-                ['<word1>/<pos_tag1>', '<word2>/<pos_tag2>', ...]
+  return        List of pairs in the format [['its', 'PRP$'], ['to', 'TO'] ...]
   """
   def load_training_data(self):
-    list_of_str_postag = self.tokenizer.tokenize_document(self.DATA_TRAIN)
-    list_of_word_postag_pairs = self.tokenizer.get_pairs_of_word_tags(list_of_str_postag)
-    return list_of_word_postag_pairs
+    with open(self.PATH_TO_DATA_TRAIN) as train_file:
+      return list(self.iter_training_data(train_file))
@@ -1,21 +1,99 @@
 # Import standard modules
 import sys
 import math
+import time
+import json
 import pickle
+import collections
+import multiprocessing
+
+# Import third-party modules
+import numpy as np
 
 # Import custom modules
 from Tokenizer import Tokenizer
 from PennTreebankPOSTags import POS_TAGS, START_MARKER, END_MARKER
+from HMMModel import HMMModel, UNK_ID
+from HMMModelFile import HMMModelFile, MODEL_FORMAT_AUTO
+from NumpyViterbi import NumpyViterbi
+from ForwardBackward import ForwardBackward
+from ConstrainedViterbi import ConstrainedViterbi, UNK_TAGS_OPEN_CLASS
+from TrigramViterbi import TrigramViterbi, DEFAULT_BEAM
+from SentenceCache import SentenceCache, DEFAULT_CACHE_SIZE
+from Instrumentation import Instrumentation
 
 # Define constants
-UNK = '<UNK>'
+ENGINE_PYTHON = 'python' # pure-Python Viterbi loop in POSTagger.tag
+ENGINE_NUMPY = 'numpy' # vectorized Viterbi in NumpyViterbi
+ENGINE_CONSTRAINED = 'constrained' # tag-dictionary constrained Viterbi in ConstrainedViterbi
+ENGINE_TRIGRAM = 'trigram' # second-order, tag-dictionary & beam pruned Viterbi in TrigramViterbi
+ENGINES = [ENGINE_PYTHON, ENGINE_NUMPY, ENGINE_CONSTRAINED, ENGINE_TRIGRAM]
+DEFAULT_BATCH_SIZE = 1 # number of sentences tagged at once, 1 tags sentence by sentence
+DEFAULT_BUCKET_WIDTH = 4 # maximum difference in token counts within a batch
+DEFAULT_CHUNK_SIZE = 256 # number of sentences read ahead by run_streaming
+DEFAULT_WORKERS = 1 # number of tagging processes, 1 tags in the current process
+CHUNKS_IN_FLIGHT_PER_WORKER = 2 # chunks queued per worker process, bounding memory
+POSTERIOR_BATCH_SIZE = 64 # number of sentences run through forward-backward at once
+DEFAULT_K_BEST = 0 # number of alternative taggings given with the confidences, 0 gives none
+
+# Tagger used by the worker processes of the tagging pool. It is set before
+# the pool forks, so every worker shares the parent's model pages instead of
+# loading or unpickling the model again.
+WORKER_TAGGER = None
+
+# Tags a chunk of sentences in a worker process of the tagging pool, and
+# returns it with the worker's sentence cache lookup counts and stats for that chunk
+def tag_chunk_in_worker(sentences):
+  if WORKER_TAGGER.STATS is not None:
+    WORKER_TAGGER.STATS = Instrumentation()
+
+  cache = WORKER_TAGGER.SENTENCE_CACHE
+  if cache is None:
+    return (WORKER_TAGGER.tag_chunk(sentences), None, WORKER_TAGGER.STATS)
+
+  stats_before = cache.get_stats()
+  tagged_chunk = WORKER_TAGGER.tag_chunk(sentences)
+  stats_after = cache.get_stats()
+  return (tagged_chunk, [stats_after[name] - stats_before[name] for name in ['hits', 'disk_hits', 'misses']],
+          WORKER_TAGGER.STATS)
 
 #===========================================================================#
 # POSTagger
 # Executes the viterbi & backpointer algorithms to generate the best POS tags
+#
+# Sentences are tokenized straight into token ids, see HMMModel, and tagged
+# as sequences of POS tag ids. Strings are only looked at again by
+# iter_formatted_lines, which writes the words of the input sentences with
+# the tags of their tag ids.
 #===========================================================================#
 class POSTagger():
-  def __init__(self, PATH_TO_DATA_TEST, PATH_TO_DATA_MODEL, model=None, VALIDATE_MODE=False):
+  def __init__(self, PATH_TO_DATA_TEST, PATH_TO_DATA_MODEL, model=None, VALIDATE_MODE=False, ENGINE=ENGINE_NUMPY,
+               MODEL_FORMAT=MODEL_FORMAT_AUTO, BATCH_SIZE=DEFAULT_BATCH_SIZE, BUCKET_WIDTH=DEFAULT_BUCKET_WIDTH,
+               WORKERS=DEFAULT_WORKERS, UNK_TAGS=UNK_TAGS_OPEN_CLASS, CACHE_SIZE=DEFAULT_CACHE_SIZE,
+               PATH_TO_CACHE=None, STATS=None, BEAM=DEFAULT_BEAM, CONFIDENCES=False, K_BEST=DEFAULT_K_BEST):
+    if ENGINE not in ENGINES:
+      raise ValueError('Unknown Viterbi engine: ' + str(ENGINE) + ', expected one of ' + str(ENGINES))
+    if BATCH_SIZE < 1 or BUCKET_WIDTH < 1:
+      raise ValueError('BATCH_SIZE and BUCKET_WIDTH must be at least 1')
+    if BATCH_SIZE > 1 and ENGINE != ENGINE_NUMPY:
+      raise ValueError('Batched tagging requires the ' + ENGINE_NUMPY + ' engine')
+    if WORKERS < 1:
+      raise ValueError('WORKERS must be at least 1')
+    if WORKERS > 1 and 'fork' not in multiprocessing.get_all_start_methods():
+      raise ValueError('Tagging with several workers requires the fork start method')
+    if CACHE_SIZE < 0:
+      raise ValueError('CACHE_SIZE must be at least 0')
+    if PATH_TO_CACHE is not None and CACHE_SIZE == 0:
+      raise ValueError('A disk sentence cache requires CACHE_SIZE > 0')
+    if K_BEST < 0:
+      raise ValueError('K_BEST must be at least 0')
+    if K_BEST > 0 and not CONFIDENCES:
+      raise ValueError('Alternative taggings are only given with the confidences')
+
+    # Instrumentation recording stage timers & counters, None disables it
+    self.STATS = STATS
+    start = time.perf_counter() if STATS is not None else None
+
     MODEL = None
     if VALIDATE_MODE:
       print("== [POSTagger instantiated] CROSS VALIDATION MODE ==")
@@ -24,43 +102,237 @@ class POSTagger():
       print("== [POSTagger instantiated] ==")
       self.PATH_TO_DATA_TEST = PATH_TO_DATA_TEST
       self.PATH_TO_DATA_MODEL = PATH_TO_DATA_MODEL
+      self.MODEL_FORMAT = MODEL_FORMAT
       MODEL = self.load_model()
-
-    # Matrix representing P(t_i | t_i-1), where rows: t_i-1, cols: t_i
-    self.PROB_TAG_GIVEN_TAG = MODEL[0]
-
-    # Matrix representing P(w_i | t_i),  where rows: t_i, cols: w_i
-    self.PROB_WORD_GIVEN_TAG = MODEL[1]
-
-    # List of seen words
-    self.VOCAB_WORDS = self.PROB_WORD_GIVEN_TAG['NN'].keys()
+      if STATS is not None:
+        STATS.add_stage_time('load_model', time.perf_counter() - start)
+        start = time.perf_counter()
+
+    # Viterbi engine used by self.tag
+    self.ENGINE = ENGINE
+
+    # Sentences are tagged in batches of up to BATCH_SIZE sentences whose
+    # token counts differ by less than BUCKET_WIDTH
+    self.BATCH_SIZE = BATCH_SIZE
+    self.BUCKET_WIDTH = BUCKET_WIDTH
+
+    # Chunks of sentences are tagged by a pool of WORKERS processes if WORKERS > 1
+    self.WORKERS = WORKERS
+
+    # Integer-indexed model, converting the dictionary model if needed
+    self.MODEL = MODEL if isinstance(MODEL, HMMModel) else HMMModel.from_dict_model(MODEL)
+
+    # Dictionary of seen words
+    self.VOCAB_WORDS = self.MODEL.WORD_TO_ID
+
+    # Ids of the POS tags of the '<S>' & '<E>' tokens, which are left out of the output
+    self.START_TAG_ID = self.MODEL.TAG_TO_ID[START_MARKER]
+    self.END_TAG_ID = self.MODEL.TAG_TO_ID[END_MARKER]
+
+    # Tagged sentences are cached if CACHE_SIZE > 0, and kept on disk in
+    # PATH_TO_CACHE for the runs with the same model & engine if given
+    self.SENTENCE_CACHE = None
+    if CACHE_SIZE > 0:
+      FINGERPRINT = self.MODEL.get_fingerprint() + ' ' + ENGINE
+      if ENGINE == ENGINE_CONSTRAINED or ENGINE == ENGINE_TRIGRAM:
+        FINGERPRINT += ' ' + UNK_TAGS
+      if ENGINE == ENGINE_TRIGRAM:
+        FINGERPRINT += ' ' + str(BEAM)
+      self.SENTENCE_CACHE = SentenceCache(CACHE_SIZE, PATH_TO_CACHE, FINGERPRINT)
+
+    if ENGINE == ENGINE_NUMPY:
+      self.numpy_viterbi = NumpyViterbi(self.MODEL)
+    elif ENGINE == ENGINE_CONSTRAINED:
+      # Unseen words may take the POS tags selected by UNK_TAGS
+      self.constrained_viterbi = ConstrainedViterbi(self.MODEL, UNK_TAGS)
+    elif ENGINE == ENGINE_TRIGRAM:
+      # Second-order HMM, pruning the tag pair states below the best one by more than BEAM
+      self.trigram_viterbi = TrigramViterbi(self.MODEL, UNK_TAGS, BEAM)
+    else:
+      # Matrix representing P(t_i | t_i-1) as lists, where rows: t_i-1, cols: t_i
+      self.PROB_TAG_GIVEN_TAG = self.MODEL.TRANSITIONS.tolist()
+
+      # Matrix representing P(w_i | t_i) per token id, where rows: token ids, cols: t_i,
+      # built at load time & read through HMMModel.get_token_emission_column
+      self.TOKEN_EMISSION_COLUMNS = self.MODEL.build_token_emission_columns()
+
+    # Tagged sentences come with the posterior probabilities of their tags if
+    # CONFIDENCES, and with their K_BEST best taggings if K_BEST > 0. Both are
+    # computed over the first-order model, whatever the engine.
+    self.CONFIDENCES = CONFIDENCES
+    self.K_BEST = K_BEST
+    if CONFIDENCES:
+      self.forward_backward = ForwardBackward(self.MODEL)
+    if K_BEST > 0:
+      self.k_best_viterbi = NumpyViterbi(self.MODEL)
 
     self.tokenizer = Tokenizer()
+    if STATS is not None:
+      STATS.add_stage_time('prepare_model', time.perf_counter() - start)
 
   # Runs the tagger and formats the result for sents.out
   def run(self):
+    start = time.perf_counter() if self.STATS is not None else None
     sentences = self.load_document_as_sentences()
-    best_postags_with_sentences = [self.get_best_postags(sentences), [sentence.split(' ') for sentence in sentences]]
-    return self.format_best_postags_and_sentences(best_postags_with_sentences)
+    if self.STATS is not None:
+      self.STATS.add_stage_time('read_and_split', time.perf_counter() - start)
+
+    if self.WORKERS > 1:
+      print("-- RUNNING THE PART OF SPEECH TAGGER WITH", self.WORKERS, "WORKERS --")
+      postags_with_sentences = self.iter_best_postags_with_sentence_tokens(sentences, DEFAULT_CHUNK_SIZE)
+      return ''.join(self.iter_formatted_lines(postags_with_sentences))
+
+    print("-- RUNNING THE PART OF SPEECH TAGGER --")
+    return ''.join(self.iter_formatted_lines(self.tag_chunk(sentences)))
+
+  """
+  Runs the tagger lazily over a file of test sentences, e.g. sys.stdin, and
+  writes each formatted line as soon as its chunk of sentences is tagged.
+  Memory use depends on CHUNK_SIZE, not on the size of the input, and the
+  output is the same as the output of run.
+
+  test_file           Text file object to read sentences from, one per line
+  output_file         Text file object to write the tagged sentences to
+  CHUNK_SIZE          Number of sentences read ahead and tagged together
+  confidences_file    Text file object to write the confidences of each tagged
+                      sentence to, as a line of JSON, if CONFIDENCES
+  """
+  def run_streaming(self, test_file, output_file, CHUNK_SIZE=DEFAULT_CHUNK_SIZE, confidences_file=None):
+    print("-- RUNNING THE PART OF SPEECH TAGGER ON A STREAM --")
+    sentences = self.tokenizer.iter_sentences_from_test_file(test_file)
+    if self.STATS is not None:
+      sentences = self.iter_timed(sentences, 'read_and_split')
+    tagged_sentences = self.iter_best_postags_with_sentence_tokens(sentences, CHUNK_SIZE)
+    if confidences_file is not None:
+      tagged_sentences = self.iter_written_confidences(tagged_sentences, confidences_file)
+    for line in self.iter_formatted_lines(tagged_sentences):
+      output_file.write(line)
+
+  # Yields tagged sentences as they are, writing the confidences of each one
+  # to confidences_file as a line of JSON, in the order of the output lines
+  def iter_written_confidences(self, tagged_sentences, confidences_file):
+    for tagged_sentence in tagged_sentences:
+      confidences_file.write(json.dumps(tagged_sentence[2]) + '\n')
+      yield tagged_sentence
+
+  # Tags sentences chunk by chunk, in the worker pool if WORKERS > 1, and yields
+  # (best POS tag ids, sentence) pairs in input order, where sentences are
+  # of the form ['<S> The cow...ate grass . <E>', ...]
+  def iter_best_postags_with_sentence_tokens(self, sentences, CHUNK_SIZE):
+    chunks = self.iter_chunks(sentences, CHUNK_SIZE)
+    tagged_chunks = self.iter_tagged_chunks_in_parallel(chunks) if self.WORKERS > 1 else map(self.tag_chunk, chunks)
+    for tagged_chunk in tagged_chunks:
+      for postags_with_sentence_tokens in tagged_chunk:
+        yield postags_with_sentence_tokens
+
+  # Yields the items of an iterable, adding the time spent producing each item to a stage
+  def iter_timed(self, iterable, stage):
+    iterator = iter(iterable)
+    while True:
+      start = time.perf_counter()
+      try:
+        item = next(iterator)
+      except StopIteration:
+        self.STATS.add_stage_time(stage, time.perf_counter() - start, 0)
+        return
+      self.STATS.add_stage_time(stage, time.perf_counter() - start)
+      yield item
+
+  # Splits an iterable of sentences into lists of up to CHUNK_SIZE sentences
+  def iter_chunks(self, sentences, CHUNK_SIZE):
+    chunk = []
+    for sentence in sentences:
+      chunk.append(sentence)
+      if len(chunk) == CHUNK_SIZE:
+        yield chunk
+        chunk = []
+    if len(chunk) > 0:
+      yield chunk
+
+  """
+  Tags chunks of sentences in a pool of WORKERS forked processes sharing this
+  tagger's model. At most CHUNKS_IN_FLIGHT_PER_WORKER chunks per worker are
+  queued at any time, so memory stays bounded on streamed input.
+
+  chunks    Iterable of lists of sentences
+
+  return    Generator of tagged chunks, as returned by tag_chunk, in input order
+  """
+  def iter_tagged_chunks_in_parallel(self, chunks):
+    global WORKER_TAGGER
+    WORKER_TAGGER = self
+
+    with multiprocessing.get_context('fork').Pool(self.WORKERS) as pool:
+      pending_chunks = collections.deque()
+      for chunk in chunks:
+        pending_chunks.append(pool.apply_async(tag_chunk_in_worker, (chunk,)))
+        if len(pending_chunks) >= CHUNKS_IN_FLIGHT_PER_WORKER * self.WORKERS:
+          yield self.receive_tagged_chunk(pending_chunks.popleft().get())
+
+      while len(pending_chunks) > 0:
+        yield self.receive_tagged_chunk(pending_chunks.popleft().get())
+
+  # Unpacks a tagged chunk returned by tag_chunk_in_worker, adding the worker's
+  # cache lookup counts to this tagger's sentence cache and its stats to this tagger's
+  def receive_tagged_chunk(self, tagged_chunk_with_stats):
+    if tagged_chunk_with_stats[1] is not None:
+      self.SENTENCE_CACHE.add_stats(*tagged_chunk_with_stats[1])
+    if tagged_chunk_with_stats[2] is not None:
+      self.STATS.merge(tagged_chunk_with_stats[2])
+    return tagged_chunk_with_stats[0]
+
+  # Tags a chunk of sentences, skipping sentences with no tokens, and returns a
+  # list of (best POS tag ids, sentence) pairs, or of (best POS tag ids,
+  # sentence, confidences) triples if CONFIDENCES
+  def tag_chunk(self, sentences):
+    return self.tag_chunks([sentences])[0]
+
+  # Tags several chunks of sentences with a single call to tag_sentences, so
+  # that sentences of different chunks share batches, and returns a list of
+  # tagged chunks as returned by tag_chunk
+  def tag_chunks(self, chunks):
+    start = time.perf_counter() if self.STATS is not None else None
+    sen_as_token_ids_list = []
+    tagged_sentences = []
+    chunk_ends = []
+    for sentences in chunks:
+      for sentence in sentences:
+        token_ids = self.tokenizer.tokenize_test_document_to_ids(sentence, self.MODEL)
+        if len(token_ids) > 0:
+          sen_as_token_ids_list.append(token_ids)
+          tagged_sentences.append(sentence)
+      chunk_ends.append(len(sen_as_token_ids_list))
+    if self.STATS is not None:
+      self.STATS.add_stage_time('normalize', time.perf_counter() - start)
+      self.count_sentences(sen_as_token_ids_list)
+
+    best_postags_list = self.tag_sentences(sen_as_token_ids_list)
+    if self.CONFIDENCES:
+      confidences_list = self.get_confidences(sen_as_token_ids_list, best_postags_list)
+      tagged_sentences = list(zip(best_postags_list, tagged_sentences, confidences_list))
+    else:
+      tagged_sentences = list(zip(best_postags_list, tagged_sentences))
+    tagged_chunks = []
+    chunk_start = 0
+    for chunk_end in chunk_ends:
+      tagged_chunks.append(tagged_sentences[chunk_start:chunk_end])
+      chunk_start = chunk_end
+    return tagged_chunks
 
   # Runs the tagger for cross validation purposes
   def run_with_provided_sentences(self, sentences):
     return self.get_best_postags_for_cross_validation(sentences)
 
-  # Gets the best POS tag sequence for a list of input sentences, where sentences
-  # are of the form ['<S>/<S> The/DT ...', '<S>/<S> The/DT']
+  # Gets the best POS tag id sequence for a list of input sentences, where
+  # sentences are of the form ['<S> The cow...ate grass . <E>', ...]
   def get_best_postags(self, sentences):
     print("-- RUNNING THE PART OF SPEECH TAGGER --")
-    sen_as_tokens_list = self.generate_tokens_for_test_doc_sentences(sentences, self.VOCAB_WORDS)
-
-    best_postags_list = []
-    for i in range(len(sen_as_tokens_list)):
-      best_postags = self.tag(sen_as_tokens_list[i])
-      best_postags_list.append(best_postags)
-    return best_postags_list
+    sen_as_token_ids_list = self.generate_tokens_for_test_doc_sentences(sentences)
+    return self.tag_sentences(sen_as_token_ids_list)
 
   # Gets the best POS tag sequence for a list of input sentences for cross
-  # validation, where sentences are of the form ['<S>/<S> The/DT ...', '<S>/<S> The/DT']
+  # validation, where sentences are of the form ['<S>/<S> The/DT ...', '<S>/<S> The/DT'],
+  # with the POS tags of the best & of the true tagging as strings
   def get_best_postags_for_cross_validation(self, sentences):
     print("-- RUNNING THE PART OF SPEECH TAGGER FOR CROSS VALIDATION --")
 
@@ -70,20 +342,174 @@ class POSTagger():
     test_sentences = test_sentences_and_tags[0]
     test_tags = test_sentences_and_tags[1]
 
-    sen_as_tokens_list = self.generate_tokens_for_test_doc_sentences(test_sentences, self.VOCAB_WORDS)
+    sen_as_token_ids_list = self.generate_tokens_for_test_doc_sentences(test_sentences)
 
     # Tag the provided list of sentences
-    best_postags_list = []
-    for i in range(len(sen_as_tokens_list)):
-      best_postags = self.tag(sen_as_tokens_list[i])
-      best_postags_list.append(best_postags)
+    best_postags_list = [[self.MODEL.TAGS[postag_id] for postag_id in best_postags]
+                         for best_postags in self.tag_sentences(sen_as_token_ids_list)]
     return (best_postags_list, test_tags)
 
   #=====================================================#
   # VITERBI ALGORITHM
   #=====================================================#
-  def tag(self, tokens):
-    LEN_TOKENS = len(tokens)
+  """
+  Tags a list of token id sequences, returning the best POS tag ids in the
+  same order as the sentences. With a sentence cache, only the distinct
+  sentences missing from the cache are tagged, and repeats of a sentence
+  within the list count as cache hits.
+
+  sen_as_token_ids_list    List of token id sequences, as produced by
+                           Tokenizer.tokenize_test_document_to_ids
+
+  return                   List of best POS tag id sequences, each ending
+                           with the id of END_MARKER
+  """
+  def tag_sentences(self, sen_as_token_ids_list):
+    if self.SENTENCE_CACHE is None:
+      return self.tag_uncached_sentences(sen_as_token_ids_list)
+
+    best_postags_list = [None] * len(sen_as_token_ids_list)
+    # Indexes of every sentence missing from the cache, keyed by the bytes of
+    # its token ids: { b'...': [3, 17], ... }
+    uncached_indexes = {}
+    for i in range(len(sen_as_token_ids_list)):
+      key = sen_as_token_ids_list[i].tobytes()
+      if key in uncached_indexes:
+        uncached_indexes[key].append(i)
+        self.SENTENCE_CACHE.add_stats(1, 0, 0)
+        continue
+
+      best_postags = self.SENTENCE_CACHE.get(sen_as_token_ids_list[i])
+      if best_postags is None:
+        uncached_indexes[key] = [i]
+      else:
+        best_postags_list[i] = best_postags
+
+    uncached_sentences = [sen_as_token_ids_list[indexes[0]] for indexes in uncached_indexes.values()]
+    uncached_best_postags_list = self.tag_uncached_sentences(uncached_sentences)
+    for token_ids, indexes, best_postags in zip(uncached_sentences, uncached_indexes.values(), uncached_best_postags_list):
+      self.SENTENCE_CACHE.put(token_ids, best_postags)
+      for i in indexes:
+        best_postags_list[i] = best_postags
+
+    self.SENTENCE_CACHE.flush()
+    return best_postags_list
+
+  # Tags a list of token id sequences, in batches of similar lengths if
+  # BATCH_SIZE > 1, and returns the best POS tag ids in the same order as the sentences
+  def tag_uncached_sentences(self, sen_as_token_ids_list):
+    if self.BATCH_SIZE == 1:
+      if self.STATS is None:
+        return [self.tag(token_ids) for token_ids in sen_as_token_ids_list]
+      return [self.tag_timed(token_ids) for token_ids in sen_as_token_ids_list]
+
+    best_postags_list = [None] * len(sen_as_token_ids_list)
+    for bucket in self.get_length_buckets(sen_as_token_ids_list, self.BATCH_SIZE):
+      start = time.perf_counter() if self.STATS is not None else None
+      best_paths = self.numpy_viterbi.get_best_paths_batch([sen_as_token_ids_list[i] for i in bucket])
+      if self.STATS is not None:
+        # Sentences of a batch are tagged together, so only batches are timed
+        self.STATS.add_stage_time('viterbi', time.perf_counter() - start, len(bucket))
+      for i in range(len(bucket)):
+        # last POS TAG is always an END_MARKER, as in get_best_viterbi_path
+        best_postags_list[bucket[i]] = best_paths[i] + [self.END_TAG_ID]
+    return best_postags_list
+
+  """
+  Groups sentences into buckets of up to BATCH_SIZE sentences, where the token
+  counts within a bucket differ by less than BUCKET_WIDTH.
+
+  sen_as_token_ids_list    List of token id sequences
+  BATCH_SIZE               Maximum number of sentences of a bucket
+
+  return                   List of buckets, each a list of indexes into sen_as_token_ids_list
+  """
+  def get_length_buckets(self, sen_as_token_ids_list, BATCH_SIZE):
+    indexes_by_length = sorted(range(len(sen_as_token_ids_list)), key=lambda i: len(sen_as_token_ids_list[i]))
+
+    buckets = []
+    bucket = []
+    for i in indexes_by_length:
+      if len(bucket) == BATCH_SIZE or \
+         (len(bucket) > 0 and len(sen_as_token_ids_list[i]) - len(sen_as_token_ids_list[bucket[0]]) >= self.BUCKET_WIDTH):
+        buckets.append(bucket)
+        bucket = []
+      bucket.append(i)
+
+    if len(bucket) > 0:
+      buckets.append(bucket)
+    return buckets
+
+  """
+  Computes the confidences of tagged sentences with the forward-backward
+  algorithm, in batches of up to POSTERIOR_BATCH_SIZE sentences of similar
+  lengths, and their K_BEST best taggings if K_BEST > 0. Sentences whose lowest
+  confidence is low are the ones most likely to be mistagged.
+
+  sen_as_token_ids_list    List of token id sequences
+  best_postags_list        List of best POS tag id sequences, as returned by tag_sentences
+
+  return                   List of dictionaries, one per sentence, of the form
+                           { 'confidences': [0.99, 0.87, ...], 'min_confidence': 0.87,
+                             'k_best': [{ 'log_prob': -0.13, 'tags': ['DT', ...] }, ...] }
+                           where the confidences are the posterior probabilities of
+                           the best POS tags of the words of the sentence, and
+                           'k_best' holds the K_BEST best taggings of the words
+                           with their log probabilities, best first
+  """
+  def get_confidences(self, sen_as_token_ids_list, best_postags_list):
+    confidences_list = [None] * len(sen_as_token_ids_list)
+    for bucket in self.get_length_buckets(sen_as_token_ids_list, POSTERIOR_BATCH_SIZE):
+      start = time.perf_counter() if self.STATS is not None else None
+      bucket_token_ids = [sen_as_token_ids_list[i] for i in bucket]
+      posteriors_list, log_totals = self.forward_backward.get_posteriors_batch(bucket_token_ids)
+      if self.K_BEST > 0:
+        k_best_paths = self.k_best_viterbi.get_k_best_paths_batch(bucket_token_ids, self.K_BEST)
+      for i in range(len(bucket)):
+        best_postags = best_postags_list[bucket[i]]
+        posteriors = posteriors_list[i][np.arange(len(best_postags)), best_postags].tolist()
+
+        # Only the words printed by iter_formatted_lines get a confidence
+        confidences = [round(posteriors[j], 6) for j in range(len(best_postags))
+                       if best_postags[j] != self.START_TAG_ID and best_postags[j] != self.END_TAG_ID]
+        confidences_list[bucket[i]] = { 'confidences': confidences, 'min_confidence': min(confidences, default=1.0) }
+        if self.K_BEST > 0:
+          confidences_list[bucket[i]]['k_best'] = self.get_k_best_postags(k_best_paths[i], log_totals[i])
+      if self.STATS is not None:
+        self.STATS.add_stage_time('confidences', time.perf_counter() - start, len(bucket))
+    return confidences_list
+
+  # Best taggings of the words of a sentence, as in get_confidences, from the
+  # paths of NumpyViterbi.get_k_best_paths, where log_total is the log
+  # probability of the sentence
+  def get_k_best_postags(self, paths_with_scores, log_total):
+    log_probs = self.forward_backward.get_path_log_probs(paths_with_scores, log_total)
+    return [{ 'log_prob': round(log_probs[i], 6), 'tags': [self.MODEL.TAGS[k] for k in paths_with_scores[i][0][1:]] }
+            for i in range(len(paths_with_scores))]
+
+  # Tags a token id sequence like tag, adding its time to the stats
+  def tag_timed(self, token_ids):
+    start = time.perf_counter()
+    best_postags = self.tag(token_ids)
+    seconds = time.perf_counter() - start
+    self.STATS.add_stage_time('viterbi', seconds)
+    self.STATS.add_sentence_time(self.MODEL.get_token_strings(token_ids), seconds)
+    return best_postags
+
+  # Tags a token id sequence with the selected Viterbi engine, returning its best POS tag ids
+  def tag(self, token_ids):
+    if self.ENGINE == ENGINE_NUMPY:
+      back_ptrs_and_best_postag_index = self.numpy_viterbi.get_back_ptrs(token_ids)
+      return self.get_best_viterbi_path(back_ptrs_and_best_postag_index[0], back_ptrs_and_best_postag_index[1])
+    if self.ENGINE == ENGINE_CONSTRAINED:
+      # last POS TAG is always an END_MARKER, as in get_best_viterbi_path
+      return self.constrained_viterbi.get_best_path(token_ids) + [self.END_TAG_ID]
+    if self.ENGINE == ENGINE_TRIGRAM:
+      return self.trigram_viterbi.get_best_path(token_ids) + [self.END_TAG_ID]
+    return self.tag_with_python_loop(token_ids)
+
+  def tag_with_python_loop(self, token_ids):
+    LEN_TOKENS = len(token_ids)
     LEN_POSTAG = len(POS_TAGS)
 
     # Initialize memo & backpointers for the best POS tags
@@ -107,14 +533,17 @@ class POSTagger():
 
     # Compute most probable path & store in memo and best_postags arrays
     for i in range(1, LEN_TOKENS):
+      # P(w_i | t_j) of every tag j, looked up once per token
+      emission_column = self.TOKEN_EMISSION_COLUMNS[token_ids[i]].tolist()
+
       for j in range(LEN_POSTAG):
         curr_max = -sys.float_info.max
         back_ptr = -1
 
         for k in range(LEN_POSTAG):
           transition_prob = memo[i - 1][k] + \
-                            self.PROB_TAG_GIVEN_TAG[POS_TAGS[k]][POS_TAGS[j]] + \
-                            self.PROB_WORD_GIVEN_TAG[POS_TAGS[j]][tokens[i]]
+                            self.PROB_TAG_GIVEN_TAG[k][j] + \
+                            emission_column[j]
 
           if transition_prob > curr_max:
             curr_max = transition_prob
@@ -139,10 +568,10 @@ class POSTagger():
     # last POS TAG is always an END_MARKER
     # we can say this because we always add a START_MARKER & END_MARKER between
     # sentences during the tokenization phase of the test set
-    best_pos_tag_sequence = [END_MARKER]
+    best_pos_tag_sequence = [self.END_TAG_ID]
 
     for i in range(LEN_BACK_PTRS): # traversing sentence backwards
-      best_pos_tag_sequence.append(POS_TAGS[back_ptrs[i][best_end_of_sentence_back_ptr]])
+      best_pos_tag_sequence.append(back_ptrs[i][best_end_of_sentence_back_ptr])
       best_end_of_sentence_back_ptr = back_ptrs[i][best_end_of_sentence_back_ptr]
 
     # remember to reverse sequence of best POS tags since we traversed sentence backwards
@@ -151,12 +580,29 @@ class POSTagger():
   #=====================================================#
   # FORMAT TOKENS
   #=====================================================#
-  # Helper function to generate tokens needed for the Viterbi tagger from
+  # Helper function to generate the token ids needed for the Viterbi tagger from
   # sentences in the format of ['<S> The cow...ate grass . <E>', '<S> The man...', ...]
-  def generate_tokens_for_test_doc_sentences(self, sentences, word_vocab):
-    sen_as_tokens_list = [self.tokenizer.tokenize_test_document(sentence, word_vocab) for sentence in sentences]
-    sen_as_tokens_list = [sen_tokens for sen_tokens in sen_as_tokens_list if sen_tokens != []] # remove any empty lists due to empty sentences
-    return sen_as_tokens_list
+  def generate_tokens_for_test_doc_sentences(self, sentences):
+    start = time.perf_counter() if self.STATS is not None else None
+    sen_as_token_ids_list = [self.tokenizer.tokenize_test_document_to_ids(sentence, self.MODEL) for sentence in sentences]
+    sen_as_token_ids_list = [token_ids for token_ids in sen_as_token_ids_list if len(token_ids) > 0] # remove any empty sentences
+    if self.STATS is not None:
+      self.STATS.add_stage_time('normalize', time.perf_counter() - start)
+      self.count_sentences(sen_as_token_ids_list)
+    return sen_as_token_ids_list
+
+  # Counts the sentences, words, unseen & <NUM> words and sentence lengths of
+  # token id sequences in the stats, leaving out the <S> & <E> tokens
+  def count_sentences(self, sen_as_token_ids_list):
+    NUM_ID = self.MODEL.NUM_ID
+    for token_ids in sen_as_token_ids_list:
+      words = token_ids[1:-1]
+      self.STATS.count('sentences')
+      self.STATS.count('tokens', len(words))
+      self.STATS.count('oov_tokens', sum([1 for token_id in words if self.MODEL.is_unseen_token_id(token_id)]))
+      # Without a suffix trie, unseen <NUM> tokens are <UNK> tokens
+      self.STATS.count('num_tokens', words.count(NUM_ID) if NUM_ID != UNK_ID else 0)
+      self.STATS.add_sentence_length(len(words))
 
   """
   Formats the output of the Viterbi POS tagger in this Assignment's output
@@ -164,24 +610,50 @@ class POSTagger():
 
   postags_with_sents    In the format of
                         [[<list_of_best_postags>, <list_of_test_sentences>]],
-                        where <list_of_best_postags> is the list of POS tags
-                        which corresponds to each entry in <list_of_test_sentences>
+                        where <list_of_best_postags> is the list of POS tag
+                        id sequences which corresponds to each entry in
+                        <list_of_test_sentences>, as returned by tag_sentences
 
   return       String in the format
                '<word1>/<tag1> <word2>/<tag2>\n<word3>/<tag3>\n'
   """
   def format_best_postags_and_sentences(self, postags_with_sents):
-    result = ''
     postags = postags_with_sents[0]
-    sentence_tokens = postags_with_sents[1]
+    sentences = postags_with_sents[1]
+    return ''.join(self.iter_formatted_lines(zip(postags, sentences)))
+
+  """
+  Formats tagged sentences one line at a time. Lines which are empty once
+  stripped are left out and the 1st line has no leading whitespace, just as
+  if the whole output had been stripped after every sentence.
 
-    for i in range(len(sentence_tokens)):
-      for j in range(len(sentence_tokens[i])):
-        if (postags[i][j] != START_MARKER and postags[i][j] != END_MARKER):
-          token_postag = sentence_tokens[i][j] + '/' + postags[i][j]
-          result += token_postag + ' '
-      result = result.strip() + '\n'
-    return result
+  postags_with_sentences    Iterable of (best POS tag ids, sentence) pairs, one
+                           per sentence, as yielded by
+                           iter_best_postags_with_sentence_tokens
+
+  return       Generator of strings in the format '<word1>/<tag1> <word2>/<tag2>\n'
+  """
+  def iter_formatted_lines(self, postags_with_sentences):
+    TAGS = self.MODEL.TAGS
+    is_first_line = True
+    has_sentences = False
+    for postags, sentence, *confidences in postags_with_sentences:
+      start = time.perf_counter() if self.STATS is not None else None
+      has_sentences = True
+      sentence_tokens = sentence.split(' ')
+      line = ' '.join([sentence_tokens[j] + '/' + TAGS[postags[j]] for j in range(len(sentence_tokens))
+                       if postags[j] != self.START_TAG_ID and postags[j] != self.END_TAG_ID]).rstrip()
+      if is_first_line:
+        line = line.lstrip()
+      if self.STATS is not None:
+        self.STATS.add_stage_time('format', time.perf_counter() - start)
+      if line != '':
+        is_first_line = False
+        yield line + '\n'
+
+    # An output without any non-empty line is a single '\n'
+    if has_sentences and is_first_line:
+      yield '\n'
 
   #=====================================================#
   # LOAD FILES & INITIALIZE MODEL
@@ -190,8 +662,9 @@ class POSTagger():
     DATA_TEST = open(self.PATH_TO_DATA_TEST).read()
     return self.tokenizer.generate_sentences_from_test_document(DATA_TEST)
 
+  # Loads a binary or pickled model file, see HMMModelFile
   def load_model(self):
-    return pickle.load(open(self.PATH_TO_DATA_MODEL, 'rb'))
+    return HMMModelFile(self.PATH_TO_DATA_MODEL).load(self.MODEL_FORMAT)
 
   #=====================================================#
   # HELPER METHODS
@@ -26,3 +26,11 @@ POS_TAGS = [
   'WDT', 'WP', 'WP$', 'WRB',
   '$', '#', '``', '\'\'', '-LRB-', '-RRB-', ',', '.', ':'
 ]
+
+# Open-class tags, i.e. the tags a word never seen in training can take
+OPEN_CLASS_TAGS = [
+  'CD', 'FW', 'JJ', 'JJR', 'JJS',
+  'NN', 'NNS', 'NNP', 'NNPS',
+  'RB', 'RBR', 'RBS', 'SYM', 'UH',
+  'VB', 'VBD', 'VBG', 'VBN', 'VBP', 'VBZ'
+]
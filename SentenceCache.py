@@ -0,0 +1,126 @@
+# Import standard modules
+import os
+import sqlite3
+import collections
+from array import array
+
+# Define constants
+DEFAULT_CACHE_SIZE = 0 # number of sentences kept in memory, 0 disables the cache
+KEY_FORMAT = 'token-ids' # stored with the fingerprint, so files keyed by the tokens of older versions are cleared
+
+#===========================================================================#
+# SentenceCache
+# BOUNDED LRU CACHE OF TAGGED SENTENCES.
+#
+# Maps the token ids of a sentence, as produced by
+# Tokenizer.tokenize_test_document_to_ids, to its best POS tag ids, evicting
+# the least recently used sentence once MAX_SIZE sentences are held in memory.
+# Both are keyed & stored as the raw bytes of their array('i'). An
+# optional sqlite file keeps every tagged sentence on disk, so later runs
+# with the same FINGERPRINT (model & Viterbi engine) skip sentences tagged
+# before. A disk file written with another FINGERPRINT is cleared on open.
+#===========================================================================#
+class SentenceCache():
+  def __init__(self, MAX_SIZE, PATH_TO_CACHE=None, FINGERPRINT=''):
+    if MAX_SIZE < 1:
+      raise ValueError('MAX_SIZE must be at least 1')
+
+    # Memory tier, in least to most recently used order: { b'...': [0, 8, ...], ... }
+    self.MAX_SIZE = MAX_SIZE
+    self.ENTRIES = collections.OrderedDict()
+
+    # Disk tier, opened lazily by each process since sqlite connections can't cross a fork
+    self.PATH_TO_CACHE = PATH_TO_CACHE
+    self.FINGERPRINT = FINGERPRINT
+    self.connection = None
+    self.connection_pid = None
+
+    # Lookups found in memory or on disk, and lookups found in neither
+    self.HITS = 0
+    self.DISK_HITS = 0
+    self.MISSES = 0
+
+  """
+  Looks up the best POS tag ids of a sentence, in memory then on disk.
+
+  token_ids    array('i') of the token ids of the sentence
+
+  return       List of best POS tag ids, or None if the sentence was never tagged
+  """
+  def get(self, token_ids):
+    key = token_ids.tobytes()
+    postags = self.ENTRIES.get(key)
+    if postags is not None:
+      self.ENTRIES.move_to_end(key)
+      self.HITS += 1
+      return postags
+
+    if self.PATH_TO_CACHE is not None:
+      row = self.get_connection().execute('SELECT postags FROM sentences WHERE tokens = ?',
+                                          (key,)).fetchone()
+      if row is not None:
+        postags = array('i', row[0]).tolist()
+        self.add_to_memory(key, postags)
+        self.HITS += 1
+        self.DISK_HITS += 1
+        return postags
+
+    self.MISSES += 1
+    return None
+
+  # Stores the best POS tag ids of a sentence in memory, and on disk until the next flush
+  def put(self, token_ids, postags):
+    key = token_ids.tobytes()
+    self.add_to_memory(key, postags)
+    if self.PATH_TO_CACHE is not None:
+      self.get_connection().execute('INSERT OR REPLACE INTO sentences VALUES (?, ?)',
+                                    (key, array('i', postags).tobytes()))
+
+  # Commits the sentences stored since the last flush to disk
+  def flush(self):
+    if self.connection is not None and self.connection_pid == os.getpid():
+      self.connection.commit()
+
+  # Returns the lookup counters, e.g. { 'hits': 12, 'disk_hits': 2, 'misses': 3, 'hit_rate': 0.8 }
+  def get_stats(self):
+    lookups = self.HITS + self.MISSES
+    return {
+      'hits': self.HITS,
+      'disk_hits': self.DISK_HITS,
+      'misses': self.MISSES,
+      'hit_rate': float(self.HITS) / lookups if lookups > 0 else 0.0,
+    }
+
+  # Adds lookup counts, e.g. the counts of a forked worker process's copy of this cache
+  def add_stats(self, hits, disk_hits, misses):
+    self.HITS += hits
+    self.DISK_HITS += disk_hits
+    self.MISSES += misses
+
+  def add_to_memory(self, key, postags):
+    self.ENTRIES[key] = postags
+    self.ENTRIES.move_to_end(key)
+    if len(self.ENTRIES) > self.MAX_SIZE:
+      self.ENTRIES.popitem(last=False)
+
+  #=====================================================#
+  # DISK TIER
+  #=====================================================#
+  # Opens the sqlite file in the current process, clearing it if it was written
+  # with another fingerprint or key format
+  def get_connection(self):
+    if self.connection is None or self.connection_pid != os.getpid():
+      connection = sqlite3.connect(self.PATH_TO_CACHE, timeout=60)
+      connection.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)')
+      connection.execute('CREATE TABLE IF NOT EXISTS sentences (tokens BLOB PRIMARY KEY, postags BLOB)')
+
+      FINGERPRINT = KEY_FORMAT + ':' + self.FINGERPRINT
+      row = connection.execute("SELECT value FROM meta WHERE name = 'fingerprint'").fetchone()
+      if row is None or row[0] != FINGERPRINT:
+        connection.execute('DELETE FROM sentences')
+        connection.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (FINGERPRINT,))
+      connection.commit()
+
+      self.connection = connection
+      self.connection_pid = os.getpid()
+    return self.connection
@@ -0,0 +1,354 @@
+# Import standard modules
+import os
+import json
+import time
+import stat
+import signal
+import asyncio
+import collections
+import concurrent.futures
+
+# Import custom modules
+from Tokenizer import Tokenizer
+from POSTagger import POSTagger
+
+# Define constants
+DEFAULT_MAX_BATCH_SENTENCES = 256 # sentences of queued requests tagged together
+DEFAULT_MAX_BATCH_DELAY = 0.005 # seconds a request waits for other requests to join its batch
+MAX_REQUEST_BYTES = 64 * 1024 * 1024 # largest accepted request body
+LATENCY_WINDOW = 10000 # number of most recent requests the latency percentiles are computed on
+LATENCY_PERCENTILES = [50, 90, 99]
+SHUTDOWN_TIMEOUT = 30 # seconds requests in flight are given to finish on shutdown
+HTTP_REASONS = {
+  200: 'OK',
+  400: 'Bad Request',
+  404: 'Not Found',
+  405: 'Method Not Allowed',
+  413: 'Payload Too Large',
+  500: 'Internal Server Error',
+}
+
+#===========================================================================#
+# TaggingServer
+# RESIDENT TAGGING DAEMON SERVING HTTP OVER TCP OR A UNIX SOCKET.
+#
+# The model is loaded once and kept warm. Requests are queued, and the
+# sentences of requests arriving within MAX_BATCH_DELAY of each other are
+# tagged together, up to MAX_BATCH_SENTENCES, by a single call to
+# POSTagger.tag_chunks on a tagging thread, so the event loop keeps
+# accepting requests while a batch is tagged.
+#
+#   POST /tag       body is a test document, one sentence per line, and the
+#                   response is its tagged output, as run_tagger.py writes it
+#   GET  /stats     JSON latency percentiles, batch sizes & model info
+#   POST /reload    reloads the model from the model file the server was
+#                   started with, ignoring the body, so clients can't make
+#                   the server load (and unpickle) files of their choosing;
+#                   requests keep being served by the old model until the
+#                   new one is loaded, and a failed reload keeps the old one
+#
+# SIGHUP reloads the model, SIGINT & SIGTERM stop accepting connections and
+# finish the requests in flight before exiting.
+#===========================================================================#
+class TaggingServer():
+  def __init__(self, PATH_TO_DATA_MODEL, TAGGER_OPTIONS={}, MAX_BATCH_SENTENCES=DEFAULT_MAX_BATCH_SENTENCES,
+               MAX_BATCH_DELAY=DEFAULT_MAX_BATCH_DELAY):
+    if MAX_BATCH_SENTENCES < 1:
+      raise ValueError('MAX_BATCH_SENTENCES must be at least 1')
+    if MAX_BATCH_DELAY < 0:
+      raise ValueError('MAX_BATCH_DELAY must not be negative')
+    print("== [TaggingServer instantiated] ==")
+
+    # Keyword arguments of the POSTagger built on every (re)load, e.g. { 'ENGINE': 'numpy', ... }
+    self.TAGGER_OPTIONS = dict(TAGGER_OPTIONS)
+    self.MAX_BATCH_SENTENCES = MAX_BATCH_SENTENCES
+    self.MAX_BATCH_DELAY = MAX_BATCH_DELAY
+
+    self.tokenizer = Tokenizer()
+    self.PATH_TO_DATA_MODEL = PATH_TO_DATA_MODEL
+    self.tagger = self.load_tagger(PATH_TO_DATA_MODEL)
+    self.MODEL_LOADED_AT = time.time()
+
+    # Seconds between reading each request & having its response ready, of the
+    # LATENCY_WINDOW most recent requests
+    self.LATENCIES = collections.deque(maxlen=LATENCY_WINDOW)
+    self.START_TIME = time.time()
+    self.REQUESTS = 0
+    self.ERRORS = 0
+    self.RELOADS = 0
+    self.BATCHES = 0
+    self.BATCHED_REQUESTS = 0
+    self.BATCHED_SENTENCES = 0
+
+    # Set up when serving, since they belong to the event loop
+    self.queue = None
+    self.reload_lock = None
+    self.connection_tasks = set()
+    # POSTagger isn't thread safe, so every batch is tagged on the same thread
+    self.tagging_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+  # Builds a POSTagger, loading its model, for the model file at PATH_TO_DATA_MODEL
+  def load_tagger(self, PATH_TO_DATA_MODEL):
+    return POSTagger(None, PATH_TO_DATA_MODEL, **self.TAGGER_OPTIONS)
+
+  #=====================================================#
+  # SERVING
+  #=====================================================#
+  """
+  Serves requests until SIGINT or SIGTERM.
+
+  HOST, PORT     TCP address to listen on, used if PATH_TO_SOCKET is None
+  PATH_TO_SOCKET Path of a Unix socket to listen on instead
+  """
+  def serve(self, HOST=None, PORT=None, PATH_TO_SOCKET=None):
+    asyncio.run(self.serve_until_stopped(HOST, PORT, PATH_TO_SOCKET))
+
+  async def serve_until_stopped(self, HOST, PORT, PATH_TO_SOCKET):
+    loop = asyncio.get_running_loop()
+    self.queue = asyncio.Queue()
+    self.reload_lock = asyncio.Lock()
+    stopped = asyncio.Event()
+
+    if PATH_TO_SOCKET is not None:
+      # A socket file left behind by a server that was killed would fail the bind
+      if os.path.exists(PATH_TO_SOCKET) and stat.S_ISSOCK(os.stat(PATH_TO_SOCKET).st_mode):
+        os.remove(PATH_TO_SOCKET)
+      server = await asyncio.start_unix_server(self.handle_connection, path=PATH_TO_SOCKET)
+      address = PATH_TO_SOCKET
+    else:
+      server = await asyncio.start_server(self.handle_connection, HOST, PORT)
+      address = 'http://' + HOST + ':' + str(server.sockets[0].getsockname()[1])
+
+    loop.add_signal_handler(signal.SIGINT, stopped.set)
+    loop.add_signal_handler(signal.SIGTERM, stopped.set)
+    loop.add_signal_handler(signal.SIGHUP, lambda: loop.create_task(self.reload_on_signal()))
+    batcher = loop.create_task(self.batch_requests())
+    print("=== SERVING ON " + address + " ===", flush=True)
+
+    await stopped.wait()
+    print("=== SHUTTING DOWN, FINISHING", len(self.connection_tasks), "REQUESTS IN FLIGHT ===", flush=True)
+    server.close()
+    if len(self.connection_tasks) > 0:
+      await asyncio.wait(list(self.connection_tasks), timeout=SHUTDOWN_TIMEOUT)
+    batcher.cancel()
+    self.tagging_executor.shutdown()
+    if PATH_TO_SOCKET is not None and os.path.exists(PATH_TO_SOCKET):
+      os.remove(PATH_TO_SOCKET)
+
+  # Reads a request from a connection, answers it & closes the connection
+  async def handle_connection(self, reader, writer):
+    task = asyncio.current_task()
+    self.connection_tasks.add(task)
+    try:
+      status, content_type, body = await self.handle_request(reader)
+      if status != 200:
+        self.ERRORS += 1
+      head = 'HTTP/1.1 ' + str(status) + ' ' + HTTP_REASONS[status] + '\r\n' + \
+             'Content-Type: ' + content_type + '\r\n' + \
+             'Content-Length: ' + str(len(body)) + '\r\n' + \
+             'Connection: close\r\n\r\n'
+      writer.write(head.encode('latin-1') + body)
+      await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+      # The client went away before the response was sent
+      pass
+    finally:
+      writer.close()
+      self.connection_tasks.discard(task)
+
+  """
+  Parses an HTTP request & routes it.
+
+  reader    asyncio.StreamReader of the connection
+
+  return    Tuple of (HTTP status, content type, response body as bytes)
+  """
+  async def handle_request(self, reader):
+    request_line = (await reader.readline()).decode('latin-1').split()
+    if len(request_line) != 3:
+      return self.get_error_response(400, 'Malformed request line')
+    method = request_line[0]
+    path = request_line[1]
+
+    headers = {}
+    while True:
+      line = await reader.readline()
+      if line in (b'\r\n', b'\n', b''):
+        break
+      name, separator, value = line.decode('latin-1').partition(':')
+      headers[name.strip().lower()] = value.strip()
+
+    try:
+      content_length = int(headers.get('content-length', '0'))
+    except ValueError:
+      return self.get_error_response(400, 'Malformed Content-Length')
+    if content_length < 0:
+      return self.get_error_response(400, 'Malformed Content-Length')
+    if content_length > MAX_REQUEST_BYTES:
+      return self.get_error_response(413, 'Request body exceeds ' + str(MAX_REQUEST_BYTES) + ' bytes')
+    try:
+      body = (await reader.readexactly(content_length)).decode('utf-8')
+    except UnicodeDecodeError:
+      return self.get_error_response(400, 'Request body is not UTF-8')
+
+    if path == '/tag':
+      if method != 'POST':
+        return self.get_error_response(405, 'Use POST /tag')
+      try:
+        output = await self.tag_document(body)
+      except Exception as error:
+        return self.get_error_response(500, 'Tagging failed: ' + str(error))
+      return (200, 'text/plain; charset=utf-8', output.encode('utf-8'))
+    if path == '/stats':
+      if method != 'GET':
+        return self.get_error_response(405, 'Use GET /stats')
+      return (200, 'application/json', json.dumps(self.get_stats(), indent=2).encode('utf-8'))
+    if path == '/reload':
+      if method != 'POST':
+        return self.get_error_response(405, 'Use POST /reload')
+      try:
+        result = await self.reload(self.PATH_TO_DATA_MODEL)
+      except Exception as error:
+        return self.get_error_response(500, 'Reload failed, still serving ' + self.PATH_TO_DATA_MODEL + ': ' + str(error))
+      return (200, 'application/json', json.dumps(result).encode('utf-8'))
+    return self.get_error_response(404, 'Unknown path ' + path)
+
+  def get_error_response(self, status, message):
+    return (status, 'text/plain; charset=utf-8', (message + '\n').encode('utf-8'))
+
+  #=====================================================#
+  # MICRO-BATCHING
+  #=====================================================#
+  # Queues the sentences of a document for the next batch & waits for its tagged output
+  async def tag_document(self, doc_string):
+    start = time.perf_counter()
+    sentences = self.tokenizer.generate_sentences_from_test_document(doc_string)
+    future = asyncio.get_running_loop().create_future()
+    await self.queue.put((sentences, future))
+    output = await future
+    self.REQUESTS += 1
+    self.LATENCIES.append(time.perf_counter() - start)
+    return output
+
+  # Collects queued requests into batches of up to MAX_BATCH_SENTENCES sentences,
+  # waiting up to MAX_BATCH_DELAY after the 1st request of a batch, & tags them
+  async def batch_requests(self):
+    loop = asyncio.get_running_loop()
+    while True:
+      batch = [await self.queue.get()]
+      num_sentences = len(batch[0][0])
+      deadline = loop.time() + self.MAX_BATCH_DELAY
+      while num_sentences < self.MAX_BATCH_SENTENCES:
+        if self.queue.empty():
+          timeout = deadline - loop.time()
+          if timeout <= 0:
+            break
+          try:
+            request = await asyncio.wait_for(self.queue.get(), timeout)
+          except asyncio.TimeoutError:
+            break
+        else:
+          request = self.queue.get_nowait()
+        batch.append(request)
+        num_sentences += len(request[0])
+
+      # A reload swaps self.tagger, batches already sent keep the tagger they started with
+      tagger = self.tagger
+      try:
+        outputs = await loop.run_in_executor(self.tagging_executor, self.tag_batch, tagger,
+                                             [request[0] for request in batch])
+      except Exception as error:
+        for request in batch:
+          if not request[1].done():
+            request[1].set_exception(error)
+        continue
+
+      self.BATCHES += 1
+      self.BATCHED_REQUESTS += len(batch)
+      self.BATCHED_SENTENCES += num_sentences
+      for request, output in zip(batch, outputs):
+        if not request[1].done():
+          request[1].set_result(output)
+
+  # Tags the sentences of a batch of documents on the tagging thread & returns
+  # the formatted output of each document
+  def tag_batch(self, tagger, chunks):
+    return [''.join(tagger.iter_formatted_lines(tagged_chunk)) for tagged_chunk in tagger.tag_chunks(chunks)]
+
+  #=====================================================#
+  # MODEL RELOAD
+  #=====================================================#
+  """
+  Loads a model on a separate thread & swaps it in once loaded. Requests are
+  served by the old model meanwhile, and an exception leaves it in place.
+
+  PATH_TO_DATA_MODEL    Path of the model file to load
+
+  return                Dictionary in the format { 'model': 'model_file', 'seconds': 0.03 }
+  """
+  async def reload(self, PATH_TO_DATA_MODEL):
+    async with self.reload_lock:
+      print("=== RELOADING MODEL FROM " + PATH_TO_DATA_MODEL + " ===", flush=True)
+      start = time.perf_counter()
+      try:
+        tagger = await asyncio.get_running_loop().run_in_executor(None, self.load_tagger, PATH_TO_DATA_MODEL)
+      except Exception as error:
+        print("=== RELOAD FAILED, STILL SERVING " + self.PATH_TO_DATA_MODEL + ":", error, "===", flush=True)
+        raise
+      self.tagger = tagger
+      self.PATH_TO_DATA_MODEL = PATH_TO_DATA_MODEL
+      self.MODEL_LOADED_AT = time.time()
+      self.RELOADS += 1
+      seconds = time.perf_counter() - start
+      print("=== MODEL RELOADED IN %.3f SECONDS ===" % seconds, flush=True)
+      return { 'model': PATH_TO_DATA_MODEL, 'seconds': seconds }
+
+  # Reloads the model from its current path on SIGHUP, keeping the old model if that fails
+  async def reload_on_signal(self):
+    try:
+      await self.reload(self.PATH_TO_DATA_MODEL)
+    except Exception:
+      # reload already reported the error
+      pass
+
+  #=====================================================#
+  # STATS
+  #=====================================================#
+  """
+  Summarizes the requests served so far.
+
+  return    Dictionary in the format
+            { 'requests': 120, 'errors': 0, 'uptime_seconds': 61.2,
+              'latency_seconds': { 'p50': 0.004, 'p90': 0.01, 'p99': 0.03, 'max': 0.05 },
+              'batches': 40, 'mean_batch_requests': 3.0, 'mean_batch_sentences': 12.5,
+              'queued_requests': 0, 'model': 'model_file', 'model_loaded_at': 1700000000.0,
+              'reloads': 0, 'sentence_cache': { 'hits': ..., ... } }
+  """
+  def get_stats(self):
+    latencies = sorted(self.LATENCIES)
+    latency_seconds = {}
+    for percentile in LATENCY_PERCENTILES:
+      latency_seconds['p' + str(percentile)] = self.get_percentile(latencies, percentile)
+    latency_seconds['max'] = latencies[-1] if len(latencies) > 0 else None
+
+    return {
+      'requests': self.REQUESTS,
+      'errors': self.ERRORS,
+      'uptime_seconds': time.time() - self.START_TIME,
+      'latency_seconds': latency_seconds,
+      'batches': self.BATCHES,
+      'mean_batch_requests': float(self.BATCHED_REQUESTS) / self.BATCHES if self.BATCHES > 0 else None,
+      'mean_batch_sentences': float(self.BATCHED_SENTENCES) / self.BATCHES if self.BATCHES > 0 else None,
+      'queued_requests': self.queue.qsize() if self.queue is not None else 0,
+      'model': self.PATH_TO_DATA_MODEL,
+      'model_loaded_at': self.MODEL_LOADED_AT,
+      'reloads': self.RELOADS,
+      'sentence_cache': self.tagger.SENTENCE_CACHE.get_stats() if self.tagger.SENTENCE_CACHE is not None else None,
+    }
+
+  # Nearest-rank percentile of a sorted list, None if it is empty
+  def get_percentile(self, sorted_values, percentile):
+    if len(sorted_values) == 0:
+      return None
+    rank = max(1, -(-percentile * len(sorted_values) // 100))
+    return sorted_values[rank - 1]
@@ -2,6 +2,7 @@
 import string
 import re
 import math
+from array import array
 
 # Import custom modules
 from PennTreebankPOSTags import START_MARKER
@@ -13,6 +14,13 @@ UNK = '<UNK>' # symbol representing out-of-vocabulary words
 NUM_SYMBOL = '<NUM>' # symbol representing numerics
 NUM_SYMBOL_REGEX = r'^(\d+[.,\-]*\d*)+$' # regex pattern to detect NUM_SYMBOL
 
+# Precompiled matcher of the tokens NUM_SYMBOL_REGEX matches. Both patterns
+# match a digit followed by digits, '.', ',' and '-', but this one has no
+# nested repetition, so it runs in linear time instead of backtracking
+# exponentially on long digit strings such as '11111111111111111111a'.
+# Every match starts with a digit, so callers test token[:1].isdecimal() 1st.
+NUM_SYMBOL_MATCHER = re.compile(r'\d[\d.,\-]*$').match
+
 #===========================================================================#
 # Tokenizer
 # Tokenizes the training set and test set sentences into token formats that
@@ -29,19 +37,75 @@ class Tokenizer():
     sentences = self.get_sentences(doc_string)
     return self.insert_start_end_sentence_tokens(sentences)
 
+  # Lazily reads the sentences of a test file object, one per line, and yields
+  # them like generate_sentences_from_test_document without reading the whole file
+  def iter_sentences_from_test_file(self, test_file):
+    for line in test_file:
+      sentence = line[:-1] if line.endswith('\n') else line
+      if len(sentence) > 0:
+        yield self.insert_start_end_sentence_tokens([sentence])[0]
+
   """
   Tokenizes a string for the Test set.
 
-  doc_string    String of the document to tokenize
+  doc_string          String of the document to tokenize
+  KEEP_UNSEEN_WORDS   Whether words outside the vocabulary are kept, as in
+                      normalize_test_tokens
 
   return    List of tokens split according to the RegEX rules
   """
-  def tokenize_test_document(self, doc_string, word_vocab):
-    doc_tokens = self.get_test_data_tokens(doc_string)
-    doc_tokens = self.replace_numeric_tokens_with_NUM_SYMBOL(doc_tokens)
-    doc_tokens = self.replace_unseen_tokens_with_UNK(doc_tokens, word_vocab)
+  def tokenize_test_document(self, doc_string, word_vocab, KEEP_UNSEEN_WORDS=False):
+    doc_tokens = self.normalize_test_tokens(self.get_test_data_tokens(doc_string), word_vocab, KEEP_UNSEEN_WORDS)
     return self.remove_empty_sentence_at_end(doc_tokens)
 
+  """
+  Tokenizes a string for the Test set straight into token ids, as a compact
+  array('i'): seen words map to their id with a single dictionary lookup,
+  numerics to the <NUM> id and unseen words to their id in the model, so no
+  normalized token list is built. Gives the token ids of the tokens of
+  tokenize_test_document, with the model's unseen words kept.
+
+  doc_string    String of the document to tokenize
+  model         HMMModel, mapping tokens to ids: TOKEN_TO_ID, NUM_ID & get_token_id
+
+  return        array('i') of token ids
+  """
+  def tokenize_test_document_to_ids(self, doc_string, model):
+    tokens = self.remove_empty_sentence_at_end(self.get_test_data_tokens(doc_string))
+    token_to_id = model.TOKEN_TO_ID
+    token_ids = [token_to_id.get(token, -1) for token in tokens]
+    if -1 in token_ids:
+      for i in range(len(token_ids)):
+        if token_ids[i] == -1:
+          token = tokens[i]
+          token_ids[i] = model.NUM_ID if token[:1].isdecimal() and NUM_SYMBOL_MATCHER(token) else model.get_token_id(token)
+    return array('i', token_ids)
+
+  """
+  Replaces numerics with <NUM> and then words outside the vocabulary with
+  <UNK>, in a single pass over the tokens. Gives the same tokens as
+  replace_numeric_tokens_with_NUM_SYMBOL followed by
+  replace_unseen_tokens_with_UNK.
+
+  tokens              List of tokens
+  word_vocab          Container of the seen words, e.g. a Dictionary keyed by word
+  KEEP_UNSEEN_WORDS   Whether words outside the vocabulary are kept as they
+                      are instead of replaced with <UNK>, for models which
+                      estimate the emissions of each unseen word from its suffix
+
+  return        List of normalized tokens
+  """
+  def normalize_test_tokens(self, tokens, word_vocab, KEEP_UNSEEN_WORDS=False):
+    if KEEP_UNSEEN_WORDS:
+      return [NUM_SYMBOL if token[:1].isdecimal() and NUM_SYMBOL_MATCHER(token) else token for token in tokens]
+
+    result = []
+    for token in tokens:
+      if token[:1].isdecimal() and NUM_SYMBOL_MATCHER(token):
+        token = NUM_SYMBOL
+      result.append(token if token in word_vocab else UNK)
+    return result
+
   # Removes the 'S' and 'E' at the back of [...'<S>', '', '<E>'].
   # This occurs when we have an extra sentence at the last line in a file
   def remove_empty_sentence_at_end(self, tokens):
@@ -79,7 +143,8 @@ class Tokenizer():
     else:
       return token
 
-  # Replace numbers in vocabulary with <NUM>
+  # Replace numbers in vocabulary with <NUM>. Reference for normalize_test_tokens,
+  # which replaces numerics & unseen words in 1 pass.
   def replace_numeric_tokens_with_NUM_SYMBOL(self, tokens):
     result = []
     for token in tokens:
@@ -113,6 +178,23 @@ class Tokenizer():
     doc_str_with_S_E_tags = self.flatten_list_of_sentences(sentences_S_E_tags)
     return self.get_train_data_tokens(doc_str_with_S_E_tags)
 
+  """
+  Lazily reads the sentences of a labelled training file object, one per line,
+  and yields their (word, tag) pairs. The pairs are the same as those of
+  get_pairs_of_word_tags on tokenize_document of the whole file, but the file
+  is never held in memory, nor joined into a single document string.
+
+  train_file    Text file object of sentences in the format 'As/IN part/NN ...'
+
+  return        Generator of pairs in the format ['its', 'PRP$'], ['to', 'TO'] ...
+  """
+  def iter_word_postag_pairs_from_training_file(self, train_file):
+    for line in train_file:
+      sentence = line[:-1] if line.endswith('\n') else line
+      if len(sentence) > 0:
+        for word_postag_pair in self.get_pairs_of_word_tags(self.insert_start_end_sentence_tags([sentence])[0].split(' ')):
+          yield word_postag_pair
+
   # Terms in training data are separated by spaces, so this splits them
   def get_train_data_tokens(self, doc_string_with_S_E_tags):
     return doc_string_with_S_E_tags.split(' ')
@@ -145,19 +227,20 @@ class Tokenizer():
   return    List of token pairs [['perhaps', 'RB'], ['forced', 'VBN'] ...]
   """
   def get_pairs_of_word_tags(self, list_of_str_postag):
-    return [self.__convert_to_word_postag_pair(str_postag) for str_postag in list_of_str_postag if len(str_postag) > 0]
-
-  # Converts a 'perhaps/RB' string to ['perhaps', 'RB']
-  def __convert_to_word_postag_pair(self, str_postag):
-    str_postag_pair = str_postag.rsplit('/', 1)
-
-    # RULES FOR TOKENS WE SEE DURING TRAINING
-    # This checks if a token is in our defined numeric format by using RegEx
-    # and replaces that token with an arbitrary symbol defined at the top of this code
-    if re.match(NUM_SYMBOL_REGEX, str_postag_pair[0]):
-      return [NUM_SYMBOL, str_postag_pair[1]]
-    else:
-      return [str_postag_pair[0], str_postag_pair[1]]
+    pairs = []
+    for str_postag in list_of_str_postag:
+      if len(str_postag) > 0:
+        str_postag_pair = str_postag.rsplit('/', 1)
+
+        # RULES FOR TOKENS WE SEE DURING TRAINING
+        # This checks if a token is in our defined numeric format, as in
+        # normalize_test_tokens, and replaces that token with an arbitrary
+        # symbol defined at the top of this code
+        word = str_postag_pair[0]
+        if word[:1].isdecimal() and NUM_SYMBOL_MATCHER(word):
+          word = NUM_SYMBOL
+        pairs.append([word, str_postag_pair[1]])
+    return pairs
 
   #=====================================================#
   # TOKENIZER FOR CROSS VALIDATOR
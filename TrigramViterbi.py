@@ -0,0 +1,121 @@
+# Import standard modules
+import sys
+from math import log
+
+# Import custom modules
+from PennTreebankPOSTags import START_MARKER, END_MARKER
+from ConstrainedViterbi import ConstrainedViterbi, UNK_TAGS_OPEN_CLASS
+
+# Define constants
+DEFAULT_BEAM = log(1000) # states less likely than the best one by this log factor are pruned
+
+#===========================================================================#
+# TrigramViterbi
+# Second-order Viterbi engine for POSTagger.
+#
+# The states of a token are (t_i-1, t_i) tag pairs, scored with the trigram
+# transitions P(t_i | t_i-2, t_i-1) of the model. A full second-order
+# recurrence costs (tags x tags x tags) per token, so the state space is
+# pruned twice: tokens only take the POS tags of the tag dictionary, as in
+# ConstrainedViterbi, and after every token the states scoring below the best
+# one by more than BEAM are dropped, as in TnT. A sentence starts in the
+# (<E>, <S>) state, the tags around a sentence boundary in training.
+#===========================================================================#
+class TrigramViterbi(ConstrainedViterbi):
+  def __init__(self, model, UNK_TAGS=UNK_TAGS_OPEN_CLASS, BEAM=DEFAULT_BEAM):
+    if model.TRIGRAM_TRANSITIONS is None:
+      raise ValueError('The model has no trigram transitions, build it with --trigram')
+    if BEAM is not None and BEAM <= 0:
+      raise ValueError('BEAM must be positive, or None to disable pruning')
+
+    # Tag dictionary of the seen tags of every word & of <UNK>
+    ConstrainedViterbi.__init__(self, model, UNK_TAGS)
+
+    # Matrix representing P(t_i | t_i-2, t_i-1) as lists, where axes: t_i-2, t_i-1, t_i
+    self.TRIGRAM_TRANSITIONS = model.TRIGRAM_TRANSITIONS.tolist()
+
+    # Log factor below the best state beyond which states are pruned, None keeps every state
+    self.BEAM = BEAM
+
+    self.START_TAG_ID = model.TAG_TO_ID[START_MARKER]
+    self.END_TAG_ID = model.TAG_TO_ID[END_MARKER]
+
+  """
+  Computes the best POS tag path of a sentence with the second-order HMM.
+  Ties are broken towards the earliest state, like the strict '>'
+  comparison in POSTagger.tag.
+
+  token_ids    Token ids of the sentence, e.g. an array('i'), starting with '<S>'
+
+  return    Best POS tag index path. As in POSTagger.get_best_viterbi_path, it
+            covers every token but the last one, which is always tagged
+            END_MARKER.
+  """
+  def get_best_path(self, token_ids):
+    LEN_TOKENS = len(token_ids)
+
+    # States of the current token as parallel lists of t_i-1, t_i & their log
+    # probabilities. '<S>' has a single state with probability 1 (log 0)
+    prev_tag_ids = [self.END_TAG_ID]
+    tag_ids = [self.START_TAG_ID]
+    memo = [0]
+
+    # t_i of each token's states, and back pointers into the previous token's states
+    tag_ids_per_token = [tag_ids]
+    back_ptrs = [None]
+
+    for i in range(1, LEN_TOKENS):
+      next_tag_ids, emissions = self.get_token_tags(token_ids[i])
+
+      # States of the previous token grouped by their t_i, which becomes the
+      # t_i-1 of the next states: { t_i: [state indexes], ... }
+      states_by_tag_id = {}
+      for k in range(len(memo)):
+        states_by_tag_id.setdefault(tag_ids[k], []).append(k)
+
+      next_prev_tag_ids = []
+      next_memo = []
+      next_back_ptrs = []
+      for tag_id, states in states_by_tag_id.items():
+        curr_maxes = [-sys.float_info.max] * len(next_tag_ids)
+        curr_back_ptrs = [-1] * len(next_tag_ids)
+        for k in states:
+          score = memo[k]
+          transitions = self.TRIGRAM_TRANSITIONS[prev_tag_ids[k]][tag_id]
+          for j in range(len(next_tag_ids)):
+            transition_prob = score + transitions[next_tag_ids[j]]
+            if transition_prob > curr_maxes[j]:
+              curr_maxes[j] = transition_prob
+              curr_back_ptrs[j] = k
+
+        for j in range(len(next_tag_ids)):
+          next_prev_tag_ids.append(tag_id)
+          next_memo.append(curr_maxes[j] + emissions[j])
+          next_back_ptrs.append(curr_back_ptrs[j])
+
+      states_tag_ids = next_tag_ids * len(states_by_tag_id)
+
+      # Beam pruning, keeping the states within BEAM of the best one in order
+      if self.BEAM is not None:
+        threshold = max(next_memo) - self.BEAM
+        kept = [k for k in range(len(next_memo)) if next_memo[k] >= threshold]
+        if len(kept) < len(next_memo):
+          next_prev_tag_ids = [next_prev_tag_ids[k] for k in kept]
+          next_memo = [next_memo[k] for k in kept]
+          next_back_ptrs = [next_back_ptrs[k] for k in kept]
+          states_tag_ids = [states_tag_ids[k] for k in kept]
+
+      prev_tag_ids = next_prev_tag_ids
+      tag_ids = states_tag_ids
+      memo = next_memo
+      tag_ids_per_token.append(tag_ids)
+      back_ptrs.append(next_back_ptrs)
+
+    # Traverse the sentence backwards from the best state of its last token
+    best_k = max(range(len(memo)), key=memo.__getitem__)
+    path = []
+    for i in range(LEN_TOKENS - 1, 0, -1):
+      best_k = back_ptrs[i][best_k]
+      path.append(tag_ids_per_token[i - 1][best_k])
+
+    return list(reversed(path))
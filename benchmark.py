@@ -0,0 +1,279 @@
+# Import standard modules
+import gc
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import resource
+import contextlib
+import tracemalloc
+
+# Import third-party modules
+import numpy as np
+
+# Import custom modules
+from PennTreebankPOSTags import OPEN_CLASS_TAGS
+from Tokenizer import Tokenizer
+from HMMProbGenerator import HMMProbGenerator
+from HMMModelFile import HMMModelFile, MODEL_FORMAT_BINARY, MODEL_FORMAT_PICKLE
+from POSTagModelTrainer import POSTagModelTrainer
+from POSTagger import POSTagger, ENGINES, ENGINE_NUMPY
+
+#===========================================================================#
+# BENCHMARK
+# TIMES TRAINING, MODEL SAVING & LOADING AND TAGGING ON A SYNTHETIC CORPUS.
+#
+# The corpus is sampled from the sentences of a labelled seed corpus, e.g.
+# sents.devt, to any number of sentences, with a fixed random seed. Open-class
+# words are sometimes renamed to new words, so the vocabulary grows with the
+# corpus like it does in real text. Every stage is timed separately (best of
+# --repeats runs) and its peak memory is traced in 1 more run. The results are
+# written as JSON, and compared with a baseline JSON file if one is given.
+#===========================================================================#
+DEFAULT_PATH_TO_SEED = 'sents.devt'
+DEFAULT_PATH_TO_BASELINE = 'benchmark_baseline.json'
+DEFAULT_SENTENCES = 20000 # number of sentences of the synthetic corpus
+DEFAULT_TEST_FRACTION = 0.1 # fraction of the synthetic corpus tagged, the rest is trained on
+DEFAULT_NEW_WORD_RATE = 0.05 # probability of renaming an open-class word to a new word
+DEFAULT_SEED = 0
+DEFAULT_REPEATS = 5 # the best of this many runs is reported
+DEFAULT_TOLERANCE = 0.25 # slowdown relative to the baseline reported as a regression
+MIN_REGRESSION_SECONDS = 0.02 # slowdowns of fewer seconds are timer noise, never regressions
+
+# Stages, in running order
+STAGES = ['count', 'generate_probs', 'save_binary', 'load_binary', 'save_pickle', 'load_pickle',
+          'tokenize', 'tag', 'format']
+
+"""
+Samples a synthetic labelled corpus from the sentences of a seed corpus.
+
+seed_sentences    List of labelled sentences, e.g. ['As/IN part/NN ...', ...]
+NUM_SENTENCES     Number of sentences to generate
+SEED              Seed of the random generator, the same seed gives the same corpus
+NEW_WORD_RATE     Probability of renaming a word with an open-class tag to a
+                  new word, out of about NUM_SENTENCES new words
+
+return            List of labelled sentences
+"""
+def generate_corpus(seed_sentences, NUM_SENTENCES, SEED=DEFAULT_SEED, NEW_WORD_RATE=DEFAULT_NEW_WORD_RATE):
+  random_generator = random.Random(SEED)
+  open_class_tags = set(OPEN_CLASS_TAGS)
+
+  sentences = []
+  for i in range(NUM_SENTENCES):
+    str_postags = random_generator.choice(seed_sentences).split(' ')
+    for j in range(len(str_postags)):
+      str_postag_pair = str_postags[j].rsplit('/', 1)
+      if len(str_postag_pair) == 2 and str_postag_pair[1] in open_class_tags and random_generator.random() < NEW_WORD_RATE:
+        new_word = str_postag_pair[0] + '_' + str(random_generator.randrange(NUM_SENTENCES))
+        str_postags[j] = new_word + '/' + str_postag_pair[1]
+    sentences.append(' '.join(str_postags))
+  return sentences
+
+# Calls function without printing its progress messages
+def run_quietly(function):
+  with contextlib.redirect_stdout(io.StringIO()):
+    return function()
+
+"""
+Times a stage. It runs REPEATS times untraced with the garbage collector off,
+as timeit does, keeping the best time, then once more under tracemalloc to
+find its peak memory.
+
+function    Function running the stage, its result is returned
+items       Number of items (e.g. tokens) the stage processes, for its throughput
+REPEATS     Number of timed runs
+
+return      2-tuple of the stage's result and its Dictionary of measurements
+"""
+def time_stage(function, items, REPEATS):
+  best_time = None
+  for i in range(REPEATS):
+    gc.collect()
+    gc.disable()
+    try:
+      start = time.perf_counter()
+      result = run_quietly(function)
+      elapsed = time.perf_counter() - start
+    finally:
+      gc.enable()
+    best_time = elapsed if best_time is None else min(best_time, elapsed)
+
+  tracemalloc.start()
+  run_quietly(function)
+  peak_memory = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+
+  return (result, {
+    'seconds': best_time,
+    'items': items,
+    'items_per_sec': items / best_time if best_time > 0 else None,
+    'peak_memory_mb': peak_memory / 1e6,
+  })
+
+"""
+Runs every stage on a synthetic corpus.
+
+return    Dictionary of results, in the format
+          { 'config': {...}, 'environment': {...}, 'corpus': {...},
+            'stages': { 'tag': { 'seconds': 1.2, 'items': ..., ... }, ... } }
+"""
+def run_benchmark(args):
+  tokenizer = run_quietly(Tokenizer)
+  seed_sentences = tokenizer.get_sentences(open(args.PATH_TO_SEED).read())
+  sentences = generate_corpus(seed_sentences, args.sentences, args.seed, args.new_word_rate)
+
+  NUM_TEST_SENTENCES = max(1, int(len(sentences) * args.test_fraction))
+  train_sentences = sentences[:-NUM_TEST_SENTENCES]
+  test_sentences = tokenizer.insert_start_end_sentence_tokens(
+                     [' '.join([str_postag.rsplit('/', 1)[0] for str_postag in sentence.split(' ')])
+                      for sentence in sentences[-NUM_TEST_SENTENCES:]])
+  NUM_TRAIN_TOKENS = sum([len(sentence.split(' ')) for sentence in train_sentences])
+  NUM_TEST_TOKENS = sum([len(sentence.split(' ')) for sentence in test_sentences])
+
+  stages = {}
+  with tempfile.TemporaryDirectory() as directory:
+    PATH_TO_DATA_TRAIN = os.path.join(directory, 'corpus.train')
+    with open(PATH_TO_DATA_TRAIN, 'w') as train_file:
+      train_file.write('\n'.join(train_sentences) + '\n')
+
+    # Training: streaming the training file into counts, then the probabilities
+    counts, stages['count'] = time_stage(lambda: POSTagModelTrainer(PATH_TO_DATA_TRAIN).count(),
+                                         NUM_TRAIN_TOKENS, args.repeats)
+    dict_model, stages['generate_probs'] = time_stage(lambda: HMMProbGenerator(counts=counts).generate_probs(),
+                                                      NUM_TRAIN_TOKENS, args.repeats)
+    model = run_quietly(lambda: HMMProbGenerator(counts=counts).generate_model())
+
+    # Model files, where items are the model's words
+    NUM_WORDS = len(model.WORDS)
+    for model_format in [MODEL_FORMAT_BINARY, MODEL_FORMAT_PICKLE]:
+      model_file = HMMModelFile(os.path.join(directory, 'model.' + model_format))
+      saved_model = model if model_format == MODEL_FORMAT_BINARY else dict_model
+      _, stages['save_' + model_format] = time_stage(lambda: model_file.save(saved_model, model_format),
+                                                     NUM_WORDS, args.repeats)
+      _, stages['load_' + model_format] = time_stage(lambda: model_file.load(model_format), NUM_WORDS, args.repeats)
+      stages['save_' + model_format]['file_mb'] = os.path.getsize(model_file.PATH_TO_DATA_MODEL) / 1e6
+
+  # Tagging: tokenizing, Viterbi & formatting, where items are test tokens
+  tagger = run_quietly(lambda: POSTagger('', '', model, True, ENGINE=args.engine))
+  sen_as_token_ids_list, stages['tokenize'] = time_stage(
+    lambda: [tokenizer.tokenize_test_document_to_ids(sentence, tagger.MODEL) for sentence in test_sentences],
+    NUM_TEST_TOKENS, args.repeats)
+  best_postags_list, stages['tag'] = time_stage(lambda: [tagger.tag(token_ids) for token_ids in sen_as_token_ids_list],
+                                                NUM_TEST_TOKENS, args.repeats)
+  _, stages['format'] = time_stage(
+    lambda: tagger.format_best_postags_and_sentences([best_postags_list, test_sentences]), NUM_TEST_TOKENS, args.repeats)
+
+  return {
+    'config': {
+      'seed_corpus': os.path.basename(args.PATH_TO_SEED),
+      'sentences': args.sentences,
+      'test_fraction': args.test_fraction,
+      'new_word_rate': args.new_word_rate,
+      'seed': args.seed,
+      'engine': args.engine,
+    },
+    'environment': {
+      'python': platform.python_version(),
+      'numpy': np.__version__,
+      'platform': platform.platform(),
+      'cpus': os.cpu_count(),
+    },
+    'corpus': {
+      'train_sentences': len(train_sentences),
+      'train_tokens': NUM_TRAIN_TOKENS,
+      'test_sentences': len(test_sentences),
+      'test_tokens': NUM_TEST_TOKENS,
+      'words': NUM_WORDS,
+    },
+    'stages': stages,
+    'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+  }
+
+"""
+Compares results with baseline results, stage by stage.
+
+results      Dictionary returned by run_benchmark
+baseline     Dictionary returned by run_benchmark on an earlier version
+TOLERANCE    Relative slowdown above which a stage counts as a regression, if
+             it is also slower by MIN_REGRESSION_SECONDS
+
+return       List of the names of the regressed stages
+"""
+def compare_with_baseline(results, baseline, TOLERANCE):
+  if results['config'] != baseline.get('config'):
+    print("WARNING: the baseline was run with another configuration:", baseline.get('config'))
+
+  regressions = []
+  print("%-16s %12s %12s %9s" % ('stage', 'baseline s', 'current s', 'ratio'))
+  for stage in STAGES:
+    if stage not in baseline.get('stages', {}) or stage not in results['stages']:
+      continue
+    baseline_seconds = baseline['stages'][stage]['seconds']
+    seconds = results['stages'][stage]['seconds']
+    ratio = seconds / baseline_seconds if baseline_seconds > 0 else float('inf')
+    is_regression = ratio > 1 + TOLERANCE and seconds - baseline_seconds >= MIN_REGRESSION_SECONDS
+    if is_regression:
+      regressions.append(stage)
+    print("%-16s %12.4f %12.4f %8.2fx%s" % (stage, baseline_seconds, seconds, ratio, '  REGRESSION' if is_regression else ''))
+  return regressions
+
+# Prints the measurements of every stage
+def print_results(results):
+  print("== CORPUS:", results['corpus'], "==")
+  print("%-16s %10s %16s %12s" % ('stage', 'seconds', 'items/sec', 'peak MB'))
+  for stage in STAGES:
+    measurements = results['stages'][stage]
+    print("%-16s %10.4f %16.0f %12.2f" % (stage, measurements['seconds'], measurements['items_per_sec'] or 0,
+                                         measurements['peak_memory_mb']))
+  print("== PEAK RSS: %.1f MB ==" % results['peak_rss_mb'])
+
+#=====================================================#
+# EXECUTION OF PROGRAM
+#=====================================================#
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Times training, model files & tagging on a synthetic corpus.')
+  parser.add_argument('PATH_TO_SEED', nargs='?', default=DEFAULT_PATH_TO_SEED,
+                      help='labelled corpus the synthetic corpus is sampled from')
+  parser.add_argument('--sentences', type=int, default=DEFAULT_SENTENCES, help='number of sentences of the synthetic corpus')
+  parser.add_argument('--test-fraction', type=float, default=DEFAULT_TEST_FRACTION,
+                      help='fraction of the synthetic corpus which is tagged, the rest is trained on')
+  parser.add_argument('--new-word-rate', type=float, default=DEFAULT_NEW_WORD_RATE,
+                      help='probability of renaming an open-class word to a new word')
+  parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='seed of the synthetic corpus')
+  parser.add_argument('--engine', choices=ENGINES, default=ENGINE_NUMPY, help='Viterbi engine of the tagging stage')
+  parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS, help='number of timed runs per stage, the best one is reported')
+  parser.add_argument('--out', help='write the results to this JSON file')
+  parser.add_argument('--baseline', default=DEFAULT_PATH_TO_BASELINE,
+                      help='compare with the results in this JSON file, if it exists')
+  parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                      help='relative slowdown of a stage reported as a regression')
+  args = parser.parse_args()
+
+  if args.sentences < 2 or not 0 < args.test_fraction < 1:
+    parser.error('--sentences must be at least 2 and --test-fraction between 0 and 1')
+  if args.repeats < 1:
+    parser.error('--repeats must be at least 1')
+
+  results = run_benchmark(args)
+  print_results(results)
+
+  if args.out is not None:
+    with open(args.out, 'w') as out_file:
+      json.dump(results, out_file, indent=2, sort_keys=True)
+    print("=== RESULTS SAVED IN " + args.out + " ===")
+
+  # Writing the results over the baseline makes them the new baseline
+  is_new_baseline = args.out is not None and args.baseline is not None and \
+                    os.path.abspath(args.out) == os.path.abspath(args.baseline)
+  if args.baseline is not None and os.path.exists(args.baseline) and not is_new_baseline:
+    print("== COMPARISON WITH " + args.baseline + " ==")
+    regressions = compare_with_baseline(results, json.load(open(args.baseline)), args.tolerance)
+    if len(regressions) > 0:
+      print("REGRESSED STAGES:", ', '.join(regressions))
+      sys.exit(1)
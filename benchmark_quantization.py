@@ -0,0 +1,135 @@
+# Import standard modules
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+
+# Import custom modules
+from HMMModel import PRECISIONS, PRECISION_FLOAT64
+from HMMModelFile import HMMModelFile, MODEL_FORMAT_BINARY, MODEL_FORMAT_PICKLE
+from HMMProbGenerator import OOV_MODELS, OOV_MODEL_SUFFIX
+from POSTagModelTrainer import POSTagModelTrainer
+from POSTagger import ENGINES, ENGINE_NUMPY, ENGINE_TRIGRAM
+from cross_validator import CrossValidator, DEFAULT_WORKERS
+
+#===========================================================================#
+# BENCHMARK_QUANTIZATION
+# ACCURACY GUARDRAIL OF THE QUANTIZED MODEL PRECISIONS OF build_tagger.py.
+#
+# Cross validates the tagger with the models of each fold stored in every
+# precision, and reports the change of the average accuracy from float64,
+# with the file sizes, load time & dense emission array size of the model
+# trained on the whole corpus in each precision. Exits with status 1 if a
+# precision loses more than --max-accuracy-drop of accuracy.
+#===========================================================================#
+DEFAULT_FOLDS = 3 # number of folds of each cross validation
+DEFAULT_REPEATS = 5 # the best of this many loads is reported
+DEFAULT_MAX_ACCURACY_DROP = 0.001 # accuracy lost to quantization above which a precision fails the check
+
+# Calls function without printing its progress messages
+def run_quietly(function):
+  with contextlib.redirect_stdout(io.StringIO()):
+    return function()
+
+# Runs function REPEATS times & returns its result and its best running time in seconds
+def time_best_of(function, REPEATS):
+  best_time = None
+  for i in range(REPEATS):
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    best_time = elapsed if best_time is None else min(best_time, elapsed)
+  return (result, best_time)
+
+# Loads a model file & builds its dense emission array, as the tagger does before tagging
+def load_and_prepare(model_file):
+  model = model_file.load(MODEL_FORMAT_BINARY)
+  model.build_token_emission_columns()
+  return model
+
+"""
+Measures every precision.
+
+return    Dictionary of results per precision, in the format
+          { 'float32': { 'accuracy': 0.95, 'accuracy_change': -0.0001,
+                         'binary_mb': 1.2, 'pickle_mb': 1.5, 'load_seconds': 0.01,
+                         'emission_columns_mb': 3.4 }, ... }
+"""
+def run_benchmark(args):
+  results = {}
+  model = run_quietly(lambda: POSTagModelTrainer(args.PATH_TO_DATA_TRAIN, TRIGRAMS=args.engine == ENGINE_TRIGRAM,
+                                                 OOV_MODEL=args.oov_model).train())
+  with tempfile.TemporaryDirectory() as directory:
+    for precision in PRECISIONS:
+      print("-- VALIDATING THE", precision, "PRECISION --")
+      validator = run_quietly(lambda: CrossValidator(args.PATH_TO_DATA_TRAIN, args.folds, args.workers, args.engine,
+                                                     OOV_MODEL=args.oov_model, PRECISION=precision))
+      errors = run_quietly(validator.validate)
+      accuracy = validator.get_average([errors.get_accuracy(fold) for fold in range(args.folds)])
+
+      quantized_model = model.quantize(precision)
+      model_file = HMMModelFile(os.path.join(directory, 'model.' + precision))
+      model_file.save(quantized_model, MODEL_FORMAT_PICKLE)
+      pickle_size = os.path.getsize(model_file.PATH_TO_DATA_MODEL)
+      model_file.save(quantized_model, MODEL_FORMAT_BINARY)
+      loaded_model, load_seconds = time_best_of(lambda: load_and_prepare(model_file), args.repeats)
+
+      results[precision] = {
+        'accuracy': accuracy,
+        'accuracy_change': accuracy - results[PRECISION_FLOAT64]['accuracy'] if precision != PRECISION_FLOAT64 else 0.0,
+        'binary_mb': os.path.getsize(model_file.PATH_TO_DATA_MODEL) / 1e6,
+        'pickle_mb': pickle_size / 1e6,
+        'load_seconds': load_seconds,
+        'emission_columns_mb': loaded_model.TOKEN_EMISSION_COLUMNS.nbytes / 1e6,
+      }
+  return results
+
+# Prints the measurements of every precision
+def print_results(results):
+  print("%-10s %10s %10s %11s %11s %10s %14s" % ('precision', 'accuracy', 'change', 'binary MB', 'pickle MB',
+                                                  'load s', 'emissions MB'))
+  for precision in PRECISIONS:
+    measurements = results[precision]
+    print("%-10s %10.6f %+10.6f %11.3f %11.3f %10.4f %14.3f" % (precision, measurements['accuracy'],
+                                                                measurements['accuracy_change'], measurements['binary_mb'],
+                                                                measurements['pickle_mb'], measurements['load_seconds'],
+                                                                measurements['emission_columns_mb']))
+
+#=====================================================#
+# EXECUTION OF PROGRAM
+#=====================================================#
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Reports the accuracy, size & load time of every model precision.')
+  parser.add_argument('PATH_TO_DATA_TRAIN')
+  parser.add_argument('--folds', type=int, default=DEFAULT_FOLDS, help='number of folds of each cross validation')
+  parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='number of processes validating folds')
+  parser.add_argument('--engine', choices=ENGINES, default=ENGINE_NUMPY, help='Viterbi engine of the validated tagger')
+  parser.add_argument('--oov-model', choices=OOV_MODELS, default=OOV_MODEL_SUFFIX,
+                      help='emissions of unseen words: from their suffixes, or the same <UNK> emissions for all')
+  parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS, help='number of timed loads, the best one is reported')
+  parser.add_argument('--max-accuracy-drop', type=float, default=DEFAULT_MAX_ACCURACY_DROP,
+                      help='accuracy a precision may lose to quantization before the check fails')
+  parser.add_argument('--out', help='write the results to this JSON file')
+  args = parser.parse_args()
+
+  if args.folds < 2:
+    parser.error('--folds must be at least 2')
+  if args.repeats < 1:
+    parser.error('--repeats must be at least 1')
+
+  results = run_benchmark(args)
+  print_results(results)
+
+  if args.out is not None:
+    with open(args.out, 'w') as out_file:
+      json.dump(results, out_file, indent=2, sort_keys=True)
+    print("=== RESULTS SAVED IN " + args.out + " ===")
+
+  failures = [precision for precision in PRECISIONS if -results[precision]['accuracy_change'] > args.max_accuracy_drop]
+  if len(failures) > 0:
+    print("PRECISIONS LOSING MORE THAN", args.max_accuracy_drop, "ACCURACY:", ', '.join(failures))
+    sys.exit(1)
@@ -0,0 +1,91 @@
+# Import standard modules
+import re
+import time
+import argparse
+
+# Import custom modules
+from Tokenizer import Tokenizer, NUM_SYMBOL, NUM_SYMBOL_REGEX
+
+#===========================================================================#
+# BENCHMARK_TOKENIZER
+# MEASURES THE TOKENS/SEC OF THE TOKENIZER'S NORMALIZATION ON A LABELLED
+# CORPUS, e.g. sents.train.
+#
+# Compares the single-pass normalizer with the 3-pass reference on the test
+# path (split, <NUM>, then <UNK> substitution) and with a regex per token on
+# the training path, and checks that both give identical tokens.
+#===========================================================================#
+DEFAULT_REPEATS = 5 # the best of this many runs is reported
+
+# Training path before the single-pass normalizer: an uncompiled regex match per token
+def get_pairs_of_word_tags_reference(list_of_str_postag):
+  pairs = []
+  for str_postag in list_of_str_postag:
+    if len(str_postag) > 0:
+      str_postag_pair = str_postag.rsplit('/', 1)
+      if re.match(NUM_SYMBOL_REGEX, str_postag_pair[0]):
+        pairs.append([NUM_SYMBOL, str_postag_pair[1]])
+      else:
+        pairs.append([str_postag_pair[0], str_postag_pair[1]])
+  return pairs
+
+# Test path before the single-pass normalizer: 3 passes over each sentence
+def tokenize_test_document_reference(tokenizer, doc_string, word_vocab):
+  doc_tokens = tokenizer.get_test_data_tokens(doc_string)
+  doc_tokens = tokenizer.replace_numeric_tokens_with_NUM_SYMBOL(doc_tokens)
+  doc_tokens = tokenizer.replace_unseen_tokens_with_UNK(doc_tokens, word_vocab)
+  return tokenizer.remove_empty_sentence_at_end(doc_tokens)
+
+# Runs function REPEATS times & returns its result and its best running time in seconds
+def time_best_of(function, REPEATS):
+  best_time = None
+  for i in range(REPEATS):
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    best_time = elapsed if best_time is None else min(best_time, elapsed)
+  return (result, best_time)
+
+#=====================================================#
+# EXECUTION OF PROGRAM
+#=====================================================#
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Measures the tokens/sec of the tokenizer normalization.')
+  parser.add_argument('PATH_TO_DATA_TRAIN')
+  parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS, help='number of runs, the best one is reported')
+  args = parser.parse_args()
+
+  tokenizer = Tokenizer()
+  sentences = tokenizer.get_sentences(open(args.PATH_TO_DATA_TRAIN).read())
+  labelled_tokens = [sentence.split(' ') for sentence in sentences]
+
+  # Training path: 'word/TAG' strings to (word, tag) pairs
+  reference_pairs, reference_time = time_best_of(
+    lambda: [get_pairs_of_word_tags_reference(tokens) for tokens in labelled_tokens], args.repeats)
+  pairs, fused_time = time_best_of(
+    lambda: [tokenizer.get_pairs_of_word_tags(tokens) for tokens in labelled_tokens], args.repeats)
+  if pairs != reference_pairs:
+    raise AssertionError('Training path tokens differ from the reference')
+
+  NUM_TRAIN_TOKENS = sum([len(sentence_pairs) for sentence_pairs in pairs])
+  print("== TRAINING PATH:", NUM_TRAIN_TOKENS, "tokens ==")
+  print("reference:   %.0f tokens/sec" % (NUM_TRAIN_TOKENS / reference_time))
+  print("single-pass: %.0f tokens/sec (%.2fx)" % (NUM_TRAIN_TOKENS / fused_time, reference_time / fused_time))
+
+  # Test path: the corpus without its tags, against the vocabulary of every
+  # other sentence, so that some words are unseen
+  word_vocab = dict.fromkeys([pair[0] for sentence_pairs in pairs[::2] for pair in sentence_pairs])
+  test_sentences = tokenizer.insert_start_end_sentence_tokens(
+                     [' '.join([token.rsplit('/', 1)[0] for token in tokens]) for tokens in labelled_tokens])
+
+  reference_tokens, reference_time = time_best_of(
+    lambda: [tokenize_test_document_reference(tokenizer, sentence, word_vocab) for sentence in test_sentences], args.repeats)
+  tokens, fused_time = time_best_of(
+    lambda: [tokenizer.tokenize_test_document(sentence, word_vocab) for sentence in test_sentences], args.repeats)
+  if tokens != reference_tokens:
+    raise AssertionError('Test path tokens differ from the reference')
+
+  NUM_TEST_TOKENS = sum([len(sentence_tokens) for sentence_tokens in tokens])
+  print("== TEST PATH:", NUM_TEST_TOKENS, "tokens ==")
+  print("reference:   %.0f tokens/sec" % (NUM_TEST_TOKENS / reference_time))
+  print("single-pass: %.0f tokens/sec (%.2fx)" % (NUM_TEST_TOKENS / fused_time, reference_time / fused_time))
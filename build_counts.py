@@ -0,0 +1,127 @@
+# Import standard modules
+import os
+import sys
+import argparse
+import multiprocessing
+
+# Import custom modules
+from POSTagModelTrainer import POSTagModelTrainer
+from HMMCounts import HMMCounts
+from HMMProbGenerator import HMMProbGenerator, OOV_MODELS, OOV_MODEL_SUFFIX
+from HMMModelFile import HMMModelFile, MODEL_FORMAT_BINARY, MODEL_FORMAT_PICKLE
+
+#===========================================================================#
+# BUILD_COUNTS
+# EXECUTES SHARDED & INCREMENTAL TRAINING OF THE VITERBI TAGGER.
+#
+#   count     Counts each training file & writes it to its own count shard
+#   merge     Merges count shards into a count store, and optionally a model
+#   update    Appends new count shards to an existing count store, without
+#             counting the old training data again, and optionally a model
+#
+# Merging the shards of several training files gives the same model as
+# build_tagger.py on the concatenation of those files, in the same order.
+#===========================================================================#
+COUNTS_FILE_EXTENSION = '.counts'
+
+# Counts a training file & writes its count shard, in a worker process
+def count_training_file(paths):
+  PATH_TO_DATA_TRAIN = paths[0]
+  PATH_TO_COUNTS = paths[1]
+  POSTagModelTrainer(PATH_TO_DATA_TRAIN).count().save(PATH_TO_COUNTS)
+  return PATH_TO_COUNTS
+
+# Loads count shards & appends them in order, in a worker process
+def merge_count_files(paths_to_counts):
+  counts = HMMCounts()
+  for PATH_TO_COUNTS in paths_to_counts:
+    counts.append(HMMCounts.load(PATH_TO_COUNTS))
+  return counts
+
+"""
+Merges count shards in order, loading contiguous groups of shards in
+WORKERS processes and appending the partial counts of each group.
+
+paths_to_counts    List of count shard paths, in training data order
+WORKERS            Number of processes loading shards
+
+return             HMMCounts of all shards
+"""
+def merge_count_files_in_parallel(paths_to_counts, WORKERS):
+  if WORKERS == 1 or len(paths_to_counts) <= 1:
+    return merge_count_files(paths_to_counts)
+
+  GROUP_SIZE = -(-len(paths_to_counts) // WORKERS)
+  groups = [paths_to_counts[i : i + GROUP_SIZE] for i in range(0, len(paths_to_counts), GROUP_SIZE)]
+  with multiprocessing.Pool(len(groups)) as pool:
+    partial_counts = pool.map(merge_count_files, groups, chunksize=1)
+
+  counts = HMMCounts()
+  for group_counts in partial_counts:
+    counts.append(group_counts)
+  return counts
+
+# Writes the model of some counts, if a model file was requested
+def save_model(counts, PATH_TO_DATA_MODEL, model_format, TRIGRAMS=False, OOV_MODEL=OOV_MODEL_SUFFIX):
+  if PATH_TO_DATA_MODEL is not None:
+    model = HMMProbGenerator(counts=counts, TRIGRAMS=TRIGRAMS, OOV_MODEL=OOV_MODEL).generate_model()
+    HMMModelFile(PATH_TO_DATA_MODEL).save(model, model_format)
+    print("=== MODEL SAVED IN " + PATH_TO_DATA_MODEL + " ===")
+
+#=====================================================#
+# EXECUTION OF PROGRAM
+#=====================================================#
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Executes sharded & incremental training of the Viterbi POS tagger.')
+  parser.add_argument('--workers', type=int, default=1, help='number of processes counting or loading shards')
+  parser.add_argument('--model', dest='PATH_TO_DATA_MODEL', help='also write the model of the merged counts to this file')
+  parser.add_argument('--model-format', choices=[MODEL_FORMAT_BINARY, MODEL_FORMAT_PICKLE], default=MODEL_FORMAT_BINARY,
+                      help='format of the written model file')
+  parser.add_argument('--trigram', action='store_true',
+                      help='also store the trigram transitions of the second-order HMM in the model')
+  parser.add_argument('--oov-model', choices=OOV_MODELS, default=OOV_MODEL_SUFFIX,
+                      help='emissions of unseen words: from a suffix trie in the model, or the same <UNK> emissions for all')
+  commands = parser.add_subparsers(dest='command', required=True)
+
+  count_parser = commands.add_parser('count', help='write 1 count shard per training file')
+  count_parser.add_argument('PATHS_TO_DATA_TRAIN', nargs='+')
+  count_parser.add_argument('--out-dir', default='.', help='directory of the written count shards')
+
+  merge_parser = commands.add_parser('merge', help='merge count shards, in order, into a count store')
+  merge_parser.add_argument('PATH_TO_COUNT_STORE')
+  merge_parser.add_argument('PATHS_TO_COUNTS', nargs='+')
+
+  update_parser = commands.add_parser('update', help='append count shards to an existing count store')
+  update_parser.add_argument('PATH_TO_COUNT_STORE')
+  update_parser.add_argument('PATHS_TO_COUNTS', nargs='+')
+  args = parser.parse_args()
+
+  if args.workers < 1:
+    parser.error('--workers must be at least 1')
+
+  if args.command == 'count':
+    paths = [(PATH_TO_DATA_TRAIN, os.path.join(args.out_dir, os.path.basename(PATH_TO_DATA_TRAIN) + COUNTS_FILE_EXTENSION))
+             for PATH_TO_DATA_TRAIN in args.PATHS_TO_DATA_TRAIN]
+    if args.workers > 1:
+      with multiprocessing.Pool(args.workers) as pool:
+        paths_to_counts = pool.map(count_training_file, paths, chunksize=1)
+    else:
+      paths_to_counts = [count_training_file(path) for path in paths]
+    print("=== COUNT SHARDS SAVED IN " + ', '.join(paths_to_counts) + " ===")
+
+    if args.PATH_TO_DATA_MODEL is not None:
+      save_model(merge_count_files_in_parallel(paths_to_counts, args.workers), args.PATH_TO_DATA_MODEL,
+                 args.model_format, args.trigram, args.oov_model)
+
+  elif args.command == 'merge':
+    counts = merge_count_files_in_parallel(args.PATHS_TO_COUNTS, args.workers)
+    counts.save(args.PATH_TO_COUNT_STORE)
+    print("=== MERGED COUNTS SAVED IN " + args.PATH_TO_COUNT_STORE + " ===")
+    save_model(counts, args.PATH_TO_DATA_MODEL, args.model_format, args.trigram, args.oov_model)
+
+  elif args.command == 'update':
+    counts = HMMCounts.load(args.PATH_TO_COUNT_STORE)
+    counts.append(merge_count_files_in_parallel(args.PATHS_TO_COUNTS, args.workers))
+    counts.save(args.PATH_TO_COUNT_STORE)
+    print("=== UPDATED COUNTS SAVED IN " + args.PATH_TO_COUNT_STORE + " ===")
+    save_model(counts, args.PATH_TO_DATA_MODEL, args.model_format, args.trigram, args.oov_model)
@@ -1,25 +1,75 @@
 # Import standard modules
 import sys
-import pickle
+import time
+import argparse
 
 # Import custom modules
-from POSTagModelTrainer import POSTagModelTrainer
+from POSTagModelTrainer import POSTagModelTrainer, DEFAULT_TRAINING_WORKERS, DEFAULT_CHUNK_SIZE
+from HMMModelFile import HMMModelFile, MODEL_FORMAT_BINARY, MODEL_FORMAT_PICKLE
+from HMMProbGenerator import OOV_MODELS, OOV_MODEL_SUFFIX
+from HMMModel import PRECISIONS, PRECISION_FLOAT64
+from Instrumentation import Instrumentation
 
 #===========================================================================#
 # BUILD_TAGGER
 # EXECUTES THE TRAINING PHASE OF THE VITERBI TAGGER ON sents.train & PREPS
 # THE MODEL_FILE.
 #
-# Writes the resulting P(w_i | t_i) and P(t_i | t_i-1) probabilities to a
-# Python pickle file to be used for run_tagger.py during testing.
+# Writes the resulting P(w_i | t_i) and P(t_i | t_i-1) probabilities, as an
+# HMMModel, to a binary model file (or a legacy Python pickle file) to be used
+# for run_tagger.py during testing.
+#
+# With --workers, the training file is counted as a map-reduce over chunks of
+# it in a process pool, for training files larger than memory. With
+# --precision, the log probabilities are stored as float32 or scaled int16.
 #===========================================================================#
-PATH_TO_DATA_TRAIN = sys.argv[1]
-PATH_TO_DATA_DEVT = sys.argv[2]
-PATH_TO_DATA_MODEL = sys.argv[3]
+parser = argparse.ArgumentParser(description='Executes the training phase of the Viterbi POS tagger.')
+parser.add_argument('PATH_TO_DATA_TRAIN')
+parser.add_argument('PATH_TO_DATA_DEVT')
+parser.add_argument('PATH_TO_DATA_MODEL')
+parser.add_argument('--model-format', choices=[MODEL_FORMAT_BINARY, MODEL_FORMAT_PICKLE], default=MODEL_FORMAT_BINARY,
+                    help='format of the written model file')
+parser.add_argument('--trigram', action='store_true',
+                    help='also store the trigram transitions of the second-order HMM, for --engine trigram')
+parser.add_argument('--oov-model', choices=OOV_MODELS, default=OOV_MODEL_SUFFIX,
+                    help='emissions of unseen words: from a suffix trie in the model, or the same <UNK> emissions for all')
+parser.add_argument('--workers', type=int, default=DEFAULT_TRAINING_WORKERS,
+                    help='number of processes counting chunks of the training file')
+parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                    help='largest number of bytes of the training file counted as 1 chunk, with --workers')
+parser.add_argument('--precision', choices=PRECISIONS, default=PRECISION_FLOAT64,
+                    help='precision the transition & emission log probabilities are stored in')
+parser.add_argument('--emission-columns', action='store_true',
+                    help='also store the dense emission array, mapped & shared by the processes loading the binary model')
+parser.add_argument('--stats', metavar='PATH_TO_STATS', help='write a JSON report of stage timers & counters')
+args = parser.parse_args()
+
+if args.workers < 1:
+  parser.error('--workers must be at least 1')
+if args.chunk_size < 1:
+  parser.error('--chunk-size must be at least 1')
+if args.emission_columns and args.model_format != MODEL_FORMAT_BINARY:
+  parser.error('--emission-columns requires --model-format binary')
+
+PATH_TO_DATA_TRAIN = args.PATH_TO_DATA_TRAIN
+PATH_TO_DATA_DEVT = args.PATH_TO_DATA_DEVT
+PATH_TO_DATA_MODEL = args.PATH_TO_DATA_MODEL
 
 print("Training data:", PATH_TO_DATA_TRAIN + "Devt Data:", PATH_TO_DATA_DEVT, "Model file:", PATH_TO_DATA_MODEL)
 
-model = POSTagModelTrainer(PATH_TO_DATA_TRAIN).train()
+# Stage timers & counters, only recorded with --stats
+STATS = Instrumentation() if args.stats is not None else None
 
-pickle.dump(model, open(PATH_TO_DATA_MODEL, 'wb'))
+model = POSTagModelTrainer(PATH_TO_DATA_TRAIN, STATS=STATS, TRIGRAMS=args.trigram,
+                           OOV_MODEL=args.oov_model, WORKERS=args.workers, CHUNK_SIZE=args.chunk_size).train()
+
+start = time.perf_counter()
+if args.precision != PRECISION_FLOAT64:
+  model = model.quantize(args.precision)
+HMMModelFile(PATH_TO_DATA_MODEL).save(model, args.model_format, args.emission_columns)
 print("=== FINISHED TRAINING...MODEL SAVED IN " + PATH_TO_DATA_MODEL + " ===")
+
+if STATS is not None:
+  STATS.add_stage_time('save_model', time.perf_counter() - start)
+  STATS.save(args.stats)
+  print("=== STATS SAVED IN " + args.stats + " ===")
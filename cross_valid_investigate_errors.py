@@ -1,16 +1,79 @@
 # Import standard modules
+import os
 import sys
-import math
-import pickle
+import sqlite3
+import pathlib
+import argparse
 
-from PennTreebankPOSTags import POS_TAGS, START_MARKER, END_MARKER
+# Import custom modules
+from PennTreebankPOSTags import POS_TAGS
+from ErrorIndex import DEFAULT_PATH_TO_ERROR_INDEX
+
+# Define constants
+NUM_TOP_CONFUSIONS = 5 # number of most frequent mistakes printed per POS tag in the summary
+
+#===========================================================================#
+# CROSS_VALID_INVESTIGATE_ERRORS
+# QUERIES THE ERROR INDEX WRITTEN BY cross_validator.py.
+#
+# Without a POS tag, prints the errors of every POS tag & its most frequent
+# mistakes. With a POS tag, prints what its words were mistagged as & which
+# words were mistagged as it, with the sampled contexts of those errors.
+#===========================================================================#
+parser = argparse.ArgumentParser(description='Queries the confusion matrices & error contexts of a cross validation.')
+parser.add_argument('POSTAG', nargs='?', help='POS tag to investigate, all POS tags are summarized without it')
+parser.add_argument('--errors', metavar='PATH_TO_ERRORS', default=DEFAULT_PATH_TO_ERROR_INDEX,
+                    help='sqlite file written by cross_validator.py')
+parser.add_argument('--predicted', metavar='POSTAG', help='only the errors of POSTAG tagged as this POS tag')
+parser.add_argument('--fold', type=int, help='only the errors of this fold, from 1')
+parser.add_argument('--contexts', type=int, default=5, help='number of contexts printed per (gold, predicted) tag pair')
+args = parser.parse_args()
+
+for postag in (args.POSTAG, args.predicted):
+  if postag is not None and postag not in POS_TAGS:
+    sys.exit('Unknown POS tag: ' + postag)
+
+if not os.path.isfile(args.errors):
+  parser.error('No error index file: ' + args.errors)
+
+connection = sqlite3.connect(pathlib.Path(args.errors).resolve().as_uri() + '?mode=ro', uri=True)
+FOLD_FILTER = '' if args.fold is None else ' AND fold = ' + str(args.fold - 1)
+
+# Number of words of each (gold, predicted) tag pair, summed over the folds
+def get_confusions(column, postag):
+  return connection.execute('SELECT gold, predicted, SUM(count) AS total FROM confusions WHERE ' + column + ' = ?'
+                            + FOLD_FILTER + ' GROUP BY gold, predicted ORDER BY total DESC', (postag,)).fetchall()
 
 #=====================================================#
 # EXECUTION OF PROGRAM
 #=====================================================#
-errors = pickle.load(open('cross-validation-results-investigate', 'rb'))
+if args.POSTAG is None:
+  for postag in POS_TAGS:
+    confusions = get_confusions('gold', postag)
+    total = sum(count for _, _, count in confusions)
+    mistakes = [(predicted, count) for _, predicted, count in confusions if predicted != postag]
+    if len(mistakes) > 0:
+      print('==', postag, '==')
+      print('Errors:', sum(count for _, count in mistakes), 'of', total, 'words')
+      print('Tagged as:', ', '.join(predicted + ' ' + str(count) for predicted, count in mistakes[:NUM_TOP_CONFUSIONS]))
+  sys.exit(0)
+
+# Mistakes of the words of the POS tag, then of the words tagged as it
+SECTIONS = [('gold', 'WORDS OF ' + args.POSTAG)]
+if args.predicted is None:
+  SECTIONS.append(('predicted', 'WORDS TAGGED AS ' + args.POSTAG))
+
+for column, title in SECTIONS:
+  confusions = get_confusions(column, args.POSTAG)
+  total = sum(count for _, _, count in confusions)
+  correct = sum(count for gold, predicted, count in confusions if gold == predicted)
+  print('==', title + ':', correct, 'of', total, 'correct ==')
+  for gold, predicted, count in confusions:
+    if gold == predicted or (args.predicted is not None and predicted != args.predicted):
+      continue
 
-for postag in POS_TAGS:
-  if postag in errors.keys():
-    print('==', postag, '==')
-    print(errors[postag])
+    print('--', gold, '->', predicted + ':', count, '--')
+    contexts = connection.execute('SELECT fold, context FROM contexts WHERE gold = ? AND predicted = ?' + FOLD_FILTER
+                                  + ' LIMIT ?', (gold, predicted, args.contexts)).fetchall()
+    for fold, context in contexts:
+      print('  fold', str(fold + 1) + ':', context)
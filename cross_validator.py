@@ -3,28 +3,86 @@ import sys
 import string
 import re
 import math
+import time
 import pickle
+import argparse
+import multiprocessing
 
 # Import custom modules
 from PennTreebankPOSTags import POS_TAGS
 from PennTreebankPOSTags import START_MARKER
 from PennTreebankPOSTags import END_MARKER
 from Tokenizer import Tokenizer
-from HMMProbGenerator import HMMProbGenerator
+from HMMProbGenerator import HMMProbGenerator, OOV_MODELS, OOV_MODEL_SUFFIX
+from HMMCounts import HMMCounts
 from POSTagModelTrainer import POSTagModelTrainer
-from POSTagger import POSTagger
+from POSTagger import POSTagger, ENGINES, ENGINE_NUMPY, ENGINE_TRIGRAM
+from TrigramViterbi import DEFAULT_BEAM
+from ConstrainedViterbi import UNK_TAGS_MODES, UNK_TAGS_OPEN_CLASS
+from Instrumentation import Instrumentation
+from ErrorIndex import ErrorIndex, DEFAULT_PATH_TO_ERROR_INDEX, DEFAULT_MAX_CONTEXTS
+from HMMModel import PRECISIONS, PRECISION_FLOAT64
+
+# Define constants
+DEFAULT_FOLDS = 10 # number of folds, k, of the cross validation
+DEFAULT_WORKERS = 1 # number of processes validating folds, 1 validates them one after another
+
+# Cross validator used by the worker processes of the validation pool. It is
+# set before the pool forks, so every worker shares the tokenized corpus.
+WORKER_CROSS_VALIDATOR = None
+
+# Validates a single fold in a worker process of the validation pool. Returns
+# its error index and, with stats on, the stats of the fold for the parent to merge.
+def validate_fold_in_worker(fold):
+  if WORKER_CROSS_VALIDATOR.STATS is not None:
+    WORKER_CROSS_VALIDATOR.STATS = Instrumentation()
+  return (WORKER_CROSS_VALIDATOR.validate_fold(fold), WORKER_CROSS_VALIDATOR.STATS)
 
 #===========================================================================#
 # CrossValidator
 #
-# PERFORMS 10-FOLD CROSS VALIDATION OF OUR MODEL ON A SPECIFIED TRAINING SET.
+# PERFORMS K-FOLD CROSS VALIDATION OF OUR MODEL ON A SPECIFIED TRAINING SET.
 #
-# Prints the accuracies of each fold and the average accuracy of all 10 folds
-# to the console.
+# Prints the accuracies of each fold and the average accuracy of all k folds
+# to the console, and keeps the confusion matrices & sampled error contexts of
+# the folds in an ErrorIndex. The models trained on each fold may be
+# quantized to a lower PRECISION before tagging, as build_tagger.py stores them.
 #===========================================================================#
 class CrossValidator():
-  def __init__(self, PATH_TO_DATA_TRAIN):
+  def __init__(self, PATH_TO_DATA_TRAIN, FOLDS=DEFAULT_FOLDS, WORKERS=DEFAULT_WORKERS, ENGINE=ENGINE_NUMPY,
+               UNK_TAGS=UNK_TAGS_OPEN_CLASS, STATS=None, BEAM=DEFAULT_BEAM, OOV_MODEL=OOV_MODEL_SUFFIX,
+               MAX_CONTEXTS=DEFAULT_MAX_CONTEXTS, PRECISION=PRECISION_FLOAT64):
     print('== [CrossValidator instantiated] ==')
+    if FOLDS < 2:
+      raise ValueError('FOLDS must be at least 2')
+    if WORKERS < 1:
+      raise ValueError('WORKERS must be at least 1')
+    if WORKERS > 1 and 'fork' not in multiprocessing.get_all_start_methods():
+      raise ValueError('Validating with several workers requires the fork start method')
+    if PRECISION not in PRECISIONS:
+      raise ValueError('Unknown log probability precision: ' + str(PRECISION))
+
+    # Number of folds & of processes validating them
+    self.FOLDS = FOLDS
+    self.WORKERS = WORKERS
+
+    # Viterbi engine of the tagger validated on each fold
+    self.ENGINE = ENGINE
+    self.UNK_TAGS = UNK_TAGS
+    self.BEAM = BEAM
+
+    # Emission model of the unseen words of the models trained on each fold,
+    # and precision of their log probabilities
+    self.OOV_MODEL = OOV_MODEL
+    self.PRECISION = PRECISION
+
+    # Instrumentation recording stage timers & counters, None disables it
+    self.STATS = STATS
+
+    # Number of error contexts sampled per (gold, predicted) tag pair, and the
+    # ErrorIndex of all folds once validated
+    self.MAX_CONTEXTS = MAX_CONTEXTS
+    self.ERRORS = None
 
     # Set up tokenizer before everything else
     self.tokenizer = Tokenizer()
@@ -36,98 +94,176 @@ class CrossValidator():
     self.DATA_TRAIN = open(PATH_TO_DATA_TRAIN).read()
 
   #=====================================================#
-  # 10-FOLD CROSS VALIDATION
+  # K-FOLD CROSS VALIDATION
   #=====================================================#
+  """
+  Validates every fold, printing their accuracies and the average accuracy.
+
+  return    ErrorIndex of all folds
+  """
   def validate(self):
     print('Validating model...please wait...')
 
-    sentences = self.tokenizer.get_sentences(self.DATA_TRAIN)
-    LEN_SENTENCES = len(sentences)
-    ONE_FOLD_SIZE = int(math.floor(0.1 * LEN_SENTENCES))
-
-    acc_scores_so_far = []
-    for i in range(10):
-      print('Performing validation on fold no.:', i + 1, 'please wait...')
-      sentences = self.shift(sentences, ONE_FOLD_SIZE)
-      test_sentences = sentences[-ONE_FOLD_SIZE:]
-      training_sentences = sentences[0:-ONE_FOLD_SIZE]
-
-      # Tokenizing Training data
-      training_dataset = self.tokenizer.flatten_list_of_sentences(training_sentences)
-      list_of_str_postag = self.tokenizer.tokenize_document(training_dataset)
-      list_of_word_postag_pairs = self.tokenizer.get_pairs_of_word_tags(list_of_str_postag)
+    # Tokenize the corpus once, every fold reuses the tokenized sentences
+    start = time.perf_counter()
+    self.SENTENCES = self.tokenizer.get_sentences(self.DATA_TRAIN)
+    self.ONE_FOLD_SIZE = len(self.SENTENCES) // self.FOLDS
+    if self.ONE_FOLD_SIZE == 0:
+      raise ValueError('Cannot split ' + str(len(self.SENTENCES)) + ' sentences into ' + str(self.FOLDS) + ' folds')
 
-      # Training the model
-      model = HMMProbGenerator(list_of_word_postag_pairs).generate_probs()
+    # All (word, tag) pairs of the corpus in 1 list, and the index of each
+    # sentence's 1st pair in that list
+    self.WORD_POSTAG_PAIRS = []
+    self.SENTENCE_OFFSETS = []
+    for sentence in self.SENTENCES:
+      self.SENTENCE_OFFSETS.append(len(self.WORD_POSTAG_PAIRS))
+      self.WORD_POSTAG_PAIRS += self.tokenizer.get_pairs_of_word_tags(sentence.split(' '))
+    self.SENTENCE_OFFSETS.append(len(self.WORD_POSTAG_PAIRS))
+    if self.STATS is not None:
+      self.STATS.add_stage_time('tokenize_corpus', time.perf_counter() - start)
 
-      # Running the POS Tagger
-      self.POS_tagger = POSTagger('', '', model, True)
+    # Count the corpus once, as a cycle where the last pair is followed by the 1st
+    start = time.perf_counter()
+    NUM_PAIRS = len(self.WORD_POSTAG_PAIRS)
+    self.TOTAL_COUNTS = HMMCounts().add_word_postag_pairs(self.WORD_POSTAG_PAIRS)
+    if NUM_PAIRS > 0:
+      self.TOTAL_COUNTS.add_postag_bigram(self.WORD_POSTAG_PAIRS[-1][1], self.WORD_POSTAG_PAIRS[0][1])
+    # Trigrams wrapping around the end of the corpus, starting at its last 2 pairs
+    for trigram_start in range(max(NUM_PAIRS - 2, 0), NUM_PAIRS):
+      self.TOTAL_COUNTS.add_postag_trigram(*self.get_cycle_postags(trigram_start, 3))
+    if self.STATS is not None:
+      self.STATS.add_stage_time('count_corpus', time.perf_counter() - start)
 
-      # Run the model on the test data
-      best_postags_and_gold_standard_tags = self.POS_tagger.run_with_provided_sentences(test_sentences)
-      best_postags = best_postags_and_gold_standard_tags[0]
-      gold_standard_tags = best_postags_and_gold_standard_tags[1]
+    if self.WORKERS > 1:
+      global WORKER_CROSS_VALIDATOR
+      WORKER_CROSS_VALIDATOR = self
+      with multiprocessing.get_context('fork').Pool(min(self.WORKERS, self.FOLDS)) as pool:
+        results = pool.map(validate_fold_in_worker, range(self.FOLDS), chunksize=1)
+      fold_errors = [result[0] for result in results]
+      if self.STATS is not None:
+        for result in results:
+          self.STATS.merge(result[1])
+    else:
+      fold_errors = [self.validate_fold(fold) for fold in range(self.FOLDS)]
 
-      # Compute accuracy
-      acc_scores_so_far.append(self.compute_accuracy(gold_standard_tags, best_postags))
-      print('COMPLETED validation on fold no.:', i + 1, '!', 10 - (i + 1), 'more to go!')
+    # Merged in fold order, so the sampled contexts don't depend on the number of workers
+    self.ERRORS = ErrorIndex(self.FOLDS, self.MAX_CONTEXTS)
+    for errors in fold_errors:
+      self.ERRORS.merge(errors)
 
+    acc_scores_so_far = [self.ERRORS.get_accuracy(fold) for fold in range(self.FOLDS)]
     print(acc_scores_so_far)
     print("Average Cross Validation Score:", self.get_average(acc_scores_so_far))
+    return self.ERRORS
 
   """
-  Shifts a list by n spaces to the right and returns a copy of that array
+  Trains a model on every fold but one and counts its errors on that one.
+  Fold i holds sentences [i * ONE_FOLD_SIZE, (i + 1) * ONE_FOLD_SIZE), and any
+  sentences left over after the last fold are always used for training.
 
-  arr   List to shift
-  n     Number of elements to shift by to the right
+  fold      Index of the held-out fold
 
-  return
+  return    ErrorIndex holding the confusion matrix & sampled error contexts
+            of the held-out fold, from which its accuracy is read
   """
-  def shift(self, arr, n):
-    return arr[n:] + arr[:n]
+  def validate_fold(self, fold):
+    print('Performing validation on fold no.:', fold + 1, 'please wait...')
+    test_start = fold * self.ONE_FOLD_SIZE
+    test_end = test_start + self.ONE_FOLD_SIZE
+    test_sentences = self.SENTENCES[test_start:test_end]
 
-  """
-  Computes the accuracy of our predicted postags as compared to a list of
-  true positive postags.
-
-  true_postags    List of true positive POS tags in the format
-                  [['<S>', 'FW', 'FW', 'FW', 'NNP', 'NNP', '<E>'], ...]
-  test_postags    List of predicted POS tags in the format
-                  [['<S>', 'FW', 'FW', 'FW', 'NNP', 'NNP', '<E>'], ...], that
-                  is, a list of sentences where each sentence is a list of
-                  every word's tag
-
-  return          Percentage accuracy of our model on the testset in a single
-                  10-fold cross validation runthrough
-  """
-  def compute_accuracy(self, true_postags, test_postags):
-    N = self.compute_accuracy_N(test_postags)
-    correct = 0
+    # Training the model
+    start = time.perf_counter()
+    TRIGRAMS = self.ENGINE == ENGINE_TRIGRAM
+    model = HMMProbGenerator(counts=self.get_training_counts(fold), TRIGRAMS=TRIGRAMS,
+                             OOV_MODEL=self.OOV_MODEL).generate_model()
+    if self.PRECISION != PRECISION_FLOAT64:
+      model = model.quantize(self.PRECISION)
+    if self.STATS is not None:
+      self.STATS.add_stage_time('train', time.perf_counter() - start)
 
-    for i in range(len(test_postags)):
-      for j in range(len(test_postags[i])):
-        if test_postags[i][j] == true_postags[i][j]:
-          correct += 1
+    # Running the POS Tagger
+    POS_tagger = POSTagger('', '', model, True, ENGINE=self.ENGINE, UNK_TAGS=self.UNK_TAGS, STATS=self.STATS,
+                           BEAM=self.BEAM)
 
-    return float(correct) / float(N)
+    # Run the model on the test data
+    best_postags_and_gold_standard_tags = POS_tagger.run_with_provided_sentences(test_sentences)
+    best_postags = best_postags_and_gold_standard_tags[0]
+    gold_standard_tags = best_postags_and_gold_standard_tags[1]
+
+    # Count the tags & sample the errors of each sentence, seeded by fold so
+    # that the samples don't depend on which process validated the fold
+    start = time.perf_counter()
+    errors = ErrorIndex(self.FOLDS, self.MAX_CONTEXTS, SEED=fold)
+    for i in range(len(test_sentences)):
+      words = self.tokenizer.insert_start_end_sentence_tags([test_sentences[i]])[0].split(' ')
+      errors.add_sentence(fold, [word_postag.rsplit('/', 1)[0] for word_postag in words],
+                          gold_standard_tags[i], best_postags[i])
+    if self.STATS is not None:
+      self.STATS.add_stage_time('accuracy', time.perf_counter() - start)
+    print('COMPLETED validation on fold no.:', fold + 1, '!')
+    return errors
 
   """
-  Helper function for compute_accuracy to compute the total number of tags in
-  our entire test set
+  Derives the counts of a fold's training split from the counts of the whole
+  corpus, counting only the held-out fold.
+
+  The training split is the sentences following the held-out fold, wrapping
+  around to the start of the corpus, tagged as a single <S> ... <E> sequence.
+  That is the corpus cycle cut open at the held-out fold, so its counts are
+  the cycle's counts minus the fold's pairs and the bigrams & trigrams
+  overlapping the fold, plus the <S> and <E> markers at both ends.
 
-  test_postags    List of predicted POS tags in the format
-                  [['<S>', 'FW', 'FW', 'FW', 'NNP', 'NNP', '<E>'], ...], that
-                  is, a list of sentences where each sentence is a list of every
-                  word's tag
+  fold      Index of the held-out fold
 
-  return          Total number of tags in the entire test set
+  return    HMMCounts of the training split
   """
-  def compute_accuracy_N(self, test_postags):
-    N = 0
-    for sentence in test_postags:
-      for postag in sentence:
-        N = N + 1
-    return N
+  def get_training_counts(self, fold):
+    fold_start = self.SENTENCE_OFFSETS[fold * self.ONE_FOLD_SIZE]
+    fold_end = self.SENTENCE_OFFSETS[(fold + 1) * self.ONE_FOLD_SIZE]
+    fold_pairs = self.WORD_POSTAG_PAIRS[fold_start:fold_end]
+    if len(fold_pairs) == len(self.WORD_POSTAG_PAIRS):
+      # Nothing is left to train on but the <S> & <E> markers
+      return HMMCounts().add_word_postag_pairs([[START_MARKER, START_MARKER], [END_MARKER, END_MARKER]])
+
+    # Pairs before & after the fold in the corpus cycle, which end & start the training split
+    last_training_postag = self.WORD_POSTAG_PAIRS[fold_start - 1][1]
+    first_training_postag = self.WORD_POSTAG_PAIRS[fold_end % len(self.WORD_POSTAG_PAIRS)][1]
+
+    # Counts of the fold, including the bigrams linking it to its neighbours
+    fold_postags = [last_training_postag] + [pair[1] for pair in fold_pairs] + [first_training_postag]
+    fold_counts = HMMCounts()
+    for pair in fold_pairs:
+      fold_counts.add_word_postag_pair(pair[0], pair[1])
+    for i in range(1, len(fold_postags)):
+      fold_counts.add_postag_bigram(fold_postags[i - 1], fold_postags[i])
+
+    # Trigrams of the cycle overlapping the fold, i.e. starting from 2 pairs
+    # before it to its last pair, each counted once if the cycle is shorter
+    NUM_PAIRS = len(self.WORD_POSTAG_PAIRS)
+    for trigram_start in range(max(fold_start - 2, fold_end - NUM_PAIRS), fold_end):
+      fold_counts.add_postag_trigram(*self.get_cycle_postags(trigram_start, 3))
+
+    training_counts = self.TOTAL_COUNTS - fold_counts
+    training_counts.add_word_postag_pair(START_MARKER, START_MARKER)
+    training_counts.add_word_postag_pair(END_MARKER, END_MARKER)
+    training_counts.add_postag_bigram(START_MARKER, first_training_postag)
+    training_counts.add_postag_bigram(last_training_postag, END_MARKER)
+
+    # Trigrams of the <S> & <E> ends of the training split, which are the same
+    # trigram if only 1 pair is left to train on
+    NUM_TRAINING_PAIRS = NUM_PAIRS - len(fold_pairs)
+    if NUM_TRAINING_PAIRS == 1:
+      training_counts.add_postag_trigram(START_MARKER, first_training_postag, END_MARKER)
+    else:
+      training_counts.add_postag_trigram(START_MARKER, *self.get_cycle_postags(fold_end, 2))
+      training_counts.add_postag_trigram(*(self.get_cycle_postags(fold_start - 2, 2) + [END_MARKER]))
+    return training_counts
+
+  # Tags of LENGTH consecutive pairs of the corpus cycle from index start, wrapping around its end
+  def get_cycle_postags(self, start, LENGTH):
+    NUM_PAIRS = len(self.WORD_POSTAG_PAIRS)
+    return [self.WORD_POSTAG_PAIRS[(start + k) % NUM_PAIRS][1] for k in range(LENGTH)]
 
   """
   Computes the average of a list of numbers
@@ -146,8 +282,39 @@ class CrossValidator():
 #=====================================================#
 # EXECUTION OF CrossValidator
 #=====================================================#
-PATH_TO_DATA_TRAIN = sys.argv[1]
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Computes the k-fold cross validation accuracy of the model.')
+  parser.add_argument('PATH_TO_DATA_TRAIN')
+  parser.add_argument('--folds', type=int, default=DEFAULT_FOLDS, help='number of folds, k')
+  parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='number of processes validating folds')
+  parser.add_argument('--engine', choices=ENGINES, default=ENGINE_NUMPY, help='Viterbi engine of the validated tagger')
+  parser.add_argument('--unk-tags', choices=UNK_TAGS_MODES, default=UNK_TAGS_OPEN_CLASS,
+                      help='POS tags an unseen word may take with the constrained & trigram engines')
+  parser.add_argument('--beam', type=float, default=DEFAULT_BEAM,
+                      help='log factor below the best tag pair beyond which the trigram engine prunes tag pairs, inf keeps every pair')
+  parser.add_argument('--oov-model', choices=OOV_MODELS, default=OOV_MODEL_SUFFIX,
+                      help='emissions of unseen words: from their suffixes, or the same <UNK> emissions for all')
+  parser.add_argument('--precision', choices=PRECISIONS, default=PRECISION_FLOAT64,
+                      help='precision the log probabilities of the models trained on each fold are quantized to')
+  parser.add_argument('--stats', metavar='PATH_TO_STATS', help='write a JSON report of stage timers & counters')
+  parser.add_argument('--errors', metavar='PATH_TO_ERRORS', default=DEFAULT_PATH_TO_ERROR_INDEX,
+                      help='sqlite file of the confusion matrices & sampled error contexts, for cross_valid_investigate_errors.py')
+  parser.add_argument('--max-contexts', type=int, default=DEFAULT_MAX_CONTEXTS,
+                      help='number of error contexts sampled per (gold, predicted) tag pair')
+  args = parser.parse_args()
+
+  PATH_TO_DATA_TRAIN = args.PATH_TO_DATA_TRAIN
+
+  print("Path to training data:", PATH_TO_DATA_TRAIN)
+
+  # Stage timers & counters, only recorded with --stats
+  STATS = Instrumentation() if args.stats is not None else None
 
-print("Path to training data:", PATH_TO_DATA_TRAIN)
+  errors = CrossValidator(PATH_TO_DATA_TRAIN, args.folds, args.workers, args.engine, args.unk_tags, STATS, args.beam,
+                          args.oov_model, args.max_contexts, args.precision).validate()
+  errors.save(args.errors)
+  print("=== ERRORS SAVED IN " + args.errors + " ===")
 
-CrossValidator(PATH_TO_DATA_TRAIN).validate()
+  if STATS is not None:
+    STATS.save(args.stats)
+    print("=== STATS SAVED IN " + args.stats + " ===")
@@ -1,12 +1,20 @@
 # Import standard modules
 import sys
+import time
 import math
 import pickle
+import argparse
 
 # Import custom modules
 from Tokenizer import Tokenizer
 from PennTreebankPOSTags import POS_TAGS, START_MARKER, END_MARKER
-from POSTagger import POSTagger
+from POSTagger import POSTagger, ENGINES, ENGINE_NUMPY, DEFAULT_BATCH_SIZE, DEFAULT_BUCKET_WIDTH, DEFAULT_CHUNK_SIZE, DEFAULT_WORKERS, \
+  DEFAULT_K_BEST
+from TrigramViterbi import DEFAULT_BEAM
+from HMMModelFile import MODEL_FORMATS, MODEL_FORMAT_AUTO
+from ConstrainedViterbi import UNK_TAGS_MODES, UNK_TAGS_OPEN_CLASS
+from SentenceCache import DEFAULT_CACHE_SIZE
+from Instrumentation import Instrumentation
 
 #===========================================================================#
 # RUN_TAGGER
@@ -14,16 +22,109 @@ from POSTagger import POSTagger
 #
 # Writes the resulting best part-of-speech tags of the sentences in the test
 # set to a file sents.out as specified in the assignment requirements.
+#
+# With --stream, sentences are read, tagged and written chunk by chunk, and
+# '-' reads the test set from stdin or writes the output to stdout.
+#
+# With --confidences, the posterior probability of each best POS tag, and
+# with --k-best the best alternative taggings, are written to a JSON lines
+# file with 1 line per line of the output.
 #===========================================================================#
-PATH_TO_DATA_TEST = sys.argv[1]
-PATH_TO_DATA_MODEL = sys.argv[2]
-PATH_TO_DATA_TEST_LABELLED = sys.argv[3]
+STDIO_PATH = '-'
+
+parser = argparse.ArgumentParser(description='Executes the Viterbi POS tagger on a test set.')
+parser.add_argument('PATH_TO_DATA_TEST')
+parser.add_argument('PATH_TO_DATA_MODEL')
+parser.add_argument('PATH_TO_DATA_TEST_LABELLED')
+parser.add_argument('--engine', choices=ENGINES, default=ENGINE_NUMPY, help='Viterbi engine used for tagging')
+parser.add_argument('--model-format', choices=MODEL_FORMATS, default=MODEL_FORMAT_AUTO,
+                    help='format of the model file, sniffed from the file by default')
+parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                    help='number of sentences tagged at once by the numpy engine, 1 tags sentence by sentence')
+parser.add_argument('--bucket-width', type=int, default=DEFAULT_BUCKET_WIDTH,
+                    help='maximum difference in token counts between sentences of a batch')
+parser.add_argument('--unk-tags', choices=UNK_TAGS_MODES, default=UNK_TAGS_OPEN_CLASS,
+                    help='POS tags an unseen word may take with the constrained & trigram engines')
+parser.add_argument('--beam', type=float, default=DEFAULT_BEAM,
+                    help='log factor below the best tag pair beyond which the trigram engine prunes tag pairs, inf keeps every pair')
+parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE,
+                    help='number of tagged sentences kept in an LRU cache, 0 disables the cache')
+parser.add_argument('--cache-file',
+                    help='sqlite file keeping tagged sentences across runs with the same model & engine')
+parser.add_argument('--stats', metavar='PATH_TO_STATS',
+                    help='write a JSON report of stage timers, OOV rate, sentence lengths & slowest sentences')
+parser.add_argument('--stream', action='store_true',
+                    help='read, tag and write the sentences chunk by chunk with bounded memory')
+parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                    help='number of sentences read ahead and tagged together with --stream')
+parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                    help='number of forked tagging processes sharing the loaded model')
+parser.add_argument('--confidences', metavar='PATH_TO_CONFIDENCES',
+                    help='write the posterior probabilities of the best POS tags of each sentence as a line of JSON')
+parser.add_argument('--k-best', type=int, default=DEFAULT_K_BEST,
+                    help='number of best taggings of each sentence written with --confidences, with their log probabilities')
+args = parser.parse_args()
+
+if args.k_best < 0:
+  parser.error('--k-best must be at least 0')
+if args.k_best > 0 and args.confidences is None:
+  parser.error('--k-best requires --confidences')
+
+PATH_TO_DATA_TEST = args.PATH_TO_DATA_TEST
+PATH_TO_DATA_MODEL = args.PATH_TO_DATA_MODEL
+PATH_TO_DATA_TEST_LABELLED = args.PATH_TO_DATA_TEST_LABELLED
+
+# With --stream to stdout, progress messages go to stderr instead
+STDOUT = sys.stdout
+if args.stream and PATH_TO_DATA_TEST_LABELLED == STDIO_PATH:
+  sys.stdout = sys.stderr
+
+# Stage timers & counters, only recorded with --stats
+STATS = Instrumentation() if args.stats is not None else None
 
 print("sents.test:", PATH_TO_DATA_TEST + ", model_file:", PATH_TO_DATA_MODEL + ", labelled test data sents.out:", PATH_TO_DATA_TEST_LABELLED)
 
-# Get the best POS tags for the test set
-output = POSTagger(PATH_TO_DATA_TEST, PATH_TO_DATA_MODEL).run()
+# Confidences are written alongside the output as the sentences are tagged, so
+# they always go through the streaming path, whose output is the same as run's
+CONFIDENCES = args.confidences is not None
+if args.stream or CONFIDENCES:
+  tagger = POSTagger(PATH_TO_DATA_TEST, PATH_TO_DATA_MODEL, ENGINE=args.engine, MODEL_FORMAT=args.model_format,
+                     BATCH_SIZE=args.batch_size, BUCKET_WIDTH=args.bucket_width, WORKERS=args.workers,
+                     UNK_TAGS=args.unk_tags, CACHE_SIZE=args.cache_size, PATH_TO_CACHE=args.cache_file,
+                     STATS=STATS, BEAM=args.beam, CONFIDENCES=CONFIDENCES, K_BEST=args.k_best)
+
+  test_file = sys.stdin if PATH_TO_DATA_TEST == STDIO_PATH else open(PATH_TO_DATA_TEST)
+  sents_out_file = STDOUT if PATH_TO_DATA_TEST_LABELLED == STDIO_PATH else open(PATH_TO_DATA_TEST_LABELLED, 'w')
+  with test_file, sents_out_file:
+    if CONFIDENCES:
+      with open(args.confidences, 'w') as confidences_file:
+        tagger.run_streaming(test_file, sents_out_file, args.chunk_size, confidences_file)
+    else:
+      tagger.run_streaming(test_file, sents_out_file, args.chunk_size)
+else:
+  # Get the best POS tags for the test set
+  tagger = POSTagger(PATH_TO_DATA_TEST, PATH_TO_DATA_MODEL, ENGINE=args.engine, MODEL_FORMAT=args.model_format,
+                     BATCH_SIZE=args.batch_size, BUCKET_WIDTH=args.bucket_width, WORKERS=args.workers,
+                     UNK_TAGS=args.unk_tags, CACHE_SIZE=args.cache_size, PATH_TO_CACHE=args.cache_file,
+                     STATS=STATS, BEAM=args.beam, K_BEST=args.k_best)
+  output = tagger.run()
+
+  # Print to an output file. In this assignment, it is called 'sents.out'
+  start = time.perf_counter()
+  with open(PATH_TO_DATA_TEST_LABELLED, 'w') as sents_out_file:
+    sents_out_file.write(output)
+  if STATS is not None:
+    STATS.add_stage_time('write_output', time.perf_counter() - start)
+
+if tagger.SENTENCE_CACHE is not None:
+  stats = tagger.SENTENCE_CACHE.get_stats()
+  print("== SENTENCE CACHE: hits", stats['hits'], "(" + str(stats['disk_hits']) + " from disk), misses", stats['misses'],
+        "hit rate", round(stats['hit_rate'], 4), "==")
+  if STATS is not None:
+    STATS.count('cache_hits', stats['hits'])
+    STATS.count('cache_disk_hits', stats['disk_hits'])
+    STATS.count('cache_misses', stats['misses'])
 
-# Print to an output file. In this assignment, it is called 'sents.out'
-with open(PATH_TO_DATA_TEST_LABELLED, 'w') as sents_out_file:
-  sents_out_file.write(output)
+if STATS is not None:
+  STATS.save(args.stats)
+  print("=== STATS SAVED IN " + args.stats + " ===")
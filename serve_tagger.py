@@ -0,0 +1,67 @@
+# Import standard modules
+import argparse
+
+# Import custom modules
+from POSTagger import ENGINES, ENGINE_NUMPY, DEFAULT_BUCKET_WIDTH
+from TrigramViterbi import DEFAULT_BEAM
+from HMMModelFile import MODEL_FORMATS, MODEL_FORMAT_AUTO
+from ConstrainedViterbi import UNK_TAGS_MODES, UNK_TAGS_OPEN_CLASS
+from SentenceCache import DEFAULT_CACHE_SIZE
+from TaggingServer import TaggingServer, DEFAULT_MAX_BATCH_SENTENCES, DEFAULT_MAX_BATCH_DELAY
+
+#===========================================================================#
+# SERVE_TAGGER
+# RUNS THE VITERBI TAGGER AS A RESIDENT HTTP SERVER.
+#
+# Loads the model once and tags the documents POSTed to /tag, batching the
+# sentences of concurrent requests together. See TaggingServer for the
+# endpoints. Listens on TCP by default, or on a Unix socket with --unix-socket.
+#===========================================================================#
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8000
+DEFAULT_SERVER_BATCH_SIZE = 64 # batched requests are tagged by the batched numpy Viterbi, other engines tag 1 by 1
+
+parser = argparse.ArgumentParser(description='Serves the Viterbi POS tagger over HTTP.')
+parser.add_argument('PATH_TO_DATA_MODEL')
+parser.add_argument('--host', default=DEFAULT_HOST, help='address to listen on')
+parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='TCP port to listen on, 0 picks a free port')
+parser.add_argument('--unix-socket', metavar='PATH_TO_SOCKET', help='listen on a Unix socket instead of TCP')
+parser.add_argument('--engine', choices=ENGINES, default=ENGINE_NUMPY, help='Viterbi engine used for tagging')
+parser.add_argument('--model-format', choices=MODEL_FORMATS, default=MODEL_FORMAT_AUTO,
+                    help='format of the model file, sniffed from the file by default')
+parser.add_argument('--batch-size', type=int,
+                    help='number of sentences tagged at once by the numpy engine, 1 tags sentence by sentence ' +
+                         '(default ' + str(DEFAULT_SERVER_BATCH_SIZE) + ' with the numpy engine, else 1)')
+parser.add_argument('--bucket-width', type=int, default=DEFAULT_BUCKET_WIDTH,
+                    help='maximum difference in token counts between sentences of a batch')
+parser.add_argument('--unk-tags', choices=UNK_TAGS_MODES, default=UNK_TAGS_OPEN_CLASS,
+                    help='POS tags an unseen word may take with the constrained & trigram engines')
+parser.add_argument('--beam', type=float, default=DEFAULT_BEAM,
+                    help='log factor below the best tag pair beyond which the trigram engine prunes tag pairs, inf keeps every pair')
+parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE,
+                    help='number of tagged sentences kept in an LRU cache, 0 disables the cache')
+parser.add_argument('--cache-file',
+                    help='sqlite file keeping tagged sentences across runs with the same model & engine')
+parser.add_argument('--max-batch-sentences', type=int, default=DEFAULT_MAX_BATCH_SENTENCES,
+                    help='sentences of queued requests tagged together')
+parser.add_argument('--max-batch-delay-ms', type=float, default=DEFAULT_MAX_BATCH_DELAY * 1000,
+                    help='milliseconds a request waits for other requests to join its batch')
+args = parser.parse_args()
+
+BATCH_SIZE = args.batch_size
+if BATCH_SIZE is None:
+  BATCH_SIZE = DEFAULT_SERVER_BATCH_SIZE if args.engine == ENGINE_NUMPY else 1
+
+TAGGER_OPTIONS = {
+  'ENGINE': args.engine,
+  'MODEL_FORMAT': args.model_format,
+  'BATCH_SIZE': BATCH_SIZE,
+  'BUCKET_WIDTH': args.bucket_width,
+  'UNK_TAGS': args.unk_tags,
+  'CACHE_SIZE': args.cache_size,
+  'PATH_TO_CACHE': args.cache_file,
+  'BEAM': args.beam,
+}
+
+server = TaggingServer(args.PATH_TO_DATA_MODEL, TAGGER_OPTIONS, args.max_batch_sentences, args.max_batch_delay_ms / 1000)
+server.serve(args.host, args.port, args.unix_socket)
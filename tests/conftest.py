@@ -0,0 +1,60 @@
+# Import standard modules
+import os
+import sys
+
+# Import third-party modules
+import pytest
+
+# The modules of the tagger are top-level scripts of the repository root
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# Import custom modules
+from Tokenizer import Tokenizer
+from HMMCounts import HMMCounts
+from HMMProbGenerator import HMMProbGenerator, OOV_MODEL_SUFFIX, OOV_MODEL_FLAT
+
+# Define constants
+PATH_TO_CORPUS = os.path.join(REPO_ROOT, 'sents.devt') # labelled sentences the test models are trained on
+NUM_TRAINING_LINES = 300 # number of sentences of the test models' training corpus
+NUM_TEST_LINES = 30 # number of held out sentences tagged by the tests
+
+#===========================================================================#
+# SHARED FIXTURES
+# Small models trained on the 1st sentences of sents.devt, and the
+# untagged sentences following them.
+#===========================================================================#
+# Labelled lines of the corpus, with their '\n'
+def read_corpus_lines():
+  with open(PATH_TO_CORPUS) as corpus_file:
+    return corpus_file.readlines()
+
+# Counts labelled lines, from <S> to <E> of every sentence
+def count_lines(lines):
+  return HMMCounts().add_word_postag_pairs(Tokenizer().iter_word_postag_pairs_from_training_file(lines))
+
+# Trains an HMMModel on labelled lines
+def train_model(lines, TRIGRAMS=False, OOV_MODEL=OOV_MODEL_SUFFIX):
+  return HMMProbGenerator(counts=count_lines(lines), TRIGRAMS=TRIGRAMS, OOV_MODEL=OOV_MODEL).generate_model()
+
+@pytest.fixture(scope='session')
+def training_lines():
+  return read_corpus_lines()[:NUM_TRAINING_LINES]
+
+# Held out sentences without their tags, e.g. 'The cow ate grass .'
+@pytest.fixture(scope='session')
+def test_sentences():
+  lines = read_corpus_lines()[NUM_TRAINING_LINES:NUM_TRAINING_LINES + NUM_TEST_LINES]
+  return [' '.join(word_postag.rsplit('/', 1)[0] for word_postag in line.split()) for line in lines]
+
+@pytest.fixture(scope='session')
+def suffix_model(training_lines):
+  return train_model(training_lines)
+
+@pytest.fixture(scope='session')
+def flat_model(training_lines):
+  return train_model(training_lines, OOV_MODEL=OOV_MODEL_FLAT)
+
+@pytest.fixture(scope='session')
+def trigram_model(training_lines):
+  return train_model(training_lines, TRIGRAMS=True)
@@ -0,0 +1,114 @@
+# Import standard modules
+import pickle
+
+# Import third-party modules
+import pytest
+
+# Import custom modules
+from conftest import count_lines
+from HMMCounts import HMMCounts, COUNTS_FILE_VERSION
+from cross_validator import CrossValidator
+from PennTreebankPOSTags import START_MARKER, END_MARKER
+
+#===========================================================================#
+# COUNT ALGEBRA
+# Sums & differences of HMMCounts against counting the corpus from scratch.
+#===========================================================================#
+NUM_FIRST_LINES = 120 # number of training lines of the 1st part of the corpus
+NUM_VALIDATED_LINES = 60 # number of training lines cross validated with 3 folds
+
+def test_sum_holds_the_counts_of_both_parts(training_lines):
+  first_counts = count_lines(training_lines[:NUM_FIRST_LINES])
+  second_counts = count_lines(training_lines[NUM_FIRST_LINES:])
+  counts = first_counts + second_counts
+  all_counts = count_lines(training_lines)
+
+  assert counts.WORD_POSTAG_COUNTS == all_counts.WORD_POSTAG_COUNTS
+  assert counts.POSTAG_COUNTS == all_counts.POSTAG_COUNTS
+  assert counts.get_word_vocabulary_with_counts() == all_counts.get_word_vocabulary_with_counts()
+
+  # A sum doesn't link the parts, so only the <E> <S> bigram between them is missing
+  counts.add_postag_bigram(END_MARKER, START_MARKER)
+  assert counts.POSTAG_BIGRAM_COUNTS == all_counts.POSTAG_BIGRAM_COUNTS
+
+def test_difference_undoes_the_sum(training_lines):
+  first_counts = count_lines(training_lines[:NUM_FIRST_LINES])
+  second_counts = count_lines(training_lines[NUM_FIRST_LINES:])
+  assert (first_counts + second_counts) - second_counts == first_counts
+
+  # The 1st & last tags of a difference are those of the left operand
+  counts = (first_counts + second_counts) - first_counts
+  assert counts.WORD_POSTAG_COUNTS == second_counts.WORD_POSTAG_COUNTS
+  assert counts.POSTAG_COUNTS == second_counts.POSTAG_COUNTS
+  assert counts.POSTAG_BIGRAM_COUNTS == second_counts.POSTAG_BIGRAM_COUNTS
+  assert counts.POSTAG_TRIGRAM_COUNTS == second_counts.POSTAG_TRIGRAM_COUNTS
+
+def test_difference_drops_the_words_of_the_subtracted_part(training_lines):
+  first_counts = count_lines(training_lines[:NUM_FIRST_LINES])
+  second_counts = count_lines(training_lines[NUM_FIRST_LINES:])
+  counts = (first_counts + second_counts) - second_counts
+
+  vocabulary = counts.get_word_vocabulary_with_counts()
+  assert vocabulary == first_counts.get_word_vocabulary_with_counts()
+  assert all(count > 0 for count in vocabulary.values())
+  assert all(count > 0 for word_counts in counts.WORD_POSTAG_COUNTS.values() for count in word_counts.values())
+  assert all(count > 0 for postag_counts in counts.POSTAG_BIGRAM_COUNTS.values() for count in postag_counts.values())
+
+def test_algebra_leaves_its_operands_unchanged(training_lines):
+  first_counts = count_lines(training_lines[:NUM_FIRST_LINES])
+  second_counts = count_lines(training_lines[NUM_FIRST_LINES:])
+  (first_counts + second_counts) - second_counts
+  assert first_counts == count_lines(training_lines[:NUM_FIRST_LINES])
+  assert second_counts == count_lines(training_lines[NUM_FIRST_LINES:])
+
+# Training split of a fold counted from scratch: the sentences after the
+# held-out fold, wrapping around to the start of the corpus, as 1 sequence
+def count_training_split(validator, fold):
+  fold_start = validator.SENTENCE_OFFSETS[fold * validator.ONE_FOLD_SIZE]
+  fold_end = validator.SENTENCE_OFFSETS[(fold + 1) * validator.ONE_FOLD_SIZE]
+  pairs = validator.WORD_POSTAG_PAIRS[fold_end:] + validator.WORD_POSTAG_PAIRS[:fold_start]
+  return HMMCounts().add_word_postag_pairs([[START_MARKER, START_MARKER]] + pairs + [[END_MARKER, END_MARKER]])
+
+def test_cross_validation_splits_match_counting_from_scratch(tmp_path, training_lines):
+  path = str(tmp_path / 'sents.train')
+  with open(path, 'w') as train_file:
+    train_file.writelines(training_lines[:NUM_VALIDATED_LINES])
+  validator = CrossValidator(path, FOLDS=3)
+  validator.validate()
+
+  for fold in range(3):
+    counts = validator.get_training_counts(fold)
+    expected_counts = count_training_split(validator, fold)
+    assert counts.WORD_POSTAG_COUNTS == expected_counts.WORD_POSTAG_COUNTS
+    assert counts.POSTAG_COUNTS == expected_counts.POSTAG_COUNTS
+    assert counts.POSTAG_BIGRAM_COUNTS == expected_counts.POSTAG_BIGRAM_COUNTS
+    assert counts.POSTAG_TRIGRAM_COUNTS == expected_counts.POSTAG_TRIGRAM_COUNTS
+
+#===========================================================================#
+# APPENDED COUNTS & COUNT FILES
+#===========================================================================#
+@pytest.mark.parametrize('split_lines', [[120], [1, 2], [50, 51, 200], [299]])
+def test_appending_the_parts_gives_the_counts_of_the_whole_corpus(training_lines, split_lines):
+  boundaries = [0] + split_lines + [len(training_lines)]
+  counts = HMMCounts()
+  for i in range(len(boundaries) - 1):
+    counts.append(count_lines(training_lines[boundaries[i]:boundaries[i + 1]]))
+  assert counts == count_lines(training_lines)
+
+def test_appending_empty_counts_changes_nothing(training_lines):
+  counts = count_lines(training_lines)
+  assert count_lines(training_lines).append(HMMCounts()) == counts
+  assert HMMCounts().append(count_lines(training_lines)) == counts
+
+def test_count_file_round_trip(tmp_path, training_lines):
+  path = str(tmp_path / 'sents.train.counts')
+  counts = count_lines(training_lines)
+  counts.save(path)
+  assert HMMCounts.load(path) == counts
+
+def test_rejects_count_files_of_other_versions(tmp_path):
+  path = str(tmp_path / 'sents.train.counts')
+  with open(path, 'wb') as counts_file:
+    pickle.dump({ 'VERSION': COUNTS_FILE_VERSION + 1 }, counts_file)
+  with pytest.raises(ValueError, match='Unsupported count file version'):
+    HMMCounts.load(path)
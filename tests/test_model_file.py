@@ -0,0 +1,152 @@
+# Import third-party modules
+import numpy as np
+import pytest
+
+# Import custom modules
+from conftest import train_model
+from HMMProbGenerator import OOV_MODEL_FLAT
+from HMMModel import PRECISION_FLOAT64, PRECISION_FLOAT32, PRECISION_INT16, LOGPROB_DTYPES, LOG_PROB_FLOOR
+from HMMModelFile import HMMModelFile, MODEL_FORMAT_AUTO, MODEL_FORMAT_BINARY, MODEL_FORMAT_PICKLE, MAGIC, \
+                         MAGIC_AND_VERSION, HEADERS, VERSION, TRIGRAM_VERSION, SUFFIX_TRIE_VERSION, QUANTIZED_VERSION, \
+                         EMISSION_COLUMNS_VERSION
+
+#===========================================================================#
+# BINARY MODEL FILE
+# Round trips of every version of the binary format & of the pickle format.
+#===========================================================================#
+# Binary format version of a model, and the training arguments of the model
+MODELS_BY_VERSION = [
+  (VERSION, { 'OOV_MODEL': OOV_MODEL_FLAT }),
+  (TRIGRAM_VERSION, { 'OOV_MODEL': OOV_MODEL_FLAT, 'TRIGRAMS': True }),
+  (SUFFIX_TRIE_VERSION, {}),
+  (SUFFIX_TRIE_VERSION, { 'TRIGRAMS': True }),
+]
+
+# Version of a binary model file, from its header
+def read_version(path):
+  with open(path, 'rb') as model_file:
+    return MAGIC_AND_VERSION.unpack(model_file.read(MAGIC_AND_VERSION.size))[1]
+
+# Checks that 2 models hold the same tables & log probabilities
+def assert_same_model(model, other_model):
+  assert other_model.TAGS == model.TAGS
+  assert other_model.WORDS == model.WORDS
+  assert other_model.PRECISION == model.PRECISION
+  assert other_model.get_fingerprint() == model.get_fingerprint()
+  assert other_model.NUM_ID == model.NUM_ID
+  np.testing.assert_array_equal(other_model.build_token_emission_columns(), model.build_token_emission_columns())
+
+@pytest.mark.parametrize('version, training_args', MODELS_BY_VERSION)
+def test_binary_round_trip(tmp_path, training_lines, version, training_args):
+  model = train_model(training_lines, **training_args)
+  path = str(tmp_path / 'model_file')
+  HMMModelFile(path).save(model, MODEL_FORMAT_BINARY)
+  assert read_version(path) == version
+
+  loaded_model = HMMModelFile(path).load()
+  assert_same_model(model, loaded_model)
+  assert (loaded_model.TRIGRAM_TRANSITIONS is None) == ('TRIGRAMS' not in training_args)
+  assert (loaded_model.SUFFIX_EMISSIONS is None) == (version < SUFFIX_TRIE_VERSION)
+
+  # Arrays are read-only views into the mapped file
+  assert not loaded_model.EMISSION_LOGPROBS.flags.writeable
+  assert not loaded_model.TRANSITIONS.flags.writeable
+
+@pytest.mark.parametrize('version, training_args', MODELS_BY_VERSION)
+def test_resaving_a_loaded_model_writes_the_same_bytes(tmp_path, training_lines, version, training_args):
+  path = str(tmp_path / 'model_file')
+  resaved_path = str(tmp_path / 'resaved_model_file')
+  HMMModelFile(path).save(train_model(training_lines, **training_args), MODEL_FORMAT_BINARY)
+  HMMModelFile(resaved_path).save(HMMModelFile(path).load(), MODEL_FORMAT_BINARY)
+  with open(path, 'rb') as model_file, open(resaved_path, 'rb') as resaved_model_file:
+    assert resaved_model_file.read() == model_file.read()
+
+def test_pickle_round_trip(tmp_path, suffix_model):
+  path = str(tmp_path / 'model_file')
+  HMMModelFile(path).save(suffix_model, MODEL_FORMAT_PICKLE)
+  assert not HMMModelFile(path).is_binary()
+  assert_same_model(suffix_model, HMMModelFile(path).load(MODEL_FORMAT_AUTO))
+
+def test_format_is_sniffed(tmp_path, flat_model):
+  path = str(tmp_path / 'model_file')
+  HMMModelFile(path).save(flat_model, MODEL_FORMAT_BINARY)
+  assert HMMModelFile(path).is_binary()
+  assert_same_model(flat_model, HMMModelFile(path).load(MODEL_FORMAT_AUTO))
+
+def test_rejects_files_of_other_formats(tmp_path):
+  path = str(tmp_path / 'model_file')
+  with open(path, 'wb') as model_file:
+    model_file.write(b'NOTAMODEL' * 8)
+  with pytest.raises(ValueError, match='Not a binary model file'):
+    HMMModelFile(path).load(MODEL_FORMAT_BINARY)
+
+  with open(path, 'wb') as model_file:
+    model_file.write(MAGIC_AND_VERSION.pack(MAGIC, 99) + b'\0' * 64)
+  with pytest.raises(ValueError, match='Unsupported binary model file version 99'):
+    HMMModelFile(path).load(MODEL_FORMAT_BINARY)
+
+def test_rejects_truncated_files(tmp_path, flat_model):
+  path = str(tmp_path / 'model_file')
+  HMMModelFile(path).save(flat_model, MODEL_FORMAT_BINARY)
+  with open(path, 'rb') as model_file:
+    partial_header = model_file.read(HEADERS[VERSION].size - 1)
+  with open(path, 'wb') as model_file:
+    model_file.write(partial_header)
+  with pytest.raises(ValueError, match='Truncated binary model file'):
+    HMMModelFile(path).load(MODEL_FORMAT_BINARY)
+
+#===========================================================================#
+# QUANTIZED LOG PROBABILITIES
+#===========================================================================#
+@pytest.mark.parametrize('precision', [PRECISION_FLOAT32, PRECISION_INT16])
+def test_quantized_round_trip(tmp_path, suffix_model, precision):
+  model = suffix_model.quantize(precision)
+  path = str(tmp_path / 'model_file')
+  HMMModelFile(path).save(model, MODEL_FORMAT_BINARY)
+  assert read_version(path) == QUANTIZED_VERSION
+
+  loaded_model = HMMModelFile(path).load()
+  assert_same_model(model, loaded_model)
+  assert loaded_model.LOGPROB_SCALE == model.LOGPROB_SCALE
+  assert loaded_model.EMISSION_LOGPROBS.dtype == LOGPROB_DTYPES[precision]
+  assert loaded_model.build_token_emission_columns().dtype == np.float32
+
+# Every log probability above LOG_PROB_FLOOR is within half an int16 step of its float64 value
+def test_int16_quantization_error_is_within_half_a_step(suffix_model):
+  model = suffix_model.quantize(PRECISION_INT16)
+  columns = suffix_model.build_token_emission_columns()
+  above_floor = columns > LOG_PROB_FLOOR
+  error = np.abs(model.build_token_emission_columns().astype(np.float64) - columns)[above_floor]
+  assert error.max() <= model.LOGPROB_SCALE / 2 + np.finfo(np.float32).eps * np.abs(columns[above_floor]).max()
+  above_floor = suffix_model.TRANSITIONS > LOG_PROB_FLOOR
+  assert np.abs(model.TRANSITIONS - suffix_model.TRANSITIONS)[above_floor].max() <= model.LOGPROB_SCALE / 2 + 1e-12
+  assert np.all(model.TRANSITIONS[~above_floor] == LOG_PROB_FLOOR)
+
+def test_float64_quantization_writes_the_same_bytes(tmp_path, suffix_model):
+  path = str(tmp_path / 'model_file')
+  quantized_path = str(tmp_path / 'quantized_model_file')
+  HMMModelFile(path).save(suffix_model, MODEL_FORMAT_BINARY)
+  HMMModelFile(quantized_path).save(suffix_model.quantize(PRECISION_FLOAT64), MODEL_FORMAT_BINARY)
+  with open(path, 'rb') as model_file, open(quantized_path, 'rb') as quantized_model_file:
+    assert quantized_model_file.read() == model_file.read()
+
+#===========================================================================#
+# DENSE EMISSION ARRAY
+#===========================================================================#
+@pytest.mark.parametrize('precision', [PRECISION_FLOAT64, PRECISION_INT16])
+def test_emission_columns_round_trip(tmp_path, suffix_model, precision):
+  model = suffix_model.quantize(precision)
+  path = str(tmp_path / 'model_file')
+  HMMModelFile(path).save(model, MODEL_FORMAT_BINARY, EMISSION_COLUMNS=True)
+  assert read_version(path) == EMISSION_COLUMNS_VERSION
+
+  # The dense emission array is a read-only view into the mapped file, rather than built per process
+  loaded_model = HMMModelFile(path).load()
+  assert loaded_model.TOKEN_EMISSION_COLUMNS is not None
+  assert not loaded_model.TOKEN_EMISSION_COLUMNS.flags.writeable
+  assert loaded_model.TOKEN_EMISSION_COLUMNS.dtype == model.EMISSION_DTYPE
+  assert_same_model(model, loaded_model)
+
+def test_only_binary_files_store_emission_columns(tmp_path, suffix_model):
+  with pytest.raises(ValueError, match='Only binary model files'):
+    HMMModelFile(str(tmp_path / 'model_file')).save(suffix_model, MODEL_FORMAT_PICKLE, EMISSION_COLUMNS=True)
@@ -0,0 +1,55 @@
+# Import third-party modules
+import pytest
+
+# Import custom modules
+from POSTagModelTrainer import POSTagModelTrainer
+
+#===========================================================================#
+# PARALLEL COUNTING
+# Byte-range chunks of the training file & their counts, against counting
+# the file in 1 pass.
+#===========================================================================#
+NUM_LINES = 40 # number of training lines of the counted files
+CHUNK_SIZES = [1, 7, 64, 1000, 1 << 30] # chunk sizes from a byte to the whole file
+
+# Writes training lines to a file with the given newline & returns its path
+def write_training_file(tmp_path, lines, newline='\n', TRAILING_NEWLINE=True):
+  path = str(tmp_path / 'sents.train')
+  data = newline.join(line.rstrip('\n') for line in lines) + (newline if TRAILING_NEWLINE else '')
+  with open(path, 'wb') as train_file:
+    train_file.write(data.encode('utf-8'))
+  return path
+
+@pytest.mark.parametrize('CHUNK_SIZE', CHUNK_SIZES)
+@pytest.mark.parametrize('newline', ['\n', '\r\n'])
+def test_byte_ranges_split_the_file_at_line_starts(tmp_path, training_lines, CHUNK_SIZE, newline):
+  path = write_training_file(tmp_path, training_lines[:NUM_LINES], newline)
+  with open(path, 'rb') as train_file:
+    data = train_file.read()
+
+  byte_ranges = POSTagModelTrainer(path, WORKERS=2, CHUNK_SIZE=CHUNK_SIZE).get_byte_ranges()
+  assert byte_ranges[0][1] == 0
+  assert byte_ranges[-1][2] == len(data)
+  for i in range(len(byte_ranges)):
+    assert byte_ranges[i][0] == path
+    assert byte_ranges[i][1] < byte_ranges[i][2]
+    assert byte_ranges[i][1] == 0 or data[byte_ranges[i][1] - 1:byte_ranges[i][1]] == b'\n'
+    if i > 0:
+      assert byte_ranges[i][1] == byte_ranges[i - 1][2]
+
+  # 1 range per line once chunks are smaller than lines, and at most 1 per worker for a single chunk
+  if CHUNK_SIZE == 1:
+    assert len(byte_ranges) == NUM_LINES
+  if CHUNK_SIZE >= len(data):
+    assert len(byte_ranges) <= 2
+
+@pytest.mark.parametrize('CHUNK_SIZE', CHUNK_SIZES)
+@pytest.mark.parametrize('newline, TRAILING_NEWLINE', [('\n', True), ('\n', False), ('\r\n', True), ('\r\n', False)])
+def test_parallel_counts_match_counting_in_1_pass(tmp_path, training_lines, CHUNK_SIZE, newline, TRAILING_NEWLINE):
+  path = write_training_file(tmp_path, training_lines[:NUM_LINES], newline, TRAILING_NEWLINE)
+  counts = POSTagModelTrainer(path).count()
+  assert POSTagModelTrainer(path, WORKERS=2, CHUNK_SIZE=CHUNK_SIZE).count() == counts
+
+def test_parallel_counts_skip_blank_lines(tmp_path, training_lines):
+  path = write_training_file(tmp_path, training_lines[:5] + ['\n', '\n'] + training_lines[5:10])
+  assert POSTagModelTrainer(path, WORKERS=3, CHUNK_SIZE=16).count() == POSTagModelTrainer(path).count()
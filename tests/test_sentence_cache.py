@@ -0,0 +1,105 @@
+# Import standard modules
+import sqlite3
+from array import array
+
+# Import third-party modules
+import pytest
+
+# Import custom modules
+from test_viterbi_engines import with_markers, tag_with_engine
+from Tokenizer import Tokenizer
+from POSTagger import POSTagger, ENGINE_NUMPY
+from SentenceCache import SentenceCache
+
+#===========================================================================#
+# SENTENCE CACHE
+# LRU memory tier, sqlite disk tier & fingerprints of the cached sentences.
+#===========================================================================#
+FINGERPRINT = 'model engine' # fingerprint of the caches of the tests
+
+def test_least_recently_used_sentence_is_evicted():
+  cache = SentenceCache(2)
+  cache.put(array('i', [1, 2]), [0, 3])
+  cache.put(array('i', [1, 4]), [0, 5])
+  assert cache.get(array('i', [1, 2])) == [0, 3]
+  cache.put(array('i', [1, 6]), [0, 7])
+
+  assert cache.get(array('i', [1, 4])) is None
+  assert cache.get(array('i', [1, 2])) == [0, 3]
+  assert cache.get(array('i', [1, 6])) == [0, 7]
+  assert cache.get_stats() == { 'hits': 3, 'disk_hits': 0, 'misses': 1, 'hit_rate': 0.75 }
+
+def test_disk_tier_keeps_sentences_across_runs(tmp_path):
+  path = str(tmp_path / 'sents.cache')
+  cache = SentenceCache(1, path, FINGERPRINT)
+  cache.put(array('i', [1, 2]), [0, 3])
+  cache.put(array('i', [1, 4]), [0, 5])
+  cache.flush()
+
+  cache = SentenceCache(1, path, FINGERPRINT)
+  assert cache.get(array('i', [1, 2])) == [0, 3]
+  assert cache.get(array('i', [1, 4])) == [0, 5]
+  assert cache.get_stats()['disk_hits'] == 2
+
+def test_disk_tier_of_another_fingerprint_is_cleared(tmp_path):
+  path = str(tmp_path / 'sents.cache')
+  cache = SentenceCache(1, path, FINGERPRINT)
+  cache.put(array('i', [1, 2]), [0, 3])
+  cache.flush()
+
+  assert SentenceCache(1, path, FINGERPRINT + ' other').get(array('i', [1, 2])) is None
+  assert SentenceCache(1, path, FINGERPRINT).get(array('i', [1, 2])) is None
+
+def test_rejects_empty_caches():
+  with pytest.raises(ValueError):
+    SentenceCache(0)
+
+#===========================================================================#
+# TOKEN ID KEYS
+#===========================================================================#
+# Tags sentences with a cached POSTagger & returns the tags with the cache's stats
+def tag_cached(model, sentences, PATH_TO_CACHE=None):
+  tagger = POSTagger(None, None, model=model, VALIDATE_MODE=True, ENGINE=ENGINE_NUMPY,
+                     CACHE_SIZE=len(sentences), PATH_TO_CACHE=PATH_TO_CACHE)
+  return (tagger.get_best_postags(with_markers(sentences)), tagger.SENTENCE_CACHE.get_stats())
+
+def test_disk_tier_keyed_by_tokens_is_cleared(tmp_path):
+  path = str(tmp_path / 'sents.cache')
+  connection = sqlite3.connect(path)
+  connection.execute('CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT)')
+  connection.execute('CREATE TABLE sentences (tokens BLOB PRIMARY KEY, postags BLOB)')
+  connection.execute("INSERT INTO meta VALUES ('fingerprint', ?)", (FINGERPRINT,))
+  connection.execute('INSERT INTO sentences VALUES (?, ?)',
+                     (array('i', [1, 2]).tobytes(), array('i', [0, 3]).tobytes()))
+  connection.commit()
+  connection.close()
+
+  assert SentenceCache(1, path, FINGERPRINT).get(array('i', [1, 2])) is None
+
+# Number of distinct token id sequences of sentences, i.e. of cache entries
+def count_distinct_token_ids(model, sentences):
+  tokenizer = Tokenizer()
+  list_of_token_ids = [tokenizer.tokenize_test_document_to_ids(sentence, model) for sentence in with_markers(sentences)]
+  return len(set(token_ids.tobytes() for token_ids in list_of_token_ids))
+
+def test_cached_tagging_matches_uncached_tagging(tmp_path, suffix_model, test_sentences):
+  path = str(tmp_path / 'sents.cache')
+  NUM_ENTRIES = count_distinct_token_ids(suffix_model, test_sentences)
+  postags_list = tag_with_engine(suffix_model, test_sentences, ENGINE_NUMPY)
+  cached_postags_list, stats = tag_cached(suffix_model, test_sentences + test_sentences, path)
+  assert cached_postags_list == postags_list + postags_list
+  assert stats['misses'] == NUM_ENTRIES and stats['hits'] == 2 * len(test_sentences) - NUM_ENTRIES
+
+  # A new run finds every sentence on disk
+  cached_postags_list, stats = tag_cached(suffix_model, test_sentences, path)
+  assert cached_postags_list == postags_list
+  assert stats['disk_hits'] == NUM_ENTRIES and stats['misses'] == 0
+
+def test_sentences_with_the_same_token_ids_share_an_entry(suffix_model):
+  # Numerics all take the <NUM> token id, so these sentences are tagged once
+  sentences = ['Sales rose 5 % .', 'Sales rose 12.5 % .', 'Sales rose 3,000 % .']
+  assert count_distinct_token_ids(suffix_model, sentences) == 1
+
+  postags_list, stats = tag_cached(suffix_model, sentences)
+  assert postags_list[0] == postags_list[1] == postags_list[2]
+  assert stats['hits'] == 2 and stats['misses'] == 1
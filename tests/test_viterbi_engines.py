@@ -0,0 +1,184 @@
+# Import standard modules
+import math
+import itertools
+
+# Import third-party modules
+import numpy as np
+import pytest
+
+# Import custom modules
+from Tokenizer import Tokenizer
+from POSTagger import POSTagger, ENGINE_PYTHON, ENGINE_NUMPY, ENGINE_CONSTRAINED
+from ConstrainedViterbi import UNK_TAGS_ALL, UNK_TAGS_OPEN_CLASS
+from TrigramViterbi import TrigramViterbi
+from NumpyViterbi import NumpyViterbi
+from ForwardBackward import ForwardBackward
+from HMMModel import LOG_PROB_FLOOR
+from PennTreebankPOSTags import END_MARKER, OPEN_CLASS_TAGS
+
+#===========================================================================#
+# VITERBI ENGINES
+# Paths of every engine against the numpy engine, on held out sentences.
+#===========================================================================#
+NUM_PYTHON_SENTENCES = 10 # number of sentences tagged by the slow pure-Python engine
+
+# Sentences as tagged by POSTagger, e.g. '<S> The cow ate grass . <E>'
+def with_markers(sentences):
+  return Tokenizer().generate_sentences_from_test_document('\n'.join(sentences))
+
+# Best POS tag id paths of sentences, tagged by a POSTagger with the given engine & options
+def tag_with_engine(model, sentences, ENGINE, **options):
+  tagger = POSTagger(None, None, model=model, VALIDATE_MODE=True, ENGINE=ENGINE, **options)
+  return tagger.get_best_postags(with_markers(sentences))
+
+@pytest.mark.parametrize('model_name', ['suffix_model', 'flat_model'])
+def test_numpy_engine_matches_python_loop(request, test_sentences, model_name):
+  model = request.getfixturevalue(model_name)
+  sentences = test_sentences[:NUM_PYTHON_SENTENCES]
+  paths = tag_with_engine(model, sentences, ENGINE_NUMPY)
+  assert len(paths) == len(sentences)
+  assert all(path[-1] == model.TAG_TO_ID[END_MARKER] for path in paths)
+  assert paths == tag_with_engine(model, sentences, ENGINE_PYTHON)
+
+@pytest.mark.parametrize('BATCH_SIZE, BUCKET_WIDTH', [(2, 1), (8, 4), (64, 100)])
+def test_batched_numpy_engine_matches_unbatched(suffix_model, test_sentences, BATCH_SIZE, BUCKET_WIDTH):
+  paths = tag_with_engine(suffix_model, test_sentences, ENGINE_NUMPY)
+  assert tag_with_engine(suffix_model, test_sentences, ENGINE_NUMPY,
+                         BATCH_SIZE=BATCH_SIZE, BUCKET_WIDTH=BUCKET_WIDTH) == paths
+
+# Whether a path takes a 0 probability bigram, i.e. a transition of LOG_PROB_FLOOR
+def has_zero_probability_bigram(model, path):
+  return any(model.TRANSITIONS[path[i - 1], path[i]] <= LOG_PROB_FLOOR for i in range(2, len(path)))
+
+# The engines only differ where every path through the seen tags of the words
+# takes a 0 probability bigram, which the small test models have
+@pytest.mark.parametrize('model_name', ['suffix_model', 'flat_model'])
+def test_constrained_engine_with_every_unk_tag_matches_numpy_engine(request, test_sentences, model_name):
+  model = request.getfixturevalue(model_name)
+  paths = tag_with_engine(model, test_sentences, ENGINE_CONSTRAINED, UNK_TAGS=UNK_TAGS_ALL)
+  numpy_paths = tag_with_engine(model, test_sentences, ENGINE_NUMPY)
+  for path, numpy_path in zip(paths, numpy_paths):
+    assert path == numpy_path or has_zero_probability_bigram(model, path)
+  assert sum(path == numpy_path for path, numpy_path in zip(paths, numpy_paths)) > len(paths) // 2
+
+def test_constrained_engine_only_gives_seen_or_open_class_tags(suffix_model, test_sentences):
+  open_class_tag_ids = set(suffix_model.TAG_TO_ID[tag] for tag in OPEN_CLASS_TAGS)
+  paths = tag_with_engine(suffix_model, test_sentences, ENGINE_CONSTRAINED, UNK_TAGS=UNK_TAGS_OPEN_CLASS)
+  for sentence, path in zip(with_markers(test_sentences), paths):
+    token_ids = Tokenizer().tokenize_test_document_to_ids(sentence, suffix_model)
+    for token_id, tag_id in zip(token_ids[1:-1], path[1:-1]):
+      if suffix_model.is_unseen_token_id(token_id):
+        assert tag_id in open_class_tag_ids
+      else:
+        start, end = suffix_model.EMISSION_PTR[token_id], suffix_model.EMISSION_PTR[token_id + 1]
+        assert tag_id in suffix_model.EMISSION_TAG_IDS[start:end]
+
+#===========================================================================#
+# TRIGRAM ENGINE
+#===========================================================================#
+# Short sentences with unseen words, whose every tagging is scored by the exhaustive search
+TRIGRAM_SENTENCES = [
+  'The company said it expects a loss .',
+  'Mr. Blorfington resigned yesterday .',
+  'Zyx Corp. sold Blorfs for 12 million .',
+  'The plant will be closed .',
+]
+MAX_TAGGINGS = 100000 # number of taggings of a sentence above which the exhaustive search is too slow
+
+# Log probability of a tagging of every token under the second-order HMM,
+# starting in the (<E>, <S>) state like TrigramViterbi
+def get_trigram_score(viterbi, token_ids, tag_ids):
+  score = 0.0
+  prev_tag_ids = [viterbi.END_TAG_ID, viterbi.START_TAG_ID]
+  for i in range(1, len(token_ids)):
+    token_tag_ids, emissions = viterbi.get_token_tags(token_ids[i])
+    score += viterbi.TRIGRAM_TRANSITIONS[prev_tag_ids[0]][prev_tag_ids[1]][tag_ids[i]]
+    score += emissions[token_tag_ids.index(tag_ids[i])]
+    prev_tag_ids = [prev_tag_ids[1], tag_ids[i]]
+  return score
+
+# Best score of every tagging through the allowed tags of each token
+def get_exhaustive_best_score(viterbi, token_ids):
+  allowed_tag_ids = [[viterbi.START_TAG_ID]] + [viterbi.get_token_tags(token_id)[0] for token_id in token_ids[1:]]
+  assert math.prod(len(tag_ids) for tag_ids in allowed_tag_ids) <= MAX_TAGGINGS
+  return max(get_trigram_score(viterbi, token_ids, tag_ids) for tag_ids in itertools.product(*allowed_tag_ids))
+
+# Score of the best path of an engine, with the <E> tag of the last token
+def get_best_path_score(viterbi, token_ids):
+  path = viterbi.get_best_path(token_ids) + [viterbi.END_TAG_ID]
+  assert len(path) == len(token_ids)
+  return get_trigram_score(viterbi, token_ids, path)
+
+@pytest.mark.parametrize('sentence', TRIGRAM_SENTENCES)
+def test_unpruned_trigram_engine_finds_the_best_tagging(trigram_model, sentence):
+  viterbi = TrigramViterbi(trigram_model, UNK_TAGS_OPEN_CLASS, BEAM=None)
+  token_ids = Tokenizer().tokenize_test_document_to_ids(with_markers([sentence])[0], trigram_model)
+  assert get_best_path_score(viterbi, token_ids) == pytest.approx(get_exhaustive_best_score(viterbi, token_ids))
+
+@pytest.mark.parametrize('sentence', TRIGRAM_SENTENCES)
+def test_beam_pruning_never_beats_the_unpruned_engine(trigram_model, sentence):
+  unpruned_viterbi = TrigramViterbi(trigram_model, UNK_TAGS_OPEN_CLASS, BEAM=None)
+  viterbi = TrigramViterbi(trigram_model, UNK_TAGS_OPEN_CLASS, BEAM=1.0)
+  token_ids = Tokenizer().tokenize_test_document_to_ids(with_markers([sentence])[0], trigram_model)
+  assert get_best_path_score(viterbi, token_ids) <= get_best_path_score(unpruned_viterbi, token_ids) + 1e-9
+
+def test_trigram_engine_requires_trigram_transitions(suffix_model):
+  with pytest.raises(ValueError, match='no trigram transitions'):
+    TrigramViterbi(suffix_model)
+
+#===========================================================================#
+# K-BEST PATHS & CONFIDENCES
+#===========================================================================#
+K = 5 # number of best paths per sentence
+SHORT_SENTENCE = 'Profits fell' # sentence of 2 words, whose every tagging is scored
+
+# Log scores of every tagging of the tokens after '<S>' of a sentence, as a
+# (tags x ... x tags) array, where the '<S>' node takes the score of START_SCORES
+def get_every_tagging_score(model, token_ids, START_SCORES):
+  emission_columns = model.build_token_emission_columns()[np.asarray(token_ids)]
+  scores = START_SCORES + emission_columns[1]
+  for i in range(2, len(token_ids)):
+    scores = scores[..., None] + model.TRANSITIONS + emission_columns[i]
+  return scores
+
+def test_first_of_k_best_paths_is_the_best_path(suffix_model, test_sentences):
+  sentences = with_markers(test_sentences)
+  list_of_token_ids = [Tokenizer().tokenize_test_document_to_ids(sentence, suffix_model) for sentence in sentences]
+  best_paths = NumpyViterbi(suffix_model).get_best_paths_batch(list_of_token_ids)
+  k_best_paths = NumpyViterbi(suffix_model).get_k_best_paths_batch(list_of_token_ids, K)
+  for best_path, paths_with_scores in zip(best_paths, k_best_paths):
+    assert paths_with_scores[0][0] == best_path
+    assert len(paths_with_scores) == K
+    assert len(set(tuple(path) for path, score in paths_with_scores)) == K
+    scores = [score for path, score in paths_with_scores]
+    assert scores == sorted(scores, reverse=True)
+
+def test_k_best_paths_match_an_exhaustive_search(suffix_model):
+  token_ids = Tokenizer().tokenize_test_document_to_ids(with_markers([SHORT_SENTENCE])[0], suffix_model)
+  assert len(token_ids) == 4
+
+  # Paths cover every token but the last one, so each keeps its best last tag
+  scores = get_every_tagging_score(suffix_model, token_ids, suffix_model.TRANSITIONS.max(axis=0)).max(axis=2)
+  best_ends = np.argsort(-scores.ravel(), kind='stable')[:K]
+  expected_paths = [[0] + list(np.unravel_index(end, scores.shape)) for end in best_ends]
+
+  paths_with_scores = NumpyViterbi(suffix_model).get_k_best_paths(token_ids, K)
+  assert [path for path, score in paths_with_scores] == expected_paths
+  assert [score for path, score in paths_with_scores] == pytest.approx(scores.ravel()[best_ends].tolist())
+
+def test_posteriors_and_path_probabilities_match_an_exhaustive_sum(suffix_model):
+  token_ids = Tokenizer().tokenize_test_document_to_ids(with_markers([SHORT_SENTENCE])[0], suffix_model)
+  forward_backward = ForwardBackward(suffix_model)
+  posteriors, log_total = forward_backward.get_posteriors(token_ids)
+  np.testing.assert_allclose(posteriors.sum(axis=1), 1.0)
+
+  scores = get_every_tagging_score(suffix_model, token_ids, np.logaddexp.reduce(suffix_model.TRANSITIONS, axis=0))
+  assert log_total == pytest.approx(np.logaddexp.reduce(scores.ravel()))
+  np.testing.assert_allclose(posteriors[1], np.exp(np.logaddexp.reduce(scores, axis=(1, 2)) - log_total), atol=1e-9)
+
+  # Probabilities of the k best paths, whose last tag is always <E>
+  paths_with_scores = NumpyViterbi(suffix_model).get_k_best_paths(token_ids, K)
+  log_probs = forward_backward.get_path_log_probs(paths_with_scores, log_total)
+  END_TAG_ID = suffix_model.TAG_TO_ID[END_MARKER]
+  expected_log_probs = [scores[path[1], path[2], END_TAG_ID] - log_total for path, score in paths_with_scores]
+  assert log_probs == pytest.approx(expected_log_probs)